@@ -0,0 +1,276 @@
+import click
+import os
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import and_, case, delete, func, insert, select, union_all
+from config import app, db
+from models import (User, WorkoutClass, ClassRSVP, Attendance, ClassSeries, ClassDayStat, SeriesRegular, SeriesAttendance,
+                    StatCounter)
+from dialects import date_of, supports_window_functions, upsert_insert
+
+# Trainer class analytics. Reading them never touches class_rsvps or
+# attendances: class_day_stats holds one row per past class (capacity,
+# booked, waitlisted, and how many booked members checked in that day) and
+# series_regulars the top attendees of each series. refresh_rollups builds
+# them a day at a time with grouped queries, so a trainer's history costs a
+# range scan of their own rollup rows however many years it spans. The
+# regulars are ranked on series_attendance, each member's count over the days
+# no refresh redoes any more, plus a recount of the days after it, so a
+# refresh reads the days it covers and not the series' whole history. Run
+# `flask refresh-analytics` once a day (cron): it picks up from the last day
+# refreshed and redoes ANALYTICS_LOOKBACK_DAYS before it for check-ins that
+# arrive late. Today's classes count from the day after.
+
+app.config.setdefault('ANALYTICS_LOOKBACK_DAYS', int(os.getenv('ANALYTICS_LOOKBACK_DAYS', 7)))
+# Days rebuilt per transaction when catching up on a long history
+app.config.setdefault('ANALYTICS_REFRESH_CHUNK_DAYS', int(os.getenv('ANALYTICS_REFRESH_CHUNK_DAYS', 31)))
+app.config.setdefault('ANALYTICS_REGULARS', int(os.getenv('ANALYTICS_REGULARS', 5)))
+app.config.setdefault('ANALYTICS_DEFAULT_WEEKS', int(os.getenv('ANALYTICS_DEFAULT_WEEKS', 12)))
+ANALYTICS_MAX_WEEKS = 520
+
+# stat_counters rows holding, as date ordinals, the last day refreshed and
+# the first day not yet counted in series_attendance
+REFRESHED_THROUGH = 'rollup:class_day_stats'
+SETTLED_BEFORE = 'rollup:series_attendance'
+
+
+def _attended_join():
+    # A booked member attended when they checked in on the day of the class;
+    # (user_id, date) is uq_attendances_user_id_date
+    return and_(Attendance.user_id == ClassRSVP.user_id, Attendance.date == date_of(WorkoutClass.date_time),
+                Attendance.attended.is_(True))
+
+
+def class_day_query(start, end):
+    """Per-class counts for the trainers' classes on days [start, end)."""
+    booked = ClassRSVP.attending.is_(True)
+    return (
+        select(WorkoutClass.id, WorkoutClass.trainer_id, WorkoutClass.series_id, WorkoutClass.date_time,
+               WorkoutClass.max_capacity,
+               func.count(case((booked, ClassRSVP.id))),
+               func.count(case((ClassRSVP.attending.is_(False), ClassRSVP.id))),
+               func.count(case((booked, Attendance.id))))
+        .outerjoin(ClassRSVP, ClassRSVP.class_id == WorkoutClass.id)
+        .outerjoin(Attendance, _attended_join())
+        .where(WorkoutClass.date_time >= datetime.combine(start, time()),
+               WorkoutClass.date_time < datetime.combine(end, time()),
+               WorkoutClass.trainer_id.isnot(None))
+        .group_by(WorkoutClass.id, WorkoutClass.trainer_id, WorkoutClass.series_id, WorkoutClass.date_time,
+                  WorkoutClass.max_capacity)
+    )
+
+
+def class_day_rows(start, end):
+    """class_day_stats rows for days [start, end)."""
+    for class_id, trainer_id, series_id, date_time, capacity, booked_count, waitlisted, attended in db.session.execute(
+            class_day_query(start, end)):
+        day = date_time.date()
+        yield {'class_id': class_id, 'trainer_id': trainer_id, 'series_id': series_id, 'day': day,
+               'week': day - timedelta(days=day.weekday()), 'capacity': capacity or 0,
+               'booked': booked_count, 'waitlisted': waitlisted, 'attended': attended}
+
+
+def _regular_counts(series_ids, start, end):
+    """Classes each member attended per series, over days [start, end); every series for None."""
+    attended = func.count(ClassRSVP.id).label('attended')
+    last_attended = func.max(Attendance.date).label('last_attended')
+    in_series = WorkoutClass.series_id.in_(series_ids) if series_ids is not None else WorkoutClass.series_id.isnot(None)
+    in_range = [WorkoutClass.date_time < datetime.combine(end, time())]
+    if start is not None:
+        in_range.append(WorkoutClass.date_time >= datetime.combine(start, time()))
+    return (
+        select(WorkoutClass.series_id, ClassRSVP.user_id, attended, last_attended)
+        .join(ClassRSVP, ClassRSVP.class_id == WorkoutClass.id)
+        .join(Attendance, _attended_join())
+        .where(in_series, ClassRSVP.attending.is_(True), *in_range)
+        .group_by(WorkoutClass.series_id, ClassRSVP.user_id)
+    )
+
+
+def series_regular_rows(series_ids, settled, end):
+    """series_regulars rows for series_ids, counting their classes before end:
+    series_attendance for the days before settled, a recount from there on."""
+    keep = app.config['ANALYTICS_REGULARS']
+    both = union_all(
+        select(SeriesAttendance.series_id, SeriesAttendance.user_id, SeriesAttendance.attended,
+               SeriesAttendance.last_attended).where(SeriesAttendance.series_id.in_(series_ids)),
+        _regular_counts(series_ids, settled, end)
+    ).subquery()
+    counts = (
+        select(both.c.series_id, both.c.user_id, func.sum(both.c.attended).label('attended'),
+               func.max(both.c.last_attended).label('last_attended'))
+        .group_by(both.c.series_id, both.c.user_id)
+    )
+    if supports_window_functions():
+        counts = counts.subquery()
+        rank = func.row_number().over(
+            partition_by=counts.c.series_id,
+            order_by=(counts.c.attended.desc(), counts.c.last_attended.desc(), counts.c.user_id)
+        ).label('rank')
+        ranked = select(counts, rank).subquery()
+        rows = db.session.execute(select(ranked).where(ranked.c.rank <= keep))
+        return [dict(row._mapping) for row in rows]
+    # Ranked here instead: every member of the series comes back
+    ranked = {}
+    for row in db.session.execute(counts):
+        ranked.setdefault(row.series_id, []).append(dict(row._mapping))
+    rows = []
+    for members in ranked.values():
+        members.sort(key=lambda m: (-m['attended'], -m['last_attended'].toordinal(), m['user_id']))
+        rows.extend({**member, 'rank': rank} for rank, member in enumerate(members[:keep], start=1))
+    return rows
+
+
+def _read_day(name):
+    ordinal = db.session.execute(select(StatCounter.value).where(StatCounter.name == name)).scalar()
+    return date.fromordinal(ordinal) if ordinal else None
+
+
+def _set_day(name, day):
+    db.session.execute(upsert_insert(StatCounter).on_conflict_do_nothing(index_elements=['name']),
+                       [{'name': name, 'value': 0}])
+    db.session.execute(StatCounter.__table__.update().where(StatCounter.name == name)
+                       .values(value=day.toordinal(), updated_at=datetime.utcnow()))
+
+
+def refreshed_through():
+    """The last day in the rollups, or None before the first refresh."""
+    return _read_day(REFRESHED_THROUGH)
+
+
+def settle(before):
+    """Count the days up to `before` into series_attendance; returns the first day not counted.
+
+    Picks up where the last call stopped. An earlier day than that (a
+    rebuild) counts every day before it again.
+    """
+    settled = _read_day(SETTLED_BEFORE)
+    if settled is not None and before <= settled:
+        if before == settled:
+            return settled
+        settled = None
+    if settled is None:
+        db.session.execute(delete(SeriesAttendance))
+    counts = db.session.execute(_regular_counts(None, settled, before)).all()
+    if counts:
+        statement = upsert_insert(SeriesAttendance)
+        # Settled days all come after the ones already counted
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['series_id', 'user_id'],
+            set_={'attended': SeriesAttendance.__table__.c.attended + statement.excluded.attended,
+                  'last_attended': statement.excluded.last_attended}
+        ), [dict(row._mapping) for row in counts])
+    _set_day(SETTLED_BEFORE, before)
+    return before
+
+
+def refresh_day_range(start, end):
+    """Rebuild the rollups for days [start, end) in one transaction; returns the class rows written."""
+    rows = list(class_day_rows(start, end))
+    # Classes deleted or moved since the last refresh leave the range too
+    db.session.execute(delete(ClassDayStat).where(ClassDayStat.day >= start, ClassDayStat.day < end))
+    if rows:
+        db.session.execute(insert(ClassDayStat), rows)
+    # Days the refresh after this one starts from, or this one's if earlier, stay open
+    settled = settle(min(start, end - timedelta(days=app.config['ANALYTICS_LOOKBACK_DAYS'])))
+    series_ids = sorted({row['series_id'] for row in rows if row['series_id'] is not None})
+    if series_ids:
+        db.session.execute(delete(SeriesRegular).where(SeriesRegular.series_id.in_(series_ids)))
+        regulars = series_regular_rows(series_ids, settled, end)
+        if regulars:
+            db.session.execute(insert(SeriesRegular), [
+                {'series_id': r['series_id'], 'user_id': r['user_id'], 'rank': r['rank'],
+                 'attended': r['attended'], 'last_attended': r['last_attended']} for r in regulars
+            ])
+    if start < end:
+        _set_day(REFRESHED_THROUGH, max(end - timedelta(days=1), refreshed_through() or date.min))
+    db.session.commit()
+    return len(rows)
+
+
+def refresh_rollups(start=None, end=None):
+    """Bring the rollups up to yesterday, ANALYTICS_REFRESH_CHUNK_DAYS per transaction.
+
+    By default from ANALYTICS_LOOKBACK_DAYS before the last day refreshed, or
+    from the first class when there is none. Returns {'days': n, 'classes': n}.
+    """
+    end = end or date.today()
+    if start is None:
+        last = refreshed_through()
+        if last is not None:
+            start = last + timedelta(days=1) - timedelta(days=app.config['ANALYTICS_LOOKBACK_DAYS'])
+        else:
+            first = db.session.execute(select(func.min(WorkoutClass.date_time))).scalar()
+            start = first.date() if first else end
+    chunk = timedelta(days=app.config['ANALYTICS_REFRESH_CHUNK_DAYS'])
+    totals = {'days': max((end - start).days, 0), 'classes': 0}
+    day = start
+    while day < end:
+        totals['classes'] += refresh_day_range(day, min(day + chunk, end))
+        day += chunk
+    return totals
+
+
+def _rates(capacity, booked, attended):
+    no_shows = booked - attended
+    return {
+        'capacity': capacity, 'booked': booked, 'attended': attended, 'no_shows': no_shows,
+        'fill_rate': round(booked / capacity, 3) if capacity else None,
+        'attendance_rate': round(attended / booked, 3) if booked else None,
+        'no_show_rate': round(no_shows / booked, 3) if booked else None,
+    }
+
+
+def trainer_analytics(session, trainer_id, weeks):
+    """Fill, attendance and no-show rates over the trainer's last `weeks` weeks
+    of classes, week by week and per series, with each series' regulars."""
+    through = refreshed_through()
+    since = (through or date.today()) - timedelta(weeks=weeks)
+    since -= timedelta(days=since.weekday())
+    in_range = (ClassDayStat.trainer_id == trainer_id, ClassDayStat.day >= since)
+    sums = (func.count(ClassDayStat.class_id), func.sum(ClassDayStat.capacity),
+            func.sum(ClassDayStat.booked), func.sum(ClassDayStat.attended))
+    weekly = [
+        {'week': week.isoformat(), 'classes': classes, **_rates(capacity or 0, booked or 0, attended or 0)}
+        for week, classes, capacity, booked, attended in session.execute(
+            select(ClassDayStat.week, *sums).where(*in_range).group_by(ClassDayStat.week).order_by(ClassDayStat.week)
+        )
+    ]
+    series = {
+        series_id: {'series_id': series_id, 'name': name, 'classes': classes,
+                    **_rates(capacity or 0, booked or 0, attended or 0), 'regulars': []}
+        for series_id, name, classes, capacity, booked, attended in session.execute(
+            select(ClassDayStat.series_id, ClassSeries.name, *sums)
+            .join(ClassSeries, ClassSeries.id == ClassDayStat.series_id)
+            .where(*in_range).group_by(ClassDayStat.series_id, ClassSeries.name).order_by(ClassDayStat.series_id)
+        )
+    }
+    if series:
+        for series_id, user_id, username, attended, last_attended in session.execute(
+                select(SeriesRegular.series_id, SeriesRegular.user_id, User.username, SeriesRegular.attended,
+                       SeriesRegular.last_attended)
+                .join(User, User.id == SeriesRegular.user_id)
+                .where(SeriesRegular.series_id.in_(list(series)))
+                .order_by(SeriesRegular.series_id, SeriesRegular.rank)):
+            series[series_id]['regulars'].append({'user_id': user_id, 'username': username, 'attended': attended,
+                                                  'last_attended': last_attended.isoformat()})
+    totals = {'classes': sum(week['classes'] for week in weekly),
+              **_rates(*(sum(week[key] for week in weekly) for key in ('capacity', 'booked', 'attended')))}
+    return {
+        'refreshed_through': through.isoformat() if through else None,
+        'since': since.isoformat(),
+        'totals': totals,
+        'weekly': weekly,
+        'series': list(series.values()),
+    }
+
+
+@app.cli.command('refresh-analytics')
+@click.option('--rebuild', is_flag=True, help='rebuild every day from the first class instead')
+def refresh_analytics_command(rebuild):
+    """Refresh the trainer analytics rollups up to yesterday."""
+    start = None
+    if rebuild:
+        first = db.session.execute(select(func.min(WorkoutClass.date_time))).scalar()
+        start = first.date() if first else date.today()
+    for name, value in refresh_rollups(start).items():
+        print(f'{name}: {value}')
@@ -2,16 +2,16 @@ from config import app
 from flask import jsonify
 import routes
 import logging
+from log_pipeline import setup_logging
+from subscriptions import start_expiry_scheduler
+from compression import install_compression
 
-# Configure logging for console and file
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s: %(message)s',
-    handlers=[
-        logging.FileHandler('backend.log'),
-        logging.StreamHandler()  # Log to console
-    ]
-)
+# JSON lines to stdout and LOG_FILE through a background queue (log_pipeline.py)
+setup_logging()
+# Ends lapsed memberships in the background when SUBSCRIPTION_EXPIRY_INTERVAL is set
+start_expiry_scheduler()
+# gzip/brotli for large responses, by Accept-Encoding (compression.py)
+install_compression()
 
 # Custom 404 handler
 @app.errorhandler(404)
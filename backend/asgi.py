@@ -0,0 +1,216 @@
+"""ASGI entry point: async read routes in front of the Flask app.
+
+Serve with  uvicorn asgi:app  (start.sh does when SERVER_MODE=async).
+
+The read-heavy GET routes below run as coroutines on an AsyncSession, so a
+worker keeps accepting requests while their queries wait on the database.
+They reuse the sync query code in queries.py through AsyncSession.run_sync,
+which drives it over the async connection without blocking the event loop.
+Each runs inside a Flask request context, through the app's own request
+hooks, auth and conditional decorators and error handlers, so the request
+id, Server-Timing, ETags, compression and CORS are the sync routes'. Every
+other request is handed to the Flask app unchanged, on a thread.
+"""
+import io
+import logging
+from datetime import datetime, date, timedelta
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from app import app as flask_app
+from async_db import async_session, engine
+from auth import async_jwt_required, role_required, denylist
+from routes import _page_args, _parse_arg
+from class_series import timetable
+from conditional import conditional
+from queries import (USER_DASHBOARD_TABLES, TRAINER_DASHBOARD_TABLES, CLASS_LIST_TABLES,
+                     page_payload, classes_page, schedule_filters, schedule_page, attendance_page, user_dashboard_data, trainer_dashboard_data)
+
+ROUTES = {}
+
+
+def route(path):
+    """Serve GET path with this coroutine view instead of the Flask route of the same path."""
+    def decorator(fn):
+        ROUTES[path] = fn
+        return fn
+    return decorator
+
+
+@route('/api/dashboard')
+@role_required('user')
+@conditional(*USER_DASHBOARD_TABLES, per_user=True, clock=True)
+async def dashboard():
+    try:
+        dashboard = await g.async_session.run_sync(user_dashboard_data, get_jwt_identity(), g.versions)
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(dashboard), 200
+    except Exception as e:
+        logging.error(f"Dashboard error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/api/trainer-dashboard')
+@role_required('trainer')
+@conditional(*TRAINER_DASHBOARD_TABLES, per_user=True)
+async def trainer_dashboard():
+    try:
+        dashboard = await g.async_session.run_sync(trainer_dashboard_data, get_jwt_identity())
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(dashboard), 200
+    except Exception as e:
+        logging.error(f"Trainer dashboard error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/api/attendance')
+@role_required('user')
+async def attendance():
+    try:
+        user_id = get_jwt_identity()
+        cursor, limit = _page_args()
+        start = _parse_arg('from', date.fromisoformat)
+        end = _parse_arg('to', date.fromisoformat)
+        attendances, next_cursor = await g.async_session.run_sync(
+            lambda session: attendance_page(session, user_id, cursor, limit, start=start, end=end)
+        )
+        return jsonify(page_payload(attendances, next_cursor)), 200
+    except ValueError as ve:
+        logging.info(f"Attendance query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Attendance error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/api/classes')
+@async_jwt_required
+@conditional(*CLASS_LIST_TABLES)
+async def classes():
+    try:
+        cursor, limit = _page_args()
+        trainer_id = _parse_arg('trainer_id', int)
+        start = _parse_arg('from', datetime.fromisoformat)
+        end = _parse_arg('to', datetime.fromisoformat)
+        classes, next_cursor = await g.async_session.run_sync(
+            lambda session: classes_page(session, cursor, limit, trainer_id=trainer_id, start=start, end=end)
+        )
+        return jsonify(page_payload(classes, next_cursor)), 200
+    except ValueError as ve:
+        logging.info(f"Class query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Class error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/api/classes/search')
+@async_jwt_required
+async def search_classes():
+    try:
+        cursor, limit = _page_args()
+        filters = schedule_filters(request.args)
+        classes, next_cursor = await g.async_session.run_sync(
+            lambda session: schedule_page(session, cursor, limit, **filters)
+        )
+        return jsonify(page_payload(classes, next_cursor)), 200
+    except ValueError as ve:
+        logging.info(f"Class search rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Class search error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@route('/api/timetable')
+@async_jwt_required
+async def class_timetable():
+    try:
+        start = _parse_arg('from', datetime.fromisoformat) or datetime.utcnow()
+        end = _parse_arg('to', datetime.fromisoformat) or start + timedelta(days=7)
+        trainer_id = _parse_arg('trainer_id', int)
+        items = await g.async_session.run_sync(lambda session: timetable(session, start, end, trainer_id=trainer_id))
+        return jsonify({'items': items}), 200
+    except ValueError as ve:
+        logging.info(f"Timetable query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Timetable error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+def wsgi_environ(scope):
+    """The WSGI environ of a bodiless ASGI HTTP request, as WsgiToAsgi builds it for the Flask app."""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope.get('server', ('localhost', 80))[0],
+        'SERVER_PORT': str(scope.get('server', ('localhost', 80))[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsyncApp:
+    def __init__(self, wsgi_app):
+        self.flask = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] in ROUTES:
+            return await self.dispatch(scope, send)
+        return await self.flask(scope, receive, send)
+
+    async def dispatch(self, scope, send):
+        # What Flask.full_dispatch_request does, awaiting the view. The request
+        # context lives in context variables, so it stays with this request's task
+        with flask_app.request_context(wsgi_environ(scope)):
+            async with async_session() as session:
+                g.async_session = session
+                try:
+                    response = flask_app.preprocess_request()
+                    if response is None:
+                        if denylist.stale():
+                            # verify_jwt_in_request would reload it on the sync engine
+                            await session.run_sync(denylist.refresh)
+                        response = await ROUTES[scope['path']]()
+                except Exception as e:
+                    response = flask_app.handle_user_exception(e)
+            response = flask_app.finalize_request(response)
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in response.headers.items()]})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app)
@@ -0,0 +1,30 @@
+import os
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from config import app
+from db_pool import engine_options
+
+# Async engine for the ASGI serving mode (asgi.py). It points at the same
+# database as the Flask app, reached through an asyncio driver: asyncpg for
+# Postgres, aiosqlite for local SQLite. ASYNC_DATABASE_URL overrides it.
+
+ASYNC_DRIVERS = {'postgres': 'postgresql+asyncpg', 'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}')
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if 'sslmode' in url.query and url.get_backend_name() == 'postgresql':
+        # asyncpg spells libpq's sslmode as ssl
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+    return url
+
+
+app.config.setdefault('ASYNC_DATABASE_URL', os.getenv('ASYNC_DATABASE_URL') or async_url(app.config['SQLALCHEMY_DATABASE_URI']))
+
+engine = create_async_engine(app.config['ASYNC_DATABASE_URL'], **engine_options(app.config['ASYNC_DATABASE_URL'], asynchronous=True))
+# Handlers serialize inside run_sync, so nothing is read after the session closes
+async_session = async_sessionmaker(engine, expire_on_commit=False)
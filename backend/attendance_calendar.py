@@ -0,0 +1,84 @@
+import base64
+from datetime import date, timedelta
+from config import db
+from models import Attendance
+
+# Attendance for a date range packed one bit per day: bit i (least significant
+# bit first within each byte) is set when the member checked in on start + i.
+# A year is 46 bytes, 64 characters of base64, however long the history.
+
+MAX_DAYS = 1100
+STREAK_WINDOW = timedelta(days=366)
+
+
+def attended_days(user_id, start, end):
+    # (user_id, date) range on uq_attendances_user_id_date; only the date column is read
+    rows = db.session.query(Attendance.date).filter(
+        Attendance.user_id == user_id,
+        Attendance.date >= start,
+        Attendance.date <= end,
+        Attendance.attended.is_(True)
+    )
+    return {day for day, in rows}
+
+
+def pack(days, start, length):
+    bits = bytearray((length + 7) // 8)
+    for day in days:
+        offset = (day - start).days
+        bits[offset // 8] |= 1 << (offset % 8)
+    return base64.b64encode(bytes(bits)).decode()
+
+
+def _run_back(days, last):
+    run = 0
+    while last - timedelta(days=run) in days:
+        run += 1
+    return run
+
+
+def longest_streak(days):
+    longest = 0
+    for day in days:
+        if day - timedelta(days=1) not in days:
+            run = 1
+            while day + timedelta(days=run) in days:
+                run += 1
+            longest = max(longest, run)
+    return longest
+
+
+def current_streak(user_id, today):
+    """Consecutive check-in days up to today (or yesterday, until today ends)."""
+    window_end = today
+    days = attended_days(user_id, window_end - STREAK_WINDOW, window_end)
+    last = today if today in days else today - timedelta(days=1)
+    run = _run_back(days, last)
+    earliest = last - timedelta(days=run - 1)
+    # A run reaching the start of the window may go back further; read year by year
+    while run and earliest == window_end - STREAK_WINDOW:
+        window_end = earliest - timedelta(days=1)
+        days = attended_days(user_id, window_end - STREAK_WINDOW, window_end)
+        extra = _run_back(days, window_end)
+        run += extra
+        earliest = window_end - timedelta(days=extra - 1)
+    return run
+
+
+def build_calendar(user_id, start, end, today=None):
+    days = attended_days(user_id, start, end)
+    months = {}
+    for day in days:
+        key = day.strftime('%Y-%m')
+        months[key] = months.get(key, 0) + 1
+    length = (end - start).days + 1
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': length,
+        'bitmap': pack(days, start, length),
+        'total': len(days),
+        'current_streak': current_streak(user_id, today or date.today()),
+        'longest_streak': longest_streak(days),
+        'months': dict(sorted(months.items()))
+    }
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from inspect import iscoroutinefunction
+from flask import jsonify
+from flask_jwt_extended import create_access_token, verify_jwt_in_request, get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import app, db, jwt
+from models import User, TokenRevocation
+
+# Access tokens carry role, username and the user's token_version, so routes
+# authorize from the claims without loading the user. Changing a user's role
+# or deleting them bumps the version; tokens stamped with an older version are
+# rejected through the denylist below.
+
+app.config.setdefault('AUTH_DENYLIST_REFRESH', 5)
+
+
+def issue_token(user):
+    return create_access_token(identity=user.id, additional_claims={
+        'role': user.role,
+        'username': user.username,
+        'ver': user.token_version or 0
+    })
+
+
+def current_username():
+    return get_jwt().get('username')
+
+
+def async_jwt_required(fn):
+    """jwt_required() for coroutine views (asgi.py), which flask_jwt_extended
+    would run to completion on an event loop of their own."""
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        verify_jwt_in_request()
+        return await fn(*args, **kwargs)
+    return wrapper
+
+
+def _role_error(roles, view_name):
+    role = get_jwt().get('role')
+    if role is None:
+        # Issued before roles were carried in the token
+        return jsonify({'error': 'Session expired, please log in again'}), 401
+    if role not in roles:
+        logging.info(f"Unauthorized {view_name} access by user_id {get_jwt_identity()} with role {role}")
+        return jsonify({'error': 'Access denied'}), 403
+    return None
+
+
+def role_required(*roles):
+    """jwt_required() that also checks the token's role claim against roles.
+    Coroutine views (asgi.py) are wrapped in a coroutine."""
+    def decorator(fn):
+        if iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                verify_jwt_in_request()
+                return _role_error(roles, fn.__name__) or await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            return _role_error(roles, fn.__name__) or fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Denylist:
+    """Lowest accepted token version for recently revoked users.
+
+    Each worker keeps the map in memory and reloads it from token_revocations
+    at most every AUTH_DENYLIST_REFRESH seconds, so revocations made by another
+    worker apply within that window; the worker that made the change applies
+    it at commit. Only revocations younger than the token lifetime are loaded.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._versions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def min_version(self, user_id):
+        if self.stale():
+            self.refresh()
+        return self._versions.get(user_id, 0)
+
+    def refresh(self, session=None):
+        query = (session or db.session).query(TokenRevocation.user_id, TokenRevocation.version)
+        lifetime = app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        if lifetime:
+            query = query.filter(TokenRevocation.revoked_at > datetime.utcnow() - lifetime)
+        versions = dict(query.all())
+        with self._lock:
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+
+    def record(self, user_id, version):
+        with self._lock:
+            self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+
+denylist = Denylist(app.config['AUTH_DENYLIST_REFRESH'])
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    return jwt_payload.get('ver', 0) < denylist.min_version(jwt_payload['sub'])
+
+
+def _revoke(session, user_id, version):
+    revocation = session.get(TokenRevocation, user_id)
+    if revocation is None:
+        session.add(TokenRevocation(user_id=user_id, version=version, revoked_at=datetime.utcnow()))
+    else:
+        revocation.version = version
+        revocation.revoked_at = datetime.utcnow()
+    session.info.setdefault('revocations', {})[user_id] = version
+
+
+@event.listens_for(Session, 'before_flush')
+def _revoke_changed_users(session, flush_context, instances):
+    for instance in list(session.dirty):
+        if isinstance(instance, User) and inspect(instance).attrs.role.history.has_changes():
+            instance.token_version = (instance.token_version or 0) + 1
+            _revoke(session, instance.id, instance.token_version)
+    for instance in list(session.deleted):
+        if isinstance(instance, User):
+            _revoke(session, instance.id, (instance.token_version or 0) + 1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_revocations(session):
+    for user_id, version in session.info.pop('revocations', {}).items():
+        denylist.record(user_id, version)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revocations(session):
+    session.info.pop('revocations', None)
@@ -0,0 +1,38 @@
+import os
+
+# Benchmarks and checks seed and hammer a database, so they must never fall
+# through to the DATABASE_URL in .env, which points at the deployed instance.
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite://')
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples):
+    """p50/p95/p99/max in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+def file_database():
+    """Swap the shared in-memory default for a scratch SQLite file.
+
+    An in-memory SQLite database is a single connection shared by every
+    thread, which makes multi-threaded benchmarks meaningless.
+    """
+    if os.environ['DATABASE_URL'] == 'sqlite://':
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(prefix='gym-bench-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return os.environ['DATABASE_URL']
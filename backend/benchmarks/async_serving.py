@@ -0,0 +1,183 @@
+"""Read-route throughput and latency: sync gunicorn vs the ASGI serving mode.
+
+Run from backend/:  python -m benchmarks.async_serving [--seconds 10] [--concurrency 50 200]
+Starts each server against the same scratch database and drives a mix of
+GET /api/dashboard, /api/classes, /api/attendance and /api/trainer-dashboard
+from many concurrent asyncio clients, one connection per request. Set
+BENCH_DATABASE_URL to a local Postgres to include real network round trips.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import date, datetime, timedelta
+from benchmarks import file_database, latency_summary
+
+file_database()
+
+from sqlalchemy import insert  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from config import app, db  # noqa: E402
+from models import User, WorkoutClass, Attendance, trainer_trainee  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    # The deployment before start.sh grew threads: 3 sync workers
+    'sync': [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', '3'],
+    'gthread': [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', '3', '--threads', '4'],
+    'async': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', '3'],
+}
+
+
+def seed(members, trainers, classes, visits):
+    rng = random.Random(12)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'id': i, 'username': f'trainer{i}', 'email': f'trainer{i}@example.com', 'password_hash': 'x', 'role': 'trainer'}
+            for i in range(1, trainers + 1)
+        ] + [
+            {'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x', 'role': 'user'}
+            for i in range(trainers + 1, trainers + members + 1)
+        ])
+        db.session.execute(trainer_trainee.insert(), [
+            {'trainer_id': rng.randint(1, trainers), 'trainee_id': i} for i in range(trainers + 1, trainers + members + 1)
+        ])
+        now = datetime.utcnow()
+        db.session.execute(insert(WorkoutClass), [
+            {'trainer_id': rng.randint(1, trainers), 'name': f'Class {i}', 'max_capacity': 20, 'current_capacity': 0,
+             'date_time': now + timedelta(hours=rng.randint(-24 * 60, 24 * 60))}
+            for i in range(classes)
+        ])
+        today = date.today()
+        db.session.execute(insert(Attendance), [
+            {'user_id': i, 'date': today - timedelta(days=day), 'attended': True}
+            for i in range(trainers + 1, trainers + members + 1)
+            for day in rng.sample(range(365), visits)
+        ])
+        db.session.commit()
+        member_tokens = [create_access_token(identity=i, additional_claims={'role': 'user', 'username': f'member{i}', 'ver': 0})
+                         for i in range(trainers + 1, trainers + members + 1)]
+        trainer_tokens = [create_access_token(identity=i, additional_claims={'role': 'trainer', 'username': f'trainer{i}', 'ver': 0})
+                          for i in range(1, trainers + 1)]
+    return member_tokens, trainer_tokens
+
+
+def requests_mix(member_tokens, trainer_tokens):
+    rng = random.Random(7)
+    paths = [
+        (40, '/api/dashboard', member_tokens),
+        (30, '/api/classes?limit=50', member_tokens),
+        (20, '/api/attendance?limit=50', member_tokens),
+        (10, '/api/trainer-dashboard', trainer_tokens),
+    ]
+    weights = [weight for weight, _, _ in paths]
+    while True:
+        _, path, tokens = rng.choices(paths, weights)[0]
+        yield path, rng.choice(tokens)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port):
+    if mode == 'async':
+        return MODES[mode] + ['--host', '127.0.0.1', '--port', str(port), '--app-dir', BACKEND,
+                              '--log-level', 'warning', '--no-access-log']
+    return MODES[mode] + ['--bind', f'127.0.0.1:{port}', '--pythonpath', BACKEND, '--log-level', 'warning']
+
+
+def start_server(mode, port, workdir):
+    server = subprocess.Popen(server_command(mode, port), cwd=workdir)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def fetch(port, path, token):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+                      f'Connection: close\r\n\r\n').encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def drive(port, concurrency, seconds, mix):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            path, token = next(mix)
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, path, token)
+            except (OSError, IndexError, ValueError):
+                status = 'error'
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, statuses
+
+
+def run_mode(mode, args, mix, workdir):
+    port = free_port()
+    server = start_server(mode, port, workdir)
+    try:
+        results = {}
+        for concurrency in args.concurrency:
+            latencies, statuses = asyncio.run(drive(port, concurrency, args.seconds, mix))
+            results[f'c{concurrency}'] = {
+                'throughput_rps': round(len(latencies) / args.seconds, 1),
+                'latency': latency_summary(latencies),
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            }
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--trainers', type=int, default=50)
+    parser.add_argument('--classes', type=int, default=5000)
+    parser.add_argument('--visits', type=int, default=60, help='Attendance rows per member')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+    member_tokens, trainer_tokens = seed(args.members, args.trainers, args.classes, args.visits)
+    mix = requests_mix(member_tokens, trainer_tokens)
+    workdir = tempfile.mkdtemp(prefix='gym-async-serving-')
+    report = {'cpus': os.cpu_count(), 'database': os.environ['DATABASE_URL'].split(':', 1)[0], 'seconds': args.seconds}
+    for mode in args.modes:
+        report[mode] = run_mode(mode, args, mix, workdir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Sustained turnstile check-in ingestion through POST /api/attendance/batch.
+
+Run from backend/:  python -m benchmarks.checkin_ingest [--members 20000] [--batches 200] [--batch-size 500]
+A share of the batches are replays of earlier ones, as sent by devices that
+come back online; they must come back as duplicates without new rows.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from benchmarks import file_database, latency_summary
+
+file_database()
+
+from sqlalchemy import insert, func  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from config import app, db  # noqa: E402
+from models import User, Attendance  # noqa: E402
+import routes  # noqa: E402,F401
+
+
+def seed(members):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [{'id': 1, 'username': 'turnstile', 'email': 'turnstile@example.com',
+                                       'password_hash': 'x', 'role': 'device'}])
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x', 'role': 'user'}
+        for i in range(2, members + 2)
+    ])
+    db.session.commit()
+    return create_access_token(identity=1, additional_claims={'role': 'device', 'username': 'turnstile', 'ver': 0})
+
+
+def make_batches(args):
+    rng = random.Random(11)
+    start = datetime.utcnow() - timedelta(days=365)
+    batches = []
+    for number in range(args.batches):
+        if batches and rng.random() < args.replay_ratio:
+            batches.append(rng.choice(batches))
+            continue
+        # Each batch covers roughly one busy minute on one day
+        moment = start + timedelta(days=number * 365 // args.batches, hours=rng.randint(6, 20))
+        batches.append([
+            {'user_id': rng.randint(2, args.members + 1),
+             'timestamp': (moment + timedelta(seconds=rng.randint(0, 59))).isoformat() + 'Z'}
+            for _ in range(args.batch_size)
+        ])
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--replay-ratio', type=float, default=0.2)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with app.app_context():
+        token = seed(args.members)
+    queue = make_batches(args)
+    lock = threading.Lock()
+    latencies, summary = [], {'created': 0, 'duplicate': 0, 'invalid': 0, 'failed_batches': 0}
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                batch = queue.pop()
+            started = time.perf_counter()
+            response = client.post('/api/attendance/batch', json={'events': batch},
+                                   headers={'Authorization': f'Bearer {token}'})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    summary['failed_batches'] += 1
+                    continue
+                for status, count in response.get_json()['summary'].items():
+                    summary[status] += count
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        rows = db.session.query(func.count(Attendance.id)).scalar()
+        report = {
+            'database': db.engine.url.render_as_string(),
+            'events': args.batches * args.batch_size,
+            'events_per_second': round(args.batches * args.batch_size / elapsed, 1),
+            'batch_latency': latency_summary(latencies),
+            'results': summary,
+            'attendance_rows': rows,
+            'rows_match_created': rows == summary['created'],
+        }
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report['rows_match_created'] and not summary['failed_batches'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Seed every table with synthetic gym data, deterministically and at any scale.
+
+Run from backend/:  python -m benchmarks.datagen [--scale large] [--users 100000 --attendance 20000000 ...]
+Set BENCH_DATABASE_URL to seed a scratch Postgres or SQLite file; the default
+in-memory database only lives as long as the run. The same seed and scale give
+the same rows (dates are relative to the day of the run). Rows are generated
+lazily and inserted CHUNK at a time, so memory stays flat at any size.
+
+Layout, relied on by the benchmark runner (benchmarks/suite.py): user 1 is the
+admin, trainers follow, then members. Every account's password is PASSWORD.
+Members whose index is a multiple of 3 have a trainer assigned, and those
+whose index is 3 mod 4 have never subscribed; the rest are left free for
+assign-trainer and subscribe requests. Class series run weekly on one to
+three days and are cancelled on a few dates each.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, time as clock, timedelta
+from itertools import islice
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from config import app, db
+from models import (User, SubscriptionPlan, UserSubscription, HealthProfile, WorkoutClass, Attendance, ClassRSVP,
+                    ClassSeries, ClassSeriesException, trainer_trainee)
+from stats import recount
+from class_series import WEEKDAYS
+from subscriptions import rebuild_memberships
+from analytics import refresh_rollups
+from revenue import backfill
+
+SCALES = {
+    'small': {'users': 1000, 'trainers': 20, 'classes': 500, 'series': 40, 'attendance': 30000},
+    'medium': {'users': 20000, 'trainers': 100, 'classes': 10000, 'series': 200, 'attendance': 2000000},
+    'large': {'users': 100000, 'trainers': 500, 'classes': 50000, 'series': 1000, 'attendance': 20000000},
+}
+PLANS = 6
+CHUNK = 10000
+PASSWORD = 'password'
+ADMIN_ID = 1
+CLASS_WINDOW_DAYS = 90
+
+
+class Layout:
+    def __init__(self, users, trainers):
+        self.admin_id = ADMIN_ID
+        self.trainer_ids = range(ADMIN_ID + 1, ADMIN_ID + 1 + trainers)
+        self.member_ids = range(self.trainer_ids.stop, self.trainer_ids.stop + users)
+
+    def has_trainer(self, member_id):
+        return (member_id - self.member_ids.start) % 3 == 0
+
+    def has_subscriptions(self, member_id):
+        return (member_id - self.member_ids.start) % 4 != 3
+
+
+def _insert(target, rows):
+    """Bulk insert an iterable of row dicts CHUNK rows per statement; returns the row count."""
+    rows = iter(rows)
+    total = 0
+    while True:
+        batch = list(islice(rows, CHUNK))
+        if not batch:
+            return total
+        db.session.execute(insert(target), batch)
+        db.session.commit()
+        total += len(batch)
+
+
+def _users(layout, password_hash):
+    now = datetime.utcnow()
+    yield {'id': layout.admin_id, 'username': 'admin', 'email': 'admin@example.com',
+           'password_hash': password_hash, 'role': 'admin', 'created_at': now}
+    for number, user_id in enumerate(layout.trainer_ids, start=1):
+        yield {'id': user_id, 'username': f'trainer{number}', 'email': f'trainer{number}@example.com',
+               'password_hash': password_hash, 'role': 'trainer', 'created_at': now}
+    for number, user_id in enumerate(layout.member_ids, start=1):
+        yield {'id': user_id, 'username': f'member{number}', 'email': f'member{number}@example.com',
+               'password_hash': password_hash, 'role': 'user', 'created_at': now}
+
+
+def _plans():
+    for plan_id in range(1, PLANS + 1):
+        yield {'id': plan_id, 'name': f'Plan {plan_id}', 'duration_days': 30 * plan_id,
+               'price': 25.0 * plan_id, 'description': f'{plan_id} month membership'}
+
+
+def _subscriptions(rng, layout):
+    now = datetime.utcnow()
+    for member_id in layout.member_ids:
+        if not layout.has_subscriptions(member_id):
+            continue
+        # Back to back, each on a different plan; the latest may still be running
+        end = now + timedelta(days=rng.randint(-60, 60))
+        for plan_id in rng.sample(range(1, PLANS + 1), rng.randint(1, 3)):
+            start = end - timedelta(days=30 * plan_id)
+            yield {'user_id': member_id, 'plan_id': plan_id, 'start_date': start, 'end_date': end}
+            end = start
+
+
+def _health_profiles(rng, layout):
+    for member_id in layout.member_ids[::2]:
+        height = rng.uniform(150, 200)
+        weight = rng.uniform(50, 110)
+        yield {'user_id': member_id, 'height_cm': round(height, 1), 'weight_kg': round(weight, 1),
+               'bmi': round(weight / (height / 100) ** 2, 1), 'goal': rng.choice(['Strength', 'Endurance', 'Weight loss', None])}
+
+
+def _trainer_links(rng, layout):
+    for member_id in layout.member_ids:
+        if layout.has_trainer(member_id):
+            yield {'trainer_id': rng.choice(layout.trainer_ids), 'trainee_id': member_id}
+
+
+def _classes_and_rsvps(rng, layout, classes):
+    """Classes spread over the CLASS_WINDOW_DAYS either side of today, with their RSVPs."""
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=CLASS_WINDOW_DAYS)
+    step = timedelta(days=2 * CLASS_WINDOW_DAYS) / max(classes, 1)
+    class_rows, rsvp_rows = [], []
+    for class_id in range(1, classes + 1):
+        capacity = rng.choice([10, 15, 20, 30])
+        attendees = rng.sample(layout.member_ids, min(rng.randint(0, capacity), len(layout.member_ids)))
+        class_rows.append({'id': class_id, 'name': f'{rng.choice(["Spin", "Yoga", "HIIT", "Boxing", "Pilates"])} {class_id}',
+                           'date_time': start + step * (class_id - 1), 'description': None,
+                           'trainer_id': rng.choice(layout.trainer_ids), 'max_capacity': capacity,
+                           'current_capacity': len(attendees)})
+        rsvp_rows.extend({'user_id': member_id, 'class_id': class_id, 'attending': True} for member_id in attendees)
+        if len(rsvp_rows) >= CHUNK:
+            yield class_rows, rsvp_rows
+            class_rows, rsvp_rows = [], []
+    yield class_rows, rsvp_rows
+
+
+def _series(rng, layout, count):
+    today = date.today()
+    for series_id in range(1, count + 1):
+        yield {'id': series_id, 'trainer_id': rng.choice(layout.trainer_ids), 'name': f'Weekly {series_id}',
+               'description': None, 'max_capacity': rng.choice([10, 15, 20, 30]),
+               'weekdays': ','.join(sorted(rng.sample(WEEKDAYS, rng.randint(1, 3)), key=WEEKDAYS.index)),
+               'start_time': clock(rng.randint(6, 21)), 'interval_weeks': rng.choice([1, 1, 2]),
+               'starts_on': today - timedelta(days=rng.randint(0, 180)), 'ends_on': today + timedelta(days=rng.randint(30, 365)),
+               'created_at': datetime.utcnow()}
+
+
+def _series_exceptions(rng, count):
+    # A few holiday closures per series; dates the series does not run on are harmless
+    today = date.today()
+    for series_id in range(1, count + 1):
+        for offset in sorted(rng.sample(range(-30, 120), 3)):
+            yield {'series_id': series_id, 'date': today + timedelta(days=offset)}
+
+
+def _attendance(rng, layout, total):
+    today = date.today()
+    per_member, extra = divmod(total, len(layout.member_ids) or 1)
+    for index, member_id in enumerate(layout.member_ids):
+        visits = per_member + (1 if index < extra else 0)
+        window = max(2 * visits, 365)
+        for offset in sorted(rng.sample(range(window), min(visits, window))):
+            yield {'user_id': member_id, 'date': today - timedelta(days=offset), 'attended': True}
+
+
+def generate(users, trainers, classes, series, attendance, seed=42):
+    """Create the schema and seed it; returns the Layout and per-table row counts."""
+    rng = random.Random(seed)
+    layout = Layout(users, trainers)
+    db.create_all()
+    # One real hash for everyone so the login route can be exercised
+    password_hash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+    counts = {
+        'users': _insert(User, _users(layout, password_hash)),
+        'subscription_plans': _insert(SubscriptionPlan, _plans()),
+        'user_subscriptions': _insert(UserSubscription, _subscriptions(rng, layout)),
+        'health_profiles': _insert(HealthProfile, _health_profiles(rng, layout)),
+        'trainer_trainee': _insert(trainer_trainee, _trainer_links(rng, layout)),
+        'workout_classes': 0,
+        'class_rsvps': 0,
+    }
+    for class_rows, rsvp_rows in _classes_and_rsvps(rng, layout, classes):
+        counts['workout_classes'] += _insert(WorkoutClass, class_rows)
+        counts['class_rsvps'] += _insert(ClassRSVP, rsvp_rows)
+    counts['class_series'] = _insert(ClassSeries, _series(rng, layout, series))
+    counts['class_series_exceptions'] = _insert(ClassSeriesException, _series_exceptions(rng, series))
+    counts['attendances'] = _insert(Attendance, _attendance(rng, layout, attendance))
+    # Core inserts skip the session hooks that keep the dashboard counters,
+    # the members' current subscriptions and the revenue rollups; the
+    # analytics rollups are built as the nightly refresh would
+    recount()
+    counts['active_members'] = rebuild_memberships()
+    counts['class_day_stats'] = refresh_rollups()['classes']
+    counts['revenue_subscriptions'] = backfill()['subscriptions']
+    return layout, counts
+
+
+def add_scale_arguments(parser):
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'override the preset number of {name}')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def scale_from_args(args):
+    scale = dict(SCALES[args.scale])
+    scale.update({name: getattr(args, name) for name in scale if getattr(args, name) is not None})
+    return scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    scale = scale_from_args(args)
+    started = time.perf_counter()
+    with app.app_context():
+        _, counts = generate(seed=args.seed, **scale)
+    print(json.dumps({'scale': scale, 'seed': args.seed, 'rows': counts,
+                      'seconds': round(time.perf_counter() - started, 1)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
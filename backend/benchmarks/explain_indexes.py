@@ -0,0 +1,170 @@
+"""EXPLAIN every hot route query against a seeded database and check it is an index scan.
+
+Run from backend/:  python -m benchmarks.explain_indexes
+Set BENCH_DATABASE_URL to check a scratch Postgres instead of in-memory SQLite.
+"""
+import random
+import sys
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, insert, select, text
+from config import app, db
+from queries import schedule_query
+from subscriptions import rebuild_memberships
+from analytics import class_day_query, refresh_rollups, _regular_counts
+from revenue import backfill
+from models import (User, SubscriptionPlan, UserSubscription, Attendance, WorkoutClass, ClassRSVP, OutboxMessage,
+                    ClassDayStat, RevenueDay, trainer_trainee)
+
+USERS = 2000
+TRAINERS = 50
+CLASSES = 2000
+DAYS = 30
+
+
+def seed():
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x',
+         'role': 'trainer' if i <= TRAINERS else 'user'}
+        for i in range(1, USERS + 1)
+    ])
+    db.session.execute(insert(SubscriptionPlan), [
+        {'id': i, 'name': f'Plan {i}', 'duration_days': 30 * i, 'price': 10.0 * i} for i in range(1, 4)
+    ])
+    db.session.execute(insert(UserSubscription), [
+        {'user_id': i, 'plan_id': rng.randint(1, 3), 'start_date': now - timedelta(days=10),
+         'end_date': now + timedelta(days=rng.randint(-30, 60))}
+        for i in range(TRAINERS + 1, USERS + 1)
+    ])
+    db.session.execute(insert(WorkoutClass), [
+        {'id': i, 'name': f'Class {i}', 'date_time': now + timedelta(hours=i - CLASSES // 2),
+         'trainer_id': rng.randint(1, TRAINERS), 'max_capacity': 20,
+         'current_capacity': 20 if rng.random() < 0.8 else rng.randint(0, 19)}
+        for i in range(1, CLASSES + 1)
+    ])
+    db.session.execute(insert(Attendance), [
+        {'user_id': i, 'date': date.today() - timedelta(days=d), 'attended': True}
+        for i in range(TRAINERS + 1, USERS + 1) for d in range(DAYS)
+    ])
+    db.session.execute(insert(ClassRSVP), [
+        {'user_id': i, 'class_id': c, 'attending': True}
+        for i in range(TRAINERS + 1, USERS + 1) for c in rng.sample(range(1, CLASSES + 1), 3)
+    ])
+    db.session.execute(insert(trainer_trainee), [
+        {'trainer_id': rng.randint(1, TRAINERS), 'trainee_id': i} for i in range(TRAINERS + 1, USERS + 1)
+    ])
+    # Mostly delivered mail, as in a running outbox
+    db.session.execute(insert(OutboxMessage), [
+        {'kind': 'rsvp', 'user_id': i, 'recipient': f'member{i}@example.com', 'subject': 'RSVP', 'body': 'Hi',
+         'status': 'sent' if i % 20 else 'pending', 'next_attempt_at': now - timedelta(minutes=i % 60)}
+        for i in range(TRAINERS + 1, USERS + 1)
+    ])
+    db.session.commit()
+    rebuild_memberships()
+    refresh_rollups()
+    backfill()
+    db.session.execute(text('ANALYZE'))
+
+
+def primary_key_index(model):
+    # Composite primary keys are indexed under the database's own name
+    if db.engine.dialect.name == 'sqlite':
+        return f'sqlite_autoindex_{model.__tablename__}_1'
+    return f'{model.__tablename__}_pkey'
+
+
+def route_queries():
+    user_id = TRAINERS + 1
+    now = datetime.utcnow()
+    return [
+        ('attendance: user history', 'uq_attendances_user_id_date',
+         Attendance.query.filter(Attendance.user_id == user_id)
+         .order_by(Attendance.date.desc(), Attendance.id.desc()).limit(51)),
+        ('dashboard: user rsvps', 'uq_class_rsvps_user_id_class_id',
+         ClassRSVP.query.filter_by(user_id=user_id)),
+        ('expire-subscriptions: lapsed members', 'ix_users_active_until',
+         User.query.filter(User.active_until <= now).order_by(User.active_until).limit(1000)),
+        ('expire-subscriptions: running subscription', 'ix_user_subscriptions_user_id_end_date',
+         UserSubscription.query.filter(UserSubscription.user_id == user_id, UserSubscription.end_date > now)),
+        ('users/import: existing emails', 'ix_users_email_lower',
+         User.query.filter(func.lower(User.email).in_(['member60@example.com', 'member61@example.com']))),
+        ('user-subscriptions: plan check', 'ix_user_subscriptions_user_id_plan_id',
+         UserSubscription.query.filter_by(user_id=user_id, plan_id=1)),
+        ('trainer-dashboard: own classes', 'ix_workout_classes_trainer_id_date_time',
+         WorkoutClass.query.filter_by(trainer_id=1)),
+        ('classes: schedule page', 'ix_workout_classes_date_time',
+         WorkoutClass.query.filter(WorkoutClass.date_time >= now)
+         .order_by(WorkoutClass.date_time, WorkoutClass.id).limit(51)),
+        ('classes: version stamp', 'ix_workout_classes_updated_at',
+         select(func.max(WorkoutClass.updated_at))),
+        ('classes/search: week timetable', 'ix_workout_classes_date_time',
+         schedule_query(db.session, start=now, end=now + timedelta(days=7))
+         .order_by(WorkoutClass.date_time, WorkoutClass.id).limit(51)),
+        ('classes/search: open classes this week', 'ix_workout_classes_open_date_time',
+         schedule_query(db.session, start=now, end=now + timedelta(days=7), has_spots=True, name_prefix='Class')
+         .order_by(WorkoutClass.date_time, WorkoutClass.id).limit(51)),
+        ('send-email: claim due messages', 'ix_email_outbox_due',
+         OutboxMessage.query.filter(OutboxMessage.undelivered, OutboxMessage.next_attempt_at <= now)
+         .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(50)),
+        ('trainers: role page', 'ix_users_role_id',
+         User.query.filter(User.role == 'trainer').order_by(User.id).limit(51)),
+        ('dashboard: assigned trainer', 'ix_trainer_trainee_trainee_id',
+         db.session.query(trainer_trainee).filter(trainer_trainee.c.trainee_id == user_id)),
+        ('trainer-analytics: weekly rollup', 'ix_class_day_stats_trainer_id_day',
+         db.session.query(ClassDayStat.week, func.sum(ClassDayStat.booked))
+         .filter(ClassDayStat.trainer_id == 1, ClassDayStat.day >= date.today() - timedelta(weeks=12))
+         .group_by(ClassDayStat.week)),
+        ('refresh-analytics: classes of the day', 'ix_workout_classes_date_time',
+         class_day_query(date.today() - timedelta(days=1), date.today())),
+        ('refresh-analytics: booked members checked in', 'uq_attendances_user_id_date',
+         class_day_query(date.today() - timedelta(days=1), date.today())),
+        ('refresh-analytics: series attendance of the days',
+         ('ix_workout_classes_date_time', 'uq_workout_classes_series_id_date_time'),
+         _regular_counts(None, date.today() - timedelta(days=8), date.today())),
+        ('revenue: days of the range', primary_key_index(RevenueDay),
+         db.session.query(RevenueDay).filter(RevenueDay.day >= date.today() - timedelta(days=30),
+                                             RevenueDay.day < date.today())),
+        ('backfill-revenue: next members',
+         ('ix_user_subscriptions_user_id_end_date', 'ix_user_subscriptions_user_id_plan_id'),
+         select(UserSubscription.user_id).where(UserSubscription.user_id > user_id)
+         .group_by(UserSubscription.user_id).order_by(UserSubscription.user_id).limit(1000)),
+    ]
+
+
+def explain(query):
+    dialect = db.engine.dialect
+    # ORM queries or Core selects; IN lists expanded into their parameters
+    compiled = getattr(query, 'statement', query).compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.connection().exec_driver_sql(prefix + str(compiled), params).fetchall()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        seed()
+        if db.engine.dialect.name == 'postgresql':
+            # Seeded tables are small enough that the planner may still prefer a
+            # seq scan; disabling it shows whether an index is usable at all.
+            db.session.execute(text('SET enable_seqscan = off'))
+        failures = 0
+        for label, index_name, query in route_queries():
+            plan = explain(query)
+            # A tuple lists indexes that serve the query equally well
+            ok = any(name in plan for name in (index_name if isinstance(index_name, tuple) else (index_name,)))
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {label} -> {index_name}")
+            print('     ' + plan.replace('\n', '\n     '))
+        db.session.rollback()
+        db.drop_all()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
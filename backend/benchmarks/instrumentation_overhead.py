@@ -0,0 +1,94 @@
+"""Per-request cost of the request/query instrumentation (instrumentation.py).
+
+Run from backend/:  python -m benchmarks.instrumentation_overhead [--requests 3000] [--budget-us 150]
+Times the same routes through the Flask test client in child processes with
+INSTRUMENTATION_ENABLED on and off, alternating over a few rounds and keeping
+each side's best median, and fails if the added time exceeds the budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROUTES = {
+    'classes (1 query)': '/api/classes?limit=20',
+    'attendance (1 query)': '/api/attendance?limit=20',
+    'dashboard (cached, 0 queries)': '/api/dashboard',
+}
+
+
+def child(requests):
+    # Imported here so each child reads INSTRUMENTATION_ENABLED from its own environment
+    from datetime import date, datetime, timedelta
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import insert
+    from config import app, db
+    from models import User, WorkoutClass, Attendance
+    import routes  # noqa: F401
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [{'id': 1, 'username': 'member', 'email': 'member@example.com',
+                                           'password_hash': 'x', 'role': 'user'}])
+        db.session.execute(insert(WorkoutClass), [
+            {'trainer_id': 1, 'name': f'Class {i}', 'date_time': datetime.utcnow() + timedelta(hours=i), 'max_capacity': 20}
+            for i in range(100)
+        ])
+        db.session.execute(insert(Attendance), [
+            {'user_id': 1, 'date': date.today() - timedelta(days=i), 'attended': True} for i in range(100)
+        ])
+        db.session.commit()
+        token = create_access_token(identity=1, additional_claims={'role': 'user', 'username': 'member', 'ver': 0})
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    results = {}
+    for name, path in ROUTES.items():
+        for _ in range(200):
+            client.get(path, headers=headers)
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(path, headers=headers)
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        results[name] = statistics.median(samples) * 1e6
+    print(json.dumps(results))
+
+
+def run_child(enabled, requests):
+    env = dict(os.environ, INSTRUMENTATION_ENABLED=str(enabled), SLOW_QUERY_MS='1000')
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.instrumentation_overhead', '--child', '--requests', str(requests)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--budget-us', type=float, default=150)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.requests)
+    best = {True: {}, False: {}}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            for name, median in run_child(enabled, args.requests).items():
+                best[enabled][name] = min(median, best[enabled].get(name, float('inf')))
+    report = {'budget_us': args.budget_us, 'routes': {}}
+    over = False
+    for name in ROUTES:
+        overhead = best[True][name] - best[False][name]
+        over = over or overhead > args.budget_us
+        report['routes'][name] = {'off_median_us': round(best[False][name], 1), 'on_median_us': round(best[True][name], 1),
+                                  'overhead_us': round(overhead, 1)}
+    report['within_budget'] = not over
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Request latency with a slow log sink, written inline versus through the log queue.
+
+Run from backend/:  python -m benchmarks.logging_latency [--requests 500] [--sink-ms 5]
+Each request is a login missing its password, which logs one info line and
+returns 400 without touching the database or the hashing pool. The sink sleeps
+--sink-ms per record, standing in for a stalled disk or stdout pipe.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+os.environ['LOG_FILE'] = ''
+
+from app import app  # noqa: E402
+from log_pipeline import setup_logging, shutdown_logging  # noqa: E402
+from benchmarks import latency_summary  # noqa: E402
+
+
+class SlowSink(logging.Handler):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.written = 0
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.format(record)
+        self.written += 1
+
+
+def inline(sink):
+    # What app.py did before: handlers attached straight to the root logger
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(sink)
+    root.setLevel(logging.INFO)
+
+
+def run(requests):
+    client = app.test_client()
+    for _ in range(20):
+        client.post('/api/login', json={'username': 'member'})
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.post('/api/login', json={'username': 'member'})
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 400, response.status_code
+    return latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--sink-ms', type=float, default=5)
+    args = parser.parse_args()
+    delay = args.sink_ms / 1000
+    report = {'sink_ms': args.sink_ms}
+
+    sink = SlowSink(0)
+    inline(sink)
+    report['fast sink, inline'] = run(args.requests)
+
+    sink = SlowSink(delay)
+    inline(sink)
+    report['slow sink, inline'] = run(args.requests)
+
+    sink = SlowSink(delay)
+    queue_handler = setup_logging([sink])
+    report['slow sink, queued'] = run(args.requests)
+    report['slow sink, queued']['written_during_run'] = sink.written
+    report['slow sink, queued']['dropped'] = queue_handler.dropped
+    started = time.perf_counter()
+    shutdown_logging()
+    report['slow sink, queued']['drain_after_run_s'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
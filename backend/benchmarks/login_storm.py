@@ -0,0 +1,141 @@
+"""Login throughput and non-login p99 latency under a concurrent login storm.
+
+Run from backend/:  python -m benchmarks.login_storm [--seconds 10] [--storm-threads 24]
+Starts gunicorn twice against a scratch database: once as before (3 sync
+workers hashing inline) and once with threaded workers and the hashing pool.
+While login threads hammer /api/login, a probe thread times GET /api/classes.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from benchmarks import file_database, latency_summary
+
+file_database()
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from config import app, db  # noqa: E402
+from models import User  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    'sync-inline': {'args': ['--workers', '3'], 'env': {'PASSWORD_HASH_WORKERS': '0'}},
+    'gthread-pool': {'args': ['--workers', '3', '--threads', '8'], 'env': {'WEB_CONCURRENCY': '3'}},
+}
+
+
+def seed(members):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # One real hash shared by every member keeps seeding fast
+        password_hash = generate_password_hash('storm-password', app.config['PASSWORD_HASH_METHOD'])
+        db.session.execute(insert(User), [
+            {'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': password_hash, 'role': 'user'}
+            for i in range(members)
+        ])
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def start_server(mode, port, workdir):
+    env = dict(os.environ, **MODES[mode]['env'])
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+               '--pythonpath', BACKEND, '--log-level', 'warning'] + MODES[mode]['args']
+    server = subprocess.Popen(command, cwd=workdir, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def run_mode(mode, args, workdir):
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    server = start_server(mode, port, workdir)
+    try:
+        token = post_json(f'{base}/api/login', {'username': 'member0', 'password': 'storm-password'})['access_token']
+        stop = threading.Event()
+        logins, rejected, probes = [], [], []
+
+        def storm(index):
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    post_json(f'{base}/api/login', {'username': f'member{index % args.members}', 'password': 'storm-password'})
+                    logins.append(time.perf_counter() - started)
+                except urllib.error.HTTPError as error:
+                    rejected.append(error.code)
+                    # Behave like a real client and honour Retry-After on 503
+                    time.sleep(min(float(error.headers.get('Retry-After') or 0), 1.0) / 4)
+
+        def probe():
+            request = urllib.request.Request(f'{base}/api/classes', headers={'Authorization': f'Bearer {token}'})
+            while not stop.is_set():
+                started = time.perf_counter()
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                probes.append(time.perf_counter() - started)
+                time.sleep(0.02)
+
+        threads = [threading.Thread(target=storm, args=(i,)) for i in range(args.storm_threads)]
+        threads.append(threading.Thread(target=probe))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {
+            'login_throughput_rps': round(len(logins) / args.seconds, 1),
+            'login_latency': latency_summary(logins),
+            'logins_rejected': len(rejected),
+            'non_login_latency': latency_summary(probes),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--storm-threads', type=int, default=24)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+    seed(args.members)
+    workdir = tempfile.mkdtemp(prefix='gym-login-storm-')
+    report = {'cpus': os.cpu_count(), 'storm_threads': args.storm_threads,
+              'hash_method': app.config['PASSWORD_HASH_METHOD']}
+    for mode in args.modes:
+        report[mode] = run_mode(mode, args, workdir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
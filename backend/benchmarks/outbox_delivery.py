@@ -0,0 +1,115 @@
+"""Deliver a queued outbox through a local SMTP sink, per batch size, and count connections.
+
+Run from backend/:  python -m benchmarks.outbox_delivery [--messages 500] [--batch-sizes 1,50] [--refuse-every 0]
+The sink (started in-process on a free port) accepts everything, or answers
+550 to every --refuse-every'th recipient so the retry path is exercised:
+refused messages are retried until OUTBOX_MAX_ATTEMPTS, with the backoff
+switched off. Any SMTP debugging server works the same way with the worker
+itself: set MAIL_SERVER/MAIL_PORT and run `flask --app app send-email`.
+"""
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+
+os.environ['LOG_FILE'] = ''
+
+from config import app, db  # noqa: E402
+from models import User, OutboxMessage  # noqa: E402
+from outbox import enqueue, send_batch, SENT, FAILED  # noqa: E402
+from sqlalchemy import func, insert  # noqa: E402
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline().decode('ascii', 'replace').strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 sink')
+            elif command == 'RCPT':
+                with server.lock:
+                    server.recipients += 1
+                    refuse = server.refuse_every and server.recipients % server.refuse_every == 0
+                self.reply('550 mailbox unavailable' if refuse else '250 ok')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+    def reply(self, text):
+        self.wfile.write(f'{text}\r\n'.encode('ascii'))
+
+
+class Sink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, refuse_every):
+        super().__init__(('127.0.0.1', 0), SinkHandler)
+        self.lock = threading.Lock()
+        self.refuse_every = refuse_every
+        self.connections = self.recipients = self.messages = 0
+
+
+def run(sink, messages, batch_size):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [{'id': 1, 'username': 'member', 'email': 'member@example.com',
+                                       'password_hash': 'x', 'role': 'user'}])
+    enqueue(db.session, [{'kind': 'bench', 'user_id': 1, 'recipient': f'member{i}@example.com',
+                          'subject': f'Message {i}', 'body': 'Hello\n'} for i in range(messages)])
+    db.session.commit()
+    sink.connections = sink.recipients = sink.messages = 0
+    batches = 0
+    started = time.perf_counter()
+    while any(send_batch(batch_size).values()):
+        batches += 1
+    elapsed = time.perf_counter() - started
+    statuses = dict(db.session.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status))
+    return {'batches': batches, 'smtp_connections': sink.connections, 'delivered_to_sink': sink.messages,
+            'sent': statuses.get(SENT, 0), 'failed': statuses.get(FAILED, 0),
+            'messages_per_s': round(messages / elapsed, 1), 'seconds': round(elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-sizes', default='1,50')
+    parser.add_argument('--refuse-every', type=int, default=0)
+    args = parser.parse_args()
+    sink = Sink(args.refuse_every)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    host, port = sink.server_address
+    state = app.extensions['mail']
+    state.server, state.port, state.use_tls, state.use_ssl = host, port, False, False
+    state.username = state.password = None
+    state.default_sender = 'gym@example.com'
+    app.config.update(OUTBOX_RETRY_BASE=0, OUTBOX_MAX_ATTEMPTS=3)
+    report = {'messages': args.messages, 'refuse_every': args.refuse_every, 'batch_size': {}}
+    with app.app_context():
+        for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+            report['batch_size'][batch_size] = run(sink, args.messages, batch_size)
+        db.drop_all()
+    sink.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
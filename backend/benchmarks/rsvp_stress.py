@@ -0,0 +1,169 @@
+"""Fire thousands of concurrent RSVPs at one class and check it is never overbooked.
+
+Run from backend/:  python -m benchmarks.rsvp_stress [--members 3000] [--capacity 100] [--threads 32]
+Uses a scratch SQLite file unless BENCH_DATABASE_URL points at a scratch
+Postgres, which is what the numbers should be taken from. Exits 1 unless
+every member got exactly one 2xx RSVP (repeats must be refused with 400),
+the class filled to capacity without overbooking, and every cancel
+succeeded and promoted from the waitlist.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from benchmarks import file_database, latency_summary
+
+file_database()
+
+from sqlalchemy import insert, func  # noqa: E402
+from config import app, db  # noqa: E402
+from models import User, WorkoutClass, ClassRSVP  # noqa: E402
+from auth import issue_token  # noqa: E402
+import routes  # noqa: E402,F401
+
+
+def seed(members, capacity):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x', 'role': 'user'}
+        for i in range(1, members + 1)
+    ])
+    db.session.execute(insert(WorkoutClass), [{
+        'id': 1, 'name': 'Launch HIIT', 'date_time': datetime.utcnow() + timedelta(days=1),
+        'max_capacity': capacity, 'current_capacity': 0
+    }])
+    db.session.commit()
+    # Real login tokens: role_required wants the role, username and ver claims
+    return {user.id: issue_token(user) for user in User.query.order_by(User.id)}
+
+
+def fire(requests, tokens, threads):
+    """Send (method, user_id) requests from a thread pool; returns (results, elapsed)."""
+    queue = list(requests)
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                method, user_id = queue.pop()
+            started = time.perf_counter()
+            response = client.open('/api/rsvp', method=method, json={'class_id': 1},
+                                   headers={'Authorization': f'Bearer {tokens[user_id]}'})
+            elapsed = time.perf_counter() - started
+            with lock:
+                results.append((user_id, response.status_code, (response.get_json() or {}).get('status'), elapsed))
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def check_class(capacity):
+    db.session.remove()
+    workout_class = db.session.get(WorkoutClass, 1)
+    attending = db.session.query(func.count(ClassRSVP.id)).filter_by(class_id=1, attending=True).scalar()
+    duplicates = db.session.query(ClassRSVP.user_id).group_by(ClassRSVP.user_id, ClassRSVP.class_id) \
+        .having(func.count(ClassRSVP.id) > 1).count()
+    return {
+        'current_capacity': workout_class.current_capacity,
+        'attending_rows': attending,
+        'overbooked': workout_class.current_capacity > capacity or attending > capacity,
+        'counter_matches_rows': workout_class.current_capacity == attending,
+        'duplicate_rsvps': duplicates,
+    }
+
+
+def phase_report(results, elapsed):
+    statuses = {}
+    for _, status_code, status, _ in results:
+        key = status or str(status_code)
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        'requests': len(results),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'latency': latency_summary([latency for _, _, _, latency in results]),
+        'outcomes': statuses,
+    }
+
+
+def rsvp_failures(results, members):
+    """Problems with the RSVP phase: each member gets one 2xx, repeats a 400."""
+    failures = []
+    accepted = {}
+    for user_id, status_code, _, _ in results:
+        if 200 <= status_code < 300:
+            accepted[user_id] = accepted.get(user_id, 0) + 1
+        elif status_code != 400:
+            failures.append(f'member {user_id} got {status_code}')
+    missing = members - len(accepted)
+    if missing:
+        failures.append(f'{missing} members got no 2xx RSVP')
+    repeated = sum(1 for count in accepted.values() if count > 1)
+    if repeated:
+        failures.append(f'{repeated} members were accepted twice')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=3000)
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1,
+                        help='share of members who hit RSVP twice')
+    parser.add_argument('--cancels', type=int, default=50)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with app.app_context():
+        tokens = seed(args.members, args.capacity)
+    requests = [('POST', user_id) for user_id in tokens]
+    requests += [('POST', user_id) for user_id in rng.sample(sorted(tokens), int(args.members * args.duplicate_ratio))]
+    rng.shuffle(requests)
+
+    results, elapsed = fire(requests, tokens, args.threads)
+    failures = rsvp_failures(results, len(tokens))
+    with app.app_context():
+        report = {'database': db.engine.url.render_as_string(), 'threads': args.threads,
+                  'rsvp': phase_report(results, elapsed), 'after_rsvp': check_class(args.capacity)}
+        confirmed = [user_id for user_id, in db.session.query(ClassRSVP.user_id).filter_by(class_id=1, attending=True)]
+    full = min(args.capacity, args.members)
+    if len(confirmed) != full:
+        failures.append(f'{len(confirmed)} RSVPs confirmed, expected {full}')
+
+    # Cancelling confirmed members must promote from the waitlist and keep the class full
+    cancels = [('DELETE', user_id) for user_id in rng.sample(confirmed, min(args.cancels, len(confirmed)))]
+    results, elapsed = fire(cancels, tokens, args.threads)
+    failures += [f'cancel by member {user_id} got {status_code}'
+                 for user_id, status_code, _, _ in results if not 200 <= status_code < 300]
+    with app.app_context():
+        report['cancel'] = phase_report(results, elapsed)
+        report['after_cancel'] = check_class(args.capacity)
+    if report['after_cancel']['attending_rows'] != min(full, args.members - len(cancels)):
+        failures.append(f"{report['after_cancel']['attending_rows']} attending after cancels, waitlist not promoted")
+    for phase in ('after_rsvp', 'after_cancel'):
+        if report[phase]['overbooked']:
+            failures.append(f'{phase}: class overbooked')
+        if not report[phase]['counter_matches_rows']:
+            failures.append(f'{phase}: current_capacity does not match the attending rows')
+        if report[phase]['duplicate_rsvps']:
+            failures.append(f'{phase}: duplicate RSVP rows')
+
+    report['failures'] = failures
+    print(json.dumps(report, indent=2))
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
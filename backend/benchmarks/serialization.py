@@ -0,0 +1,99 @@
+"""Time building, serializing and compressing large list payloads, before and after column rows and orjson.
+
+Run from backend/:  python -m benchmarks.serialization [--users 20000] [--classes 20000] [--repeat 5]
+Seeds in-memory SQLite and, for the user and class lists, times each stage
+the way the routes used to run it (ORM entities, to_dict(), the json module)
+and the way they run it now (column rows, the JSON provider's orjson
+backend): loading the rows, building the dicts, encoding the body. The
+encoded body is then compressed with each coding compression.py offers.
+Times are the median of --repeat runs, in milliseconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ['LOG_FILE'] = ''
+
+from sqlalchemy import insert  # noqa: E402
+from config import app, db  # noqa: E402
+from models import User, WorkoutClass  # noqa: E402
+from queries import USER_COLUMNS, CLASS_COLUMNS, row_dicts  # noqa: E402
+from json_provider import FastJSONProvider, orjson  # noqa: E402
+from compression import ENCODINGS, compress  # noqa: E402
+
+LISTS = {
+    'users': (User, USER_COLUMNS, User.id),
+    'classes': (WorkoutClass, CLASS_COLUMNS, WorkoutClass.id),
+}
+
+
+def seed(users, classes):
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x', 'role': 'user'}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(WorkoutClass), [
+        {'id': i, 'name': f'Class {i}', 'date_time': now + timedelta(minutes=30 * i), 'description': 'Bring water',
+         'trainer_id': 1, 'max_capacity': 20, 'current_capacity': i % 20}
+        for i in range(1, classes + 1)
+    ])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples, result = [], None
+    for _ in range(repeat):
+        # Fresh session state, so entities are hydrated every time
+        db.session.expunge_all()
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, round(statistics.median(samples) * 1000, 1)
+
+
+def stages(load, encoder, repeat):
+    rows, load_ms = timed(load, repeat)
+    dicts, dicts_ms = timed(lambda: row_dicts(rows), repeat)
+    body, encode_ms = timed(lambda: encoder.encode({'items': dicts, 'next_cursor': None}), repeat)
+    return body, {'load_ms': load_ms, 'dicts_ms': dicts_ms, 'encode_ms': encode_ms,
+                  'total_ms': round(load_ms + dicts_ms + encode_ms, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--classes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    report = {'orjson': orjson is not None, 'lists': {}}
+    with app.app_context():
+        db.create_all()
+        seed(args.users, args.classes)
+        stdlib = FastJSONProvider(app, 'stdlib')
+        fast = FastJSONProvider(app) if orjson else stdlib
+        for name, (model, columns, key) in LISTS.items():
+            before_body, before = stages(lambda: db.session.query(model).order_by(key).all(), stdlib, args.repeat)
+            after_body, after = stages(lambda: db.session.query(*columns).order_by(key).all(), fast, args.repeat)
+            if json.loads(before_body) != json.loads(after_body):
+                raise RuntimeError(f'{name}: the bodies differ')
+            compressed = {}
+            for encoding in ENCODINGS:
+                body, compress_ms = timed(lambda: compress(after_body, encoding), args.repeat)
+                compressed[encoding] = {'bytes': len(body), 'ratio': round(len(after_body) / len(body), 1),
+                                        'compress_ms': compress_ms}
+            report['lists'][name] = {
+                'rows': db.session.query(model).count(), 'bytes': len(after_body),
+                'before': before, 'after': after,
+                'speedup': round(before['total_ms'] / after['total_ms'], 1) if after['total_ms'] else None,
+                'compressed': compressed,
+            }
+        db.drop_all()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
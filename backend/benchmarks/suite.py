@@ -0,0 +1,234 @@
+"""Drive every route over synthetic data and report throughput and p50/p95/p99 per endpoint.
+
+Run from backend/:  python -m benchmarks.suite [--scale small|medium|large] [--requests 200] [--output report.json]
+Seeds the database with benchmarks/datagen.py at the chosen scale (the same
+--users/--trainers/--classes/--series/--attendance overrides apply), then calls each
+endpoint --requests times in order through the Flask test client, with
+varying members, classes and payloads. Endpoints that hash a password, and
+the updates and deletes of the accounts they create, run at most
+--hash-requests times. Write endpoints change the data the later ones
+read, so the order is fixed. Compare two reports of the same scale to see
+what a change did; compare scales to find the endpoints that do not scale.
+"""
+import argparse
+import json
+import os
+import platform
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from flask_jwt_extended import create_access_token
+from config import app
+from benchmarks import latency_summary
+from benchmarks.datagen import PASSWORD, add_scale_arguments, scale_from_args, generate
+import routes  # noqa: F401
+
+
+class Endpoint:
+    def __init__(self, name, method, build, capped=False, after=None, revalidate=False):
+        self.name = name
+        self.method = method
+        # build(i) -> (path, user_id, role, json body or raw body)
+        self.build = build
+        # Runs at most --hash-requests times: hashes a password, or edits what one that did created
+        self.capped = capped
+        self.after = after
+        # Sends the ETag last returned for the same path and user as If-None-Match, like a browser
+        self.revalidate = revalidate
+
+
+def spread(ids, i):
+    # Walk the ids in a fixed but scattered order so caches and pages are not always warm
+    return ids[(i * 7919) % len(ids)]
+
+
+def endpoints(layout, classes):
+    admin = layout.admin_id
+    members, trainers = layout.member_ids, layout.trainer_ids
+    untrained = [m for m in members if not layout.has_trainer(m)]
+    unsubscribed = [m for m in members if not layout.has_subscriptions(m)]
+    upcoming = range(classes // 2 + 1, classes + 1)
+    today = date.today()
+    created = {'users': [], 'trainers': [], 'occurrences': []}
+
+    def keep(kind):
+        return lambda response: created[kind].append(response.get_json()['id'])
+
+    def keep_occurrences(response):
+        created['occurrences'].extend((item['series_id'], item['date_time'])
+                                      for item in response.get_json()['items'] if item['id'] is None)
+
+    def rsvp_occurrence(i):
+        series_id, at = created['occurrences'].pop()
+        return '/api/rsvp', spread(members, i), 'user', {'series_id': series_id, 'date_time': at}
+
+    def rsvp(i):
+        return '/api/rsvp', spread(members, i), 'user', {'class_id': spread(upcoming, i)}
+
+    return [
+        Endpoint('GET /', 'GET', lambda i: ('/', None, None, None)),
+        Endpoint('POST /api/register', 'POST', lambda i: (
+            '/api/register', None, None,
+            {'username': f'bench-register-{i}', 'email': f'bench-register-{i}@example.com', 'password': PASSWORD}
+        ), capped=True),
+        Endpoint('POST /api/login', 'POST', lambda i: (
+            '/api/login', None, None, {'username': f'member{spread(members, i) - members.start + 1}', 'password': PASSWORD}
+        ), capped=True),
+        Endpoint('GET /api/dashboard', 'GET', lambda i: ('/api/dashboard', spread(members, i), 'user', None)),
+        Endpoint('GET /api/dashboard (revalidated)', 'GET', lambda i: ('/api/dashboard', members[0], 'user', None),
+                 revalidate=True),
+        Endpoint('GET /api/trainer-dashboard', 'GET', lambda i: ('/api/trainer-dashboard', spread(trainers, i), 'trainer', None)),
+        Endpoint('GET /api/trainer-analytics', 'GET', lambda i: (
+            f'/api/trainer-analytics?weeks={4 + i % 49}', spread(trainers, i), 'trainer', None
+        )),
+        Endpoint('GET /api/admin-dashboard', 'GET', lambda i: ('/api/admin-dashboard', admin, 'admin', None)),
+        Endpoint('GET /api/admin/revenue', 'GET', lambda i: ('/api/admin/revenue', admin, 'admin', None)),
+        Endpoint('GET /api/admin/revenue?interval=day', 'GET', lambda i: (
+            f'/api/admin/revenue?interval=day&from={date.today() - timedelta(days=30 + i % 335)}', admin, 'admin', None
+        )),
+        Endpoint('GET /api/admin/db-pool', 'GET', lambda i: ('/api/admin/db-pool', admin, 'admin', None)),
+        Endpoint('GET /metrics', 'GET', lambda i: ('/metrics', admin, 'admin', None)),
+        Endpoint('GET /api/attendance', 'GET', lambda i: ('/api/attendance', spread(members, i), 'user', None)),
+        Endpoint('GET /api/attendance?from&to', 'GET', lambda i: (
+            f'/api/attendance?from={today - timedelta(days=90)}&to={today}', spread(members, i), 'user', None
+        )),
+        Endpoint('POST /api/attendance', 'POST', lambda i: ('/api/attendance', spread(members, i), 'user', None)),
+        Endpoint('GET /api/attendance/calendar', 'GET', lambda i: ('/api/attendance/calendar', spread(members, i), 'user', None)),
+        Endpoint('POST /api/attendance/batch', 'POST', lambda i: ('/api/attendance/batch', admin, 'admin', {'events': [
+            {'user_id': spread(members, i * 50 + n), 'timestamp': (datetime.utcnow() - timedelta(days=i % 30)).isoformat()}
+            for n in range(50)
+        ]})),
+        Endpoint('GET /api/classes', 'GET', lambda i: ('/api/classes', spread(members, i), 'user', None)),
+        Endpoint('GET /api/classes (revalidated)', 'GET', lambda i: ('/api/classes', members[0], 'user', None),
+                 revalidate=True),
+        Endpoint('GET /api/subscriptions', 'GET', lambda i: ('/api/subscriptions', spread(members, i), 'user', None)),
+        Endpoint('GET /api/classes?trainer_id&from', 'GET', lambda i: (
+            f'/api/classes?trainer_id={spread(trainers, i)}&from={datetime.utcnow().isoformat()}', spread(members, i), 'user', None
+        )),
+        Endpoint('GET /api/classes/search (week, free spots)', 'GET', lambda i: (
+            f'/api/classes/search?to={(datetime.utcnow() + timedelta(days=7)).isoformat()}&has_spots=true', spread(members, i), 'user', None
+        )),
+        Endpoint('GET /api/classes/search?name&sort', 'GET', lambda i: (
+            f'/api/classes/search?name={("Spin", "Yoga", "HIIT", "Boxing", "Pilates")[i % 5]}&sort=name', spread(members, i), 'user', None
+        )),
+        Endpoint('POST /api/classes', 'POST', lambda i: ('/api/classes', spread(trainers, i), 'trainer', {
+            'name': f'Bench class {i}', 'date_time': (datetime.utcnow() + timedelta(days=1 + i % 30)).isoformat(), 'max_capacity': 20
+        })),
+        Endpoint('GET /api/class-series', 'GET', lambda i: (
+            f'/api/class-series?trainer_id={spread(trainers, i)}', spread(members, i), 'user', None
+        )),
+        Endpoint('POST /api/class-series', 'POST', lambda i: ('/api/class-series', spread(trainers, i), 'trainer', {
+            'name': f'Bench series {i}', 'weekdays': ['MO', 'TH'], 'start_time': f'{6 + i % 14:02d}:30',
+            'starts_on': (today + timedelta(days=i % 30)).isoformat(), 'max_capacity': 20
+        })),
+        Endpoint('GET /api/timetable', 'GET', lambda i: (
+            f'/api/timetable?from={(datetime.utcnow() + timedelta(days=i % 14)).isoformat()}', spread(members, i), 'user', None
+        ), after=keep_occurrences),
+        Endpoint('POST /api/rsvp (series occurrence)', 'POST', rsvp_occurrence),
+        Endpoint('POST /api/rsvp', 'POST', rsvp),
+        Endpoint('DELETE /api/rsvp', 'DELETE', rsvp),
+        Endpoint('POST /api/subscriptions', 'POST', lambda i: ('/api/subscriptions', admin, 'admin', {
+            'plan_name': f'Bench plan {i}', 'duration_months': 1 + i % 12, 'price': 20.0
+        })),
+        Endpoint('POST /api/user-subscriptions', 'POST', lambda i: (
+            '/api/user-subscriptions', unsubscribed[i % len(unsubscribed)], 'user', {'plan_id': 1}
+        )),
+        Endpoint('POST /api/assign-trainer', 'POST', lambda i: ('/api/assign-trainer', admin, 'admin', {
+            'user_id': untrained[i % len(untrained)], 'trainer_id': spread(trainers, i)
+        })),
+        Endpoint('GET /api/health-profile', 'GET', lambda i: ('/api/health-profile', spread(members, i), 'user', None)),
+        Endpoint('PATCH /api/health-profile', 'PATCH', lambda i: (
+            '/api/health-profile', spread(members, i), 'user', {'weight_kg': 60 + i % 40, 'height_cm': 170}
+        )),
+        Endpoint('GET /api/users', 'GET', lambda i: ('/api/users', admin, 'admin', None)),
+        Endpoint('GET /api/users?role', 'GET', lambda i: ('/api/users?role=user', admin, 'admin', None)),
+        Endpoint('POST /api/users', 'POST', lambda i: ('/api/users', admin, 'admin', {
+            'username': f'bench-user-{i}', 'email': f'bench-user-{i}@example.com', 'password': PASSWORD
+        }), capped=True, after=keep('users')),
+        Endpoint('PUT /api/users', 'PUT', lambda i: ('/api/users', admin, 'admin', {
+            'id': created['users'][i % len(created['users'])], 'email': f'bench-user-{i}@example.org'
+        }), capped=True),
+        Endpoint('DELETE /api/users', 'DELETE', lambda i: ('/api/users', admin, 'admin', {'id': created['users'].pop()}), capped=True),
+        Endpoint('GET /api/trainers', 'GET', lambda i: ('/api/trainers', admin, 'admin', None)),
+        Endpoint('POST /api/trainers', 'POST', lambda i: ('/api/trainers', admin, 'admin', {
+            'username': f'bench-trainer-{i}', 'email': f'bench-trainer-{i}@example.com', 'password': PASSWORD
+        }), capped=True, after=keep('trainers')),
+        Endpoint('PUT /api/trainers', 'PUT', lambda i: ('/api/trainers', admin, 'admin', {
+            'id': created['trainers'][i % len(created['trainers'])], 'email': f'bench-trainer-{i}@example.org'
+        }), capped=True),
+        Endpoint('DELETE /api/trainers', 'DELETE', lambda i: ('/api/trainers', admin, 'admin', {'id': created['trainers'].pop()}), capped=True),
+        Endpoint('POST /api/users/import', 'POST', lambda i: ('/api/users/import?format=csv', admin, 'admin', (
+            'username,email,password\n' + ''.join(f'bench-import-{i}-{n},bench-import-{i}-{n}@example.com,{PASSWORD}\n' for n in range(10))
+        ).encode()), capped=True),
+        Endpoint('GET /api/exports/attendance', 'GET', lambda i: (
+            f'/api/exports/attendance?from={today - timedelta(days=7)}', admin, 'admin', None
+        )),
+        Endpoint('GET /api/exports/rsvps', 'GET', lambda i: ('/api/exports/rsvps?format=ndjson', admin, 'admin', None)),
+        Endpoint('GET /api/exports/subscriptions', 'GET', lambda i: ('/api/exports/subscriptions', admin, 'admin', None)),
+    ]
+
+
+def run_endpoint(client, endpoint, requests, tokens):
+    samples, statuses, etags = [], Counter(), {}
+    started = time.perf_counter()
+    for i in range(requests):
+        path, user_id, role, body = endpoint.build(i)
+        headers = {}
+        if user_id is not None:
+            if user_id not in tokens:
+                with app.app_context():
+                    tokens[user_id] = create_access_token(identity=user_id, additional_claims={'role': role, 'username': f'{role}{user_id}', 'ver': 0})
+            headers['Authorization'] = f'Bearer {tokens[user_id]}'
+        if endpoint.revalidate and (path, user_id) in etags:
+            headers['If-None-Match'] = etags[path, user_id]
+        kwargs = {'data': body} if isinstance(body, bytes) else {'json': body}
+        request_started = time.perf_counter()
+        response = client.open(path, method=endpoint.method, headers=headers, **kwargs)
+        response.get_data()
+        samples.append(time.perf_counter() - request_started)
+        statuses[response.status_code] += 1
+        if 'ETag' in response.headers:
+            etags[path, user_id] = response.headers['ETag']
+        if endpoint.after and response.status_code < 300:
+            endpoint.after(response)
+    elapsed = time.perf_counter() - started
+    return {'requests': requests, 'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'throughput_rps': round(requests / elapsed, 1), **latency_summary(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--hash-requests', type=int, default=20)
+    parser.add_argument('--only', help='run the endpoints whose name contains this text (writes still run first if listed before)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    scale = scale_from_args(args)
+    # The dashboards, counters and request paths are timed as deployed, but
+    # with password hashing in-process so login timings do not include pool start-up
+    app.config['PASSWORD_HASH_WORKERS'] = 0
+    report = {'scale': scale, 'seed': args.seed, 'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+              'python': platform.python_version(), 'endpoints': {}}
+    with app.app_context():
+        started = time.perf_counter()
+        layout, counts = generate(seed=args.seed, **scale)
+        report['seed_seconds'] = round(time.perf_counter() - started, 1)
+        report['rows'] = counts
+    # Outside the seeding app context, so every request gets its own context and session
+    client = app.test_client()
+    tokens = {}
+    for endpoint in endpoints(layout, scale['classes']):
+        if args.only and args.only not in endpoint.name:
+            continue
+        requests = min(args.requests, args.hash_requests) if endpoint.capped else args.requests
+        report['endpoints'][endpoint.name] = run_endpoint(client, endpoint, requests, tokens)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from config import app
+from models import User, SubscriptionPlan, UserSubscription, Attendance, WorkoutClass, ClassRSVP, trainer_trainee
+
+app.config.setdefault('DASHBOARD_CACHE_TTL', 30)
+app.config.setdefault('DASHBOARD_CACHE_SIZE', 10000)
+
+# Key for the part of the user dashboard that is the same for every member
+SHARED = 'shared'
+
+
+class SnapshotCache:
+    """Thread-safe LRU of dashboard snapshots with a TTL.
+
+    The cache lives in each worker process. Committed writes invalidate the
+    affected entries through the session hooks below; the TTL bounds how long
+    another worker can keep serving a snapshot it never saw invalidated.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+dashboard_cache = SnapshotCache(app.config['DASHBOARD_CACHE_TTL'], app.config['DASHBOARD_CACHE_SIZE'])
+
+
+def _affected_keys(instance):
+    if isinstance(instance, (Attendance, ClassRSVP, UserSubscription)):
+        return [instance.user_id]
+    if isinstance(instance, User):
+        # Covers profile edits, deletes and trainer assignment, which marks
+        # both ends of the trainer_trainee relationship as modified
+        return [instance.id]
+    if isinstance(instance, (WorkoutClass, SubscriptionPlan)):
+        return [SHARED]
+    return []
+
+
+def invalidate_on_commit(session, *keys):
+    # For bulk/Core statements that bypass the unit of work and its flush hook
+    session.info.setdefault('dashboard_keys', set()).update(keys)
+
+
+def changed_users(session):
+    """Ids of the users whose dashboards the session's pending changes affect."""
+    return {key for key in session.info.get('dashboard_keys', ()) if key != SHARED}
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_trainee_keys(session, flush_context, instances):
+    # A member's dashboard shows their trainer; read before the flush, while
+    # a deleted trainer's trainer_trainee rows are still there
+    trainer_ids = [instance.id for instance in list(session.dirty) + list(session.deleted)
+                   if isinstance(instance, User) and instance.role == 'trainer' and instance.id is not None]
+    if trainer_ids:
+        session.info.setdefault('dashboard_keys', set()).update(session.execute(
+            select(trainer_trainee.c.trainee_id).where(trainer_trainee.c.trainer_id.in_(trainer_ids))
+        ).scalars())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_dashboard_keys(session, flush_context):
+    keys = session.info.setdefault('dashboard_keys', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys.update(_affected_keys(instance))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_dashboard_keys(session):
+    keys = session.info.pop('dashboard_keys', None)
+    if keys:
+        dashboard_cache.invalidate(*keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_keys(session):
+    session.info.pop('dashboard_keys', None)
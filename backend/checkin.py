@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta, timezone
+from config import app, db
+from models import User, Attendance
+from cache import invalidate_on_commit
+from dialects import upsert_insert
+
+# Attendance check-ins are written with one multi-row INSERT ... ON CONFLICT
+# (user_id, date) DO NOTHING, so replaying a batch from an offline turnstile
+# is harmless and concurrent check-ins for the same member cannot collide.
+
+app.config.setdefault('CHECKIN_BATCH_LIMIT', 1000)
+# Device clocks drift; anything further ahead than this is rejected
+CLOCK_SKEW = timedelta(minutes=5)
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+
+def parse_timestamp(value):
+    # fromisoformat() only learned the 'Z' suffix in Python 3.11
+    stamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return stamp
+
+
+def upsert_checkins(rows):
+    """Insert (user_id, date) rows, skipping ones that exist; returns the set inserted."""
+    if not rows:
+        return set()
+    statement = upsert_insert(Attendance).values([{'user_id': user_id, 'date': day, 'attended': True} for user_id, day in rows])
+    statement = statement.on_conflict_do_nothing(index_elements=['user_id', 'date'])
+    inserted = db.session.execute(statement.returning(Attendance.user_id, Attendance.date)).all()
+    invalidate_on_commit(db.session, *{user_id for user_id, _ in inserted})
+    return set(inserted)
+
+
+def record_checkins(events):
+    """Validate and store a batch of {'user_id', 'timestamp'} events.
+
+    Returns one result dict per event, in order. Invalid events are reported
+    and skipped; they never fail the rest of the batch.
+    """
+    results = [None] * len(events)
+    parsed = {}
+    now = datetime.utcnow()
+    for index, event in enumerate(events):
+        try:
+            user_id = int(event['user_id'])
+            stamp = parse_timestamp(event['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            results[index] = {'status': INVALID, 'error': 'user_id and ISO 8601 timestamp required'}
+            continue
+        if stamp > now + CLOCK_SKEW:
+            results[index] = {'status': INVALID, 'error': 'Timestamp is in the future'}
+            continue
+        parsed[index] = (user_id, stamp.date())
+
+    members = {user_id for user_id, _ in parsed.values()}
+    if members:
+        members = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(members), User.role == 'user')}
+    for index, (user_id, _) in list(parsed.items()):
+        if user_id not in members:
+            results[index] = {'status': INVALID, 'error': 'Unknown member'}
+            del parsed[index]
+
+    inserted = upsert_checkins(sorted(set(parsed.values())))
+    db.session.commit()
+    for index, (user_id, day) in parsed.items():
+        # Only the first event for a (member, day) in the batch counts as the new row
+        status = CREATED if (user_id, day) in inserted else DUPLICATE
+        inserted.discard((user_id, day))
+        results[index] = {'status': status, 'user_id': user_id, 'date': day.isoformat()}
+    return results
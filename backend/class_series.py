@@ -0,0 +1,170 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from sqlalchemy import or_, select
+from config import db
+from models import ClassSeries, ClassSeriesException, WorkoutClass
+from dialects import upsert_insert
+from cache import invalidate_on_commit, SHARED
+from queries import schedule_query
+
+# Recurring classes. A ClassSeries stores the weekly rule once; its
+# occurrences are computed for whatever window is asked for and only become
+# WorkoutClass rows when somebody RSVPs to one, so a year of timetable costs
+# one row per series plus one per date it is cancelled on.
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_INTERVAL_WEEKS = 52
+MAX_CAPACITY = 1000
+# Longest window the timetable expands in one request
+MAX_WINDOW = timedelta(days=62)
+
+
+class SeriesError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_series(data):
+    """Column values for a new ClassSeries from a request body; ValueError on bad input."""
+    weekdays = data['weekdays']
+    if isinstance(weekdays, str):
+        weekdays = weekdays.split(',')
+    weekdays = [day.strip().upper() for day in weekdays]
+    if not weekdays or any(day not in WEEKDAYS for day in weekdays):
+        raise ValueError(f"weekdays must be a list of {', '.join(WEEKDAYS)}")
+    starts_on = date.fromisoformat(data['starts_on'])
+    ends_on = date.fromisoformat(data['ends_on']) if data.get('ends_on') else None
+    if ends_on is not None and ends_on < starts_on:
+        raise ValueError('ends_on must not be before starts_on')
+    interval = int(data.get('interval_weeks', 1))
+    if not 1 <= interval <= MAX_INTERVAL_WEEKS:
+        raise ValueError(f'interval_weeks must be between 1 and {MAX_INTERVAL_WEEKS}')
+    capacity = int(data.get('max_capacity', 10))
+    if not 1 <= capacity <= MAX_CAPACITY:
+        raise ValueError(f'max_capacity must be between 1 and {MAX_CAPACITY}')
+    name = data['name'].strip()
+    if not name or len(name) > 100:
+        raise ValueError('name must be 1 to 100 characters')
+    return {
+        'name': name,
+        'description': data.get('description'),
+        'weekdays': ','.join(sorted(set(weekdays), key=WEEKDAYS.index)),
+        'start_time': time.fromisoformat(data['start_time']),
+        'interval_weeks': interval,
+        'starts_on': starts_on,
+        'ends_on': ends_on,
+        'max_capacity': capacity,
+    }
+
+
+@lru_cache(maxsize=4096)
+def _expand(weekdays, start_time, interval, starts_on, ends_on, exceptions, first_day, last_day):
+    # Everything that decides the result is an argument, so a cached expansion
+    # can never outlive a change to the series or its exceptions. The window is
+    # whole days so that requests moving by seconds still share an entry
+    days = sorted(WEEKDAYS.index(day) for day in weekdays.split(','))
+    anchor = starts_on - timedelta(days=starts_on.weekday())
+    first_week = max(0, (first_day - anchor).days // 7)
+    week = first_week - first_week % interval
+    occurrences = []
+    while True:
+        monday = anchor + timedelta(weeks=week)
+        if monday > last_day or (ends_on is not None and monday > ends_on):
+            return tuple(occurrences)
+        for offset in days:
+            day = monday + timedelta(days=offset)
+            if (max(starts_on, first_day) <= day <= last_day and (ends_on is None or day <= ends_on)
+                    and day not in exceptions):
+                occurrences.append(datetime.combine(day, start_time))
+        week += interval
+
+
+def occurrences(series, start, end, exceptions=()):
+    """Datetimes of series' occurrences in [start, end), skipping exception dates."""
+    first_day, last_day = start.date(), end.date()
+    expanded = _expand(series.weekdays, series.start_time, series.interval_weeks, series.starts_on,
+                       series.ends_on, frozenset(day for day in exceptions if first_day <= day <= last_day),
+                       first_day, last_day)
+    return [at for at in expanded if start <= at < end]
+
+
+def timetable(session, start, end, trainer_id=None):
+    """Every class in [start, end): one-off and materialized rows plus the
+    not yet materialized occurrences of the series running in the window."""
+    if end <= start or end - start > MAX_WINDOW:
+        raise ValueError(f'Window must be 1 second to {MAX_WINDOW.days} days')
+    series_query = session.query(ClassSeries).filter(
+        ClassSeries.starts_on <= end.date(),
+        or_(ClassSeries.ends_on.is_(None), ClassSeries.ends_on >= start.date())
+    )
+    if trainer_id:
+        series_query = series_query.filter(ClassSeries.trainer_id == trainer_id)
+    series = series_query.all()
+    exceptions = {}
+    if series:
+        for series_id, day in session.query(ClassSeriesException.series_id, ClassSeriesException.date).filter(
+                ClassSeriesException.series_id.in_([s.id for s in series]),
+                ClassSeriesException.date >= start.date(),
+                ClassSeriesException.date <= end.date()):
+            exceptions.setdefault(series_id, set()).add(day)
+    rows = schedule_query(session, start=start, end=end, trainer_id=trainer_id).all()
+    items = [row.to_dict() for row in rows]
+    materialized = {(row.series_id, row.date_time) for row in rows if row.series_id}
+    for s in series:
+        for at in occurrences(s, start, end, exceptions.get(s.id, ())):
+            if (s.id, at) not in materialized:
+                items.append({
+                    'id': None,
+                    'name': s.name,
+                    'date_time': at.isoformat(),
+                    'description': s.description,
+                    'trainer_id': s.trainer_id,
+                    'max_capacity': s.max_capacity,
+                    'current_capacity': 0,
+                    'series_id': s.id
+                })
+    items.sort(key=lambda item: (item['date_time'], item['id'] or 0))
+    return items
+
+
+def materialize(series_id, at):
+    """Id of the WorkoutClass for one occurrence of a series, creating it if needed.
+
+    Raises SeriesError(404) when the series does not run at `at`. Concurrent
+    first RSVPs insert the same row; the unique (series_id, date_time) index
+    keeps one and the others read it back.
+    """
+    series = db.session.get(ClassSeries, series_id)
+    exceptions = {e.date for e in series.exceptions} if series else set()
+    if not series or not occurrences(series, at, at + timedelta(seconds=1), exceptions):
+        raise SeriesError('Class not found', 404)
+    db.session.execute(
+        upsert_insert(WorkoutClass).values(
+            series_id=series.id, trainer_id=series.trainer_id, name=series.name, description=series.description,
+            date_time=at, max_capacity=series.max_capacity, current_capacity=0
+        ).on_conflict_do_nothing(index_elements=['series_id', 'date_time'])
+    )
+    # Core insert: the session's flush hook never sees it
+    invalidate_on_commit(db.session, SHARED)
+    return db.session.execute(
+        select(WorkoutClass.id).where(WorkoutClass.series_id == series.id, WorkoutClass.date_time == at)
+    ).scalar_one()
+
+
+def add_exception(series, day):
+    """Cancel one date of a series; refused once that occurrence has a row (and so RSVPs)."""
+    if day < series.starts_on or (series.ends_on is not None and day > series.ends_on):
+        raise SeriesError('Date is outside the series')
+    start = datetime.combine(day, time.min)
+    if not occurrences(series, start, start + timedelta(days=1)):
+        raise SeriesError('The series does not run on that date')
+    taken = db.session.query(WorkoutClass.id).filter(
+        WorkoutClass.series_id == series.id,
+        WorkoutClass.date_time == datetime.combine(day, series.start_time)
+    ).first()
+    if taken:
+        raise SeriesError('Members have already RSVP\'d for that date', 409)
+    if not db.session.get(ClassSeriesException, (series.id, day)):
+        db.session.add(ClassSeriesException(series_id=series.id, date=day))
+    db.session.commit()
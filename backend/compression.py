@@ -0,0 +1,72 @@
+import gzip
+import os
+from flask import request
+from config import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression, negotiated from Accept-Encoding: brotli when the
+# client takes it and the Brotli package is installed, gzip otherwise.
+# Bodies under COMPRESS_MIN_SIZE bytes go out as they are (the headers would
+# cost more than they save), as do streamed exports, which are sent while
+# they are read, and anything already encoded or not text.
+
+app.config.setdefault('COMPRESS_ENABLED', os.getenv('COMPRESS_ENABLED', 'True') == 'True')
+app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', 1024)))
+# Low levels: most of the ratio of the highest at a fraction of the CPU per request
+app.config.setdefault('COMPRESS_GZIP_LEVEL', int(os.getenv('COMPRESS_GZIP_LEVEL', 5)))
+app.config.setdefault('COMPRESS_BROTLI_QUALITY', int(os.getenv('COMPRESS_BROTLI_QUALITY', 4)))
+
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/')
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    """The coding to use for a request's Accept-Encoding header value, or None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    # Ours in order of preference, at the client's highest quality; q=0 refuses
+    best = max(ENCODINGS, key=lambda coding: accepted.get(coding, accepted.get('*', 0.0)))
+    return best if accepted.get(best, accepted.get('*', 0.0)) > 0 else None
+
+
+def compress(body, encoding):
+    """body bytes in encoding, as chosen by choose_encoding."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    # mtime=0 keeps the output the same for the same body
+    return gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def compress_response(response):
+    if not app.config['COMPRESS_ENABLED'] or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers:
+        return response
+    if not (response.content_type or '').startswith(COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None or (response.calculate_content_length() or 0) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def install_compression():
+    # Registered last, so it runs before the other after_request hooks and Server-Timing includes it
+    app.after_request(compress_response)
@@ -0,0 +1,270 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from inspect import iscoroutinefunction
+from flask import g, request, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, func, inspect, literal, select, union_all
+from sqlalchemy.orm import Session
+from config import app, db
+from cache import changed_users
+from dialects import upsert_insert
+from models import StatCounter, WorkoutClass
+
+# Conditional GETs. Every committed write bumps a version counter per shared
+# table it changed rows of (a 'version:<table>' row in stat_counters, with the
+# time of the change), and one per member whose own rows it touched
+# ('version:user:<id>', from the dashboard cache's invalidation keys), in the
+# writing transaction. A read endpoint's ETag is a digest of the versions it
+# reads, so checking If-None-Match costs one SELECT of a few counter rows: a
+# match returns 304 before any row is loaded or any JSON is built. Endpoints
+# whose content also moves with the clock (upcoming classes, days left) roll
+# their tag over every ETAG_CLOCK_BUCKET seconds as well.
+#
+# Tables written row by row from hot paths are versioned by their rows
+# instead (STAMPED): each row carries an updated_at, and the version is the
+# latest of them plus a counter bumped on deletes only. An RSVP then moves
+# the class lists' tags by updating the class row it already locks, and
+# RSVPs for different classes share no counter row.
+
+app.config.setdefault('ETAG_CLOCK_BUCKET', int(os.getenv('ETAG_CLOCK_BUCKET', 60)))
+# Changes every tag on deploy, so a client never keeps a body a new release would render differently
+app.config.setdefault('ETAG_SALT', os.getenv('ETAG_SALT', os.getenv('RENDER_GIT_COMMIT', '')))
+# Row stamps come from the writers' clocks, taken before their commits, so a
+# write can land with a stamp older than one already read. Until the latest
+# stamp is this old the version carries the time as well, so no tag handed
+# out meanwhile is ever reused
+app.config.setdefault('ETAG_SETTLE_SECONDS', float(os.getenv('ETAG_SETTLE_SECONDS', 2)))
+
+USERS = 'users'
+PLANS = 'subscription_plans'
+CLASSES = 'workout_classes'
+CLASS_DAY_STATS = 'class_day_stats'
+SERIES_REGULARS = 'series_regulars'
+REVENUE_DAYS = 'revenue_days'
+REVENUE_MONTHS = 'revenue_months'
+# Tables read whole by some endpoint. A member's own subscriptions,
+# attendance and RSVPs are only read through OWN, so writing them never moves
+# another member's tags or contends on a shared counter
+VERSIONED = (USERS, PLANS, CLASSES, CLASS_DAY_STATS, SERIES_REGULARS, REVENUE_DAYS, REVENUE_MONTHS)
+# Versioned by their rows' latest updated_at; their counters count deletes
+STAMPED = {CLASSES: WorkoutClass.updated_at}
+# Columns no endpoint reading the whole table shows. Updating only these (a
+# rehash at login, a membership change, which move the member's OWN version)
+# leaves the table's version alone
+UNLISTED = {USERS: frozenset({'password_hash', 'token_version', 'current_subscription_id', 'active_until'})}
+# Stands for the requesting user's own version in an endpoint's tables
+OWN = 'own'
+
+counters_table = StatCounter.__table__
+
+
+def version_counter(table):
+    return f'version:{table}'
+
+
+def user_version_counter(user_id):
+    return f'version:user:{user_id}'
+
+
+def read_versions(session, tables, user_id=None):
+    """{table: (version, changed_at)}; (0, None) for one never written since versions began.
+
+    OWN, if among tables, is read for user_id. STAMPED tables' latest rows
+    are read in the same statement as the counters.
+    """
+    names = {user_version_counter(user_id) if table == OWN else version_counter(table): table for table in tables}
+    stamped = [table for table in tables if table in STAMPED]
+    statement = select(StatCounter.name, StatCounter.value, StatCounter.updated_at).where(
+        StatCounter.name.in_(list(names)))
+    if stamped:
+        statement = union_all(statement, *(select(literal(table), literal(0), func.max(STAMPED[table]))
+                                           for table in stamped))
+    versions = {table: (0, None) for table in tables}
+    latest = {}
+    for name, value, updated_at in session.execute(statement):
+        if name in names:
+            versions[names[name]] = (value, updated_at)
+        else:
+            latest[name] = updated_at
+    now = datetime.utcnow()
+    for table in stamped:
+        deletes, deleted_at = versions[table]
+        stamp = latest.get(table)
+        if stamp is not None and now - stamp < timedelta(seconds=app.config['ETAG_SETTLE_SECONDS']):
+            versions[table] = ((deletes, stamp, now), now)
+        else:
+            changed = [changed_at for changed_at in (deleted_at, stamp) if changed_at is not None]
+            versions[table] = ((deletes, stamp), max(changed) if changed else None)
+    return versions
+
+
+def _bump(connection, names):
+    # One statement with its rows in name order, so concurrent commits lock
+    # the counters they share in the same order
+    now = datetime.utcnow()
+    statement = upsert_insert(StatCounter).values([{'name': name, 'value': 1, 'updated_at': now} for name in sorted(names)])
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': counters_table.c.value + 1, 'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def _changed(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _moves_version(table, deleting=False, columns=None):
+    # columns: those an update sets, when known
+    if table not in VERSIONED:
+        return False
+    if table in STAMPED:
+        # Inserts and updates stamp their rows
+        return deleting
+    return columns is None or bool(set(columns) - UNLISTED.get(table, frozenset()))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statements(orm_execute_state):
+    # Bulk and Core DML run through the session: RSVP capacity updates, bulk inserts
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = state.statement.table.name
+    bulk = isinstance(state.parameters, list)
+    # An update by primary key sets the columns its rows carry
+    columns = {key for row in state.parameters for key in row} - {'id'} if state.is_update and bulk else None
+    if not _moves_version(table, state.is_delete, columns):
+        return None
+    if state.is_insert or bulk:
+        _changed(state.session).add(table)
+        return None
+    result = state.invoke_statement()
+    # One that matched no rows changed nothing
+    if result.rowcount != 0:
+        _changed(state.session).add(table)
+    return result
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    changed = _changed(session)
+    for instance in session.new:
+        table = getattr(instance, '__tablename__', None)
+        if _moves_version(table):
+            changed.add(table)
+    for instance in session.deleted:
+        table = getattr(instance, '__tablename__', None)
+        if _moves_version(table, deleting=True):
+            changed.add(table)
+    for instance in session.dirty:
+        table = getattr(instance, '__tablename__', None)
+        # Attribute history still holds what this flush wrote
+        if table in VERSIONED and _moves_version(table, columns={
+                attr.key for attr in inspect(instance).attrs if attr.history.has_changes()}):
+            changed.add(table)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_before_commit(session):
+    # Once per transaction, at its end: the counter rows stay locked only
+    # while the commit runs. The flush first, so its changes are counted here
+    session.flush()
+    names = {version_counter(table) for table in session.info.pop('changed_tables', ())}
+    names.update(user_version_counter(user_id) for user_id in changed_users(session))
+    if names:
+        _bump(session.connection(), names)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset(session):
+    session.info.pop('changed_tables', None)
+
+
+def validators(versions, *parts, clock=False):
+    """(weak ETag, Last-Modified) for table versions plus anything else the body depends on."""
+    changed = [changed_at for _, changed_at in versions.values() if changed_at is not None]
+    if clock:
+        bucket = app.config['ETAG_CLOCK_BUCKET']
+        started = int(time.time()) // bucket * bucket
+        parts += (started,)
+        changed.append(datetime.utcfromtimestamp(started))
+    key = repr((app.config['ETAG_SALT'], sorted((t, v) for t, (v, _) in versions.items()), parts))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"', max(changed) if changed else None
+
+
+def not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """True when the client's copy is current. If-Modified-Since only counts without If-None-Match."""
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison: W/"x" and "x" match
+        return '*' in tags or any(tag.replace('W/', '', 1) == etag.replace('W/', '', 1) for tag in tags)
+    if if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def cache_headers(etag, last_modified, per_user):
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache' if per_user else 'no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    if per_user:
+        headers['Vary'] = 'Authorization'
+    return headers
+
+
+def _revalidate(per_user, clock):
+    # (304 response or None, ETag, Last-Modified) for the current request and g.versions
+    parts = (request.full_path, get_jwt_identity() if per_user else None)
+    etag, last_modified = validators(g.versions, *parts, clock=clock)
+    fresh = not_modified(etag, last_modified, request.headers.get('If-None-Match'), request.if_modified_since)
+    return make_response('', 304) if fresh else None, etag, last_modified
+
+
+def _tag(response, etag, last_modified, per_user):
+    response = make_response(response)
+    if response.status_code in (200, 304):
+        headers = cache_headers(etag, last_modified, per_user)
+        # Added to, not replaced: CORS varies on Origin
+        for value in headers.pop('Vary', '').split(','):
+            if value:
+                response.vary.add(value)
+        response.headers.update(headers)
+    return response
+
+
+def conditional(*tables, per_user=False, clock=False):
+    """Answer a GET with 304 when nothing it reads has changed; otherwise run
+    the view and tag its 200. The versions are left in g.versions for views
+    that validate caches against them. Goes under role_required/jwt_required.
+
+    Coroutine views (asgi.py) read the versions through g.async_session.
+    """
+    def owner():
+        return get_jwt_identity() if OWN in tables else None
+
+    def decorator(fn):
+        if iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                g.versions = await g.async_session.run_sync(read_versions, tables, owner())
+                response, etag, last_modified = _revalidate(per_user, clock)
+                if response is None:
+                    response = await fn(*args, **kwargs)
+                return _tag(response, etag, last_modified, per_user)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return fn(*args, **kwargs)
+            g.versions = read_versions(db.session, tables, owner())
+            response, etag, last_modified = _revalidate(per_user, clock)
+            if response is None:
+                response = fn(*args, **kwargs)
+            return _tag(response, etag, last_modified, per_user)
+        return wrapper
+    return decorator
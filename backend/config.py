@@ -5,25 +5,33 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from dotenv import load_dotenv
+from db_pool import engine_options
+from json_provider import FastJSONProvider
 import os
 
 load_dotenv()
 
 app = Flask(__name__)
+# orjson when installed (json_provider.py); JSON_BACKEND=stdlib for the json module
+app.json = FastJSONProvider(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing, pre-ping, recycle and statement timeout from DB_* variables (db_pool.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
 
-# Mail config-To be used in a later version
+# Mail config, used by the outbox worker (outbox.py)
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT'))
 app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS') == 'True'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME'))
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "https://bespoke-marzipan-63d200.netlify.app", "https://gym-management-system2.netlify.app"]}})
+CORS_ORIGINS = ["http://localhost:3000", "https://bespoke-marzipan-63d200.netlify.app", "https://gym-management-system2.netlify.app"]
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 jwt = JWTManager(app)
 mail = Mail(app)
\ No newline at end of file
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool.impl import AsyncAdaptedQueuePool
+from worker_stats import Publisher
+
+# Connection pool settings from the environment, plus per-worker pool
+# metrics. Every worker publishes a snapshot of its pools (worker_stats.py),
+# so the admin diagnostics endpoint reports all the workers on the instance
+# whichever one serves the request.
+#
+#   DB_POOL_SIZE          connections kept open per worker (5)
+#   DB_MAX_OVERFLOW       extra connections allowed under load (10)
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection (30)
+#   DB_POOL_RECYCLE       seconds before a connection is replaced (1800)
+#   DB_POOL_PRE_PING      test connections on checkout (True)
+#   DB_POOL_USE_LIFO      reuse the most recent connection first (False)
+#   DB_STATEMENT_TIMEOUT  Postgres statement_timeout in ms, 0 disables (30000)
+
+STATEMENT_TIMEOUT_SQLSTATE = '57014'
+WAIT_SAMPLES = 1000
+
+
+def pool_settings():
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'True') == 'True',
+        'pool_use_lifo': os.getenv('DB_POOL_USE_LIFO', 'False') == 'True',
+        'statement_timeout_ms': int(os.getenv('DB_STATEMENT_TIMEOUT', 30000)),
+    }
+
+
+def engine_options(url, asynchronous=False):
+    """create_engine() keyword arguments for url from the DB_* settings."""
+    if not url:
+        return {}
+    settings = pool_settings()
+    options = {'pool_pre_ping': settings['pool_pre_ping'], 'pool_recycle': settings['pool_recycle']}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # A single shared connection; there is no pool to size
+        return options
+    options.update(
+        poolclass=MeteredAsyncQueuePool if asynchronous else MeteredQueuePool,
+        pool_size=settings['pool_size'],
+        max_overflow=settings['max_overflow'],
+        pool_timeout=settings['pool_timeout'],
+        pool_use_lifo=settings['pool_use_lifo'],
+    )
+    timeout = settings['statement_timeout_ms']
+    if timeout and url.get_backend_name() == 'postgresql':
+        if asynchronous:
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.pool = None
+        self.checkouts = 0
+        self.pool_timeouts = 0
+        self.statement_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.waits.append(seconds)
+
+    def count(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            stats = {
+                'checkouts': self.checkouts,
+                'pool_timeouts': self.pool_timeouts,
+                'statement_timeouts': self.statement_timeouts,
+                'wait_ms': {
+                    'avg': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    'p95': round(waits[int(0.95 * (len(waits) - 1))] * 1000, 3) if waits else 0.0,
+                    'max': round(self.wait_max * 1000, 3),
+                },
+            }
+        pool = self.pool
+        if pool is not None:
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(),
+                         overflow=max(0, pool.overflow()))
+        return stats
+
+
+metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def pool_metrics(label):
+    with _metrics_lock:
+        return metrics.setdefault(label, PoolMetrics())
+
+
+def worker_snapshot():
+    return {'pid': os.getpid(), 'updated_at': time.time(),
+            'pools': {label: pool.snapshot() for label, pool in metrics.items()}}
+
+
+publisher = Publisher('db-pool', worker_snapshot)
+
+
+def worker_snapshots():
+    return publisher.collect()
+
+
+class _Metered:
+    """Times every connection checkout and counts pool timeouts."""
+
+    label = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # recreate() after a dispose builds a new pool; keep reporting the live one
+        pool_metrics(self.label).pool = self
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics(self.label).count('pool_timeouts')
+            logging.warning(f"Timed out waiting for a {self.label} database connection ({self.status()})")
+            raise
+        pool_metrics(self.label).record_wait(time.perf_counter() - started)
+        return record
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        publisher.publish()
+
+
+class MeteredQueuePool(_Metered, QueuePool):
+    label = 'sync'
+
+
+class MeteredAsyncQueuePool(_Metered, AsyncAdaptedQueuePool):
+    label = 'async'
+
+
+@event.listens_for(Engine, 'handle_error')
+def _count_statement_timeouts(context):
+    original = context.original_exception
+    code = getattr(original, 'pgcode', None) or getattr(original, 'sqlstate', None)
+    if code == STATEMENT_TIMEOUT_SQLSTATE:
+        label = getattr(context.engine.pool, 'label', None) if context.engine else None
+        if label:
+            pool_metrics(label).count('statement_timeouts')
+        logging.warning(f"Statement timed out: {str(context.statement)[:200]}")
@@ -0,0 +1,28 @@
+import sqlite3
+from sqlalchemy import Date, cast, func
+from sqlalchemy.dialects import postgresql, sqlite
+from config import db
+
+
+def upsert_insert(model):
+    """INSERT construct with on_conflict_do_nothing() for the configured database."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f'Upserts are not supported on {dialect}')
+
+
+def date_of(column):
+    """The date part of a DateTime column, comparable with Date columns on the configured database."""
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite keeps both as text; CAST would turn '2024-01-01 10:00:00' into 2024
+        return func.date(column)
+    return cast(column, Date)
+
+
+def supports_window_functions():
+    if db.engine.dialect.name == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 25)
+    return True
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from config import app, db
+from models import User, SubscriptionPlan, UserSubscription, Attendance, WorkoutClass, ClassRSVP
+
+# Admin data exports. Each dataset is a plain column select streamed with
+# yield_per (a server-side cursor on Postgres) and serialized chunk by chunk,
+# so a worker holds one chunk of tuples at a time and never builds ORM objects.
+
+app.config.setdefault('EXPORT_CHUNK_SIZE', 2000)
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def _attendance():
+    return (select(Attendance.id, Attendance.user_id, User.username, User.role, Attendance.date, Attendance.attended)
+            .join(User, User.id == Attendance.user_id)), Attendance.date, Attendance.id
+
+
+def _rsvps():
+    return (select(ClassRSVP.id, ClassRSVP.user_id, User.username, User.role, ClassRSVP.class_id,
+                   WorkoutClass.name.label('class_name'), WorkoutClass.date_time, ClassRSVP.attending)
+            .join(User, User.id == ClassRSVP.user_id)
+            .join(WorkoutClass, WorkoutClass.id == ClassRSVP.class_id)), WorkoutClass.date_time, ClassRSVP.id
+
+
+def _subscriptions():
+    return (select(UserSubscription.id, UserSubscription.user_id, User.username, User.role, UserSubscription.plan_id,
+                   SubscriptionPlan.name.label('plan_name'), SubscriptionPlan.price,
+                   UserSubscription.start_date, UserSubscription.end_date)
+            .join(User, User.id == UserSubscription.user_id)
+            .join(SubscriptionPlan, SubscriptionPlan.id == UserSubscription.plan_id)), UserSubscription.start_date, UserSubscription.id
+
+
+DATASETS = {'attendance': _attendance, 'rsvps': _rsvps, 'subscriptions': _subscriptions}
+
+
+def _bound(column, value):
+    if column.type.python_type is date:
+        return date.fromisoformat(value[:10])
+    return datetime.fromisoformat(value)
+
+
+def export_query(dataset, start=None, end=None, role=None):
+    """Select for dataset filtered on its date column [start, end) and member role."""
+    statement, date_column, key = DATASETS[dataset]()
+    if start:
+        statement = statement.where(date_column >= _bound(date_column, start))
+    if end:
+        statement = statement.where(date_column < _bound(date_column, end))
+    if role:
+        statement = statement.where(User.role == role)
+    return statement.order_by(key)
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def stream_export(statement, fmt):
+    """Yield the export as text chunks of about EXPORT_CHUNK_SIZE rows."""
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=chunk_size))
+    columns = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    for rows in result.partitions():
+        for row in rows:
+            values = [_value(value) for value in row]
+            if writer:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import app
+
+# Password hashing runs the KDF in a small process pool so a burst of logins
+# cannot occupy every request thread with hashing. The pool is created lazily
+# in each gunicorn worker (after fork) and the number of hashes in flight is
+# bounded; beyond that callers get HashingBusy rather than an ever-growing queue.
+# Its processes are started by a fork server (or spawned), never forked from
+# a worker whose other threads (the log listener, request threads) may hold
+# locks at the time.
+
+_workers_default = max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY', 1)))
+app.config.setdefault('PASSWORD_HASH_METHOD', os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'))
+app.config.setdefault('PASSWORD_HASH_WORKERS', int(os.getenv('PASSWORD_HASH_WORKERS', _workers_default)))
+# Keep this below the request threads per worker so a storm cannot hold them all
+app.config.setdefault('PASSWORD_HASH_QUEUE', int(os.getenv('PASSWORD_HASH_QUEUE', 2 * app.config['PASSWORD_HASH_WORKERS'])))
+app.config.setdefault('PASSWORD_HASH_NICE', int(os.getenv('PASSWORD_HASH_NICE', 5)))
+app.config.setdefault('PASSWORD_HASH_TIMEOUT', float(os.getenv('PASSWORD_HASH_TIMEOUT', 10)))
+# Pool workers a bulk import may occupy at once; the rest stay free for logins
+app.config.setdefault('PASSWORD_HASH_IMPORT_WORKERS', int(os.getenv(
+    'PASSWORD_HASH_IMPORT_WORKERS', max(1, app.config['PASSWORD_HASH_WORKERS'] - 1))))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE'])
+_import_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_IMPORT_WORKERS'])
+_method_prefix = None
+_start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork is unusable in the child
+        if _pool is None or _pool_pid != os.getpid():
+            # Lower priority so request handling wins the CPU when both compete
+            _pool = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                        mp_context=multiprocessing.get_context(_start_method),
+                                        initializer=os.nice, initargs=(app.config['PASSWORD_HASH_NICE'],))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    if app.config['PASSWORD_HASH_WORKERS'] < 1:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy('Password hashing queue is full')
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is held until the hash is done, not until the caller gives
+    # up: a hash still running after a timeout keeps counting against the bound
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        # Still queued: dropped, which releases the slot now
+        future.cancel()
+        raise HashingBusy('Password hashing timed out')
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when password_hash was made with other KDF parameters than configured."""
+    global _method_prefix
+    if _method_prefix is None:
+        # 'scrypt' and 'scrypt:32768:8:1' name the same parameters; let
+        # Werkzeug expand the configured method once to compare like for like
+        _method_prefix = generate_password_hash('', app.config['PASSWORD_HASH_METHOD']).split('$', 1)[0]
+    return password_hash.split('$', 1)[0] != _method_prefix
+
+
+def hash_passwords(passwords):
+    """Hash a batch of passwords, keeping their order (bulk imports).
+
+    Passwords are submitted one at a time, with at most PASSWORD_HASH_IMPORT_WORKERS
+    in the pool, so a login or registration queues behind one import hash at
+    most rather than behind the whole batch.
+    """
+    method = app.config['PASSWORD_HASH_METHOD']
+    if app.config['PASSWORD_HASH_WORKERS'] < 1:
+        return [generate_password_hash(password, method) for password in passwords]
+    pool = _get_pool()
+    futures = []
+    for password in passwords:
+        _import_slots.acquire()
+        try:
+            future = pool.submit(generate_password_hash, password, method)
+        except BaseException:
+            _import_slots.release()
+            raise
+        future.add_done_callback(lambda _: _import_slots.release())
+        futures.append(future)
+    return [future.result() for future in futures]
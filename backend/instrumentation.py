@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import app
+from worker_stats import Publisher
+
+# Per-route request metrics. Request hooks time every request; cursor events
+# count the SQL statements it runs and the time spent in them. Totals are kept
+# as Prometheus histograms per worker, merged across the instance's workers
+# for GET /metrics, and each response carries a Server-Timing header.
+# Statements slower than SLOW_QUERY_MS are counted and a SLOW_QUERY_SAMPLE_RATE
+# share of them logged with literals and parameter lists normalized away.
+
+app.config.setdefault('INSTRUMENTATION_ENABLED', os.getenv('INSTRUMENTATION_ENABLED', 'True') == 'True')
+app.config.setdefault('SLOW_QUERY_MS', float(os.getenv('SLOW_QUERY_MS', 250)))
+app.config.setdefault('SLOW_QUERY_SAMPLE_RATE', float(os.getenv('SLOW_QUERY_SAMPLE_RATE', 0.1)))
+# GET /metrics takes `Authorization: Bearer <METRICS_TOKEN>` or an admin's
+# login token; METRICS_PUBLIC=True opens it to anyone (a private network)
+app.config.setdefault('METRICS_TOKEN', os.getenv('METRICS_TOKEN'))
+app.config.setdefault('METRICS_PUBLIC', os.getenv('METRICS_PUBLIC', 'False') == 'True')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        # [count per bucket..., count above the last bucket, sum]
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def render(self, series):
+        lines = []
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labels, labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {values[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = [self.series.get(labels, [0])[0] + amount]
+
+    def render(self, series):
+        return [f'{self.name}{_labels(self.labels, labels)} {values[0]}' for labels, values in sorted(series.items())]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route.', ('route', 'method'), LATENCY_BUCKETS)
+REQUESTS = Counter('http_requests_total', 'Requests by route and status code.', ('route', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements per request by route.', ('route',), STATEMENT_BUCKETS)
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Time in SQL per request by route.', ('route',), LATENCY_BUCKETS)
+SLOW_QUERIES = Counter('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS by route.', ('route',))
+METRICS = (REQUEST_LATENCY, REQUESTS, REQUEST_STATEMENTS, REQUEST_DB_TIME, SLOW_QUERIES)
+_lock = threading.Lock()
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'db_time', 'slow', 'route')
+
+    def __init__(self, route):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.slow = 0
+        self.route = route
+
+
+# Set for the duration of a request; a ContextVar so it follows the request
+# into threads' own contexts and into the async routes' run_sync calls
+_current = ContextVar('request_stats', default=None)
+
+
+def begin_request(route):
+    stats = RequestStats(route)
+    _current.set(stats)
+    return stats
+
+
+def end_request(stats, method, status):
+    """Record a finished request; returns its Server-Timing header value."""
+    _current.set(None)
+    elapsed = time.perf_counter() - stats.started
+    route = stats.route
+    with _lock:
+        REQUEST_LATENCY.observe((route, method), elapsed)
+        REQUESTS.inc((route, method, str(status)))
+        REQUEST_STATEMENTS.observe((route,), stats.statements)
+        REQUEST_DB_TIME.observe((route,), stats.db_time)
+        if stats.slow:
+            SLOW_QUERIES.inc((route,), stats.slow)
+    publisher.publish()
+    return f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries", app;dur={elapsed * 1000:.1f}'
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![$\w])\d+(?:\.\d+)?\b")
+_PARAMETER = r'(?:\?|%\(\w+\)s|%s|:\w+|\$\d+)(?:::\w+)?'
+_LISTS = re.compile(rf'\(\s*{_PARAMETER}(?:\s*,\s*{_PARAMETER})+\s*\)')
+_ROWS = re.compile(r'(\(\?, \.\.\.\))(?:\s*,\s*\(\?, \.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Statement shape for grouping: literals, IN lists and VALUES rows collapsed."""
+    statement = _LITERALS.sub('?', statement)
+    statement = _LISTS.sub('(?, ...)', statement)
+    statement = _ROWS.sub(r'\1, ...', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += elapsed
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        if stats is not None:
+            stats.slow += 1
+        if random.random() < app.config['SLOW_QUERY_SAMPLE_RATE']:
+            route = stats.route if stats is not None else 'no request'
+            logging.warning(f"Slow query ({elapsed * 1000:.1f} ms) on {route}: {normalize_sql(statement)[:500]}")
+
+
+def _snapshot():
+    with _lock:
+        return {'pid': os.getpid(), 'metrics': {
+            metric.name: {json.dumps(labels): list(values) for labels, values in metric.series.items()}
+            for metric in METRICS
+        }}
+
+
+publisher = Publisher('metrics', _snapshot)
+
+
+def render_metrics():
+    """Prometheus text exposition of the metrics summed over this instance's workers."""
+    merged = {metric.name: {} for metric in METRICS}
+    for snapshot in publisher.collect():
+        for name, series in snapshot['metrics'].items():
+            target = merged.setdefault(name, {})
+            for labels, values in series.items():
+                labels = tuple(json.loads(labels))
+                if labels in target:
+                    target[labels] = [a + b for a, b in zip(target[labels], values)]
+                else:
+                    target[labels] = values
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render(merged[metric.name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _begin_flask_request():
+    g.request_stats = begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+
+def _end_flask_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is not None:
+        response.headers['Server-Timing'] = end_request(stats, request.method, response.status_code)
+    return response
+
+
+if app.config['INSTRUMENTATION_ENABLED']:
+    app.before_request(_begin_flask_request)
+    app.after_request(_end_flask_request)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
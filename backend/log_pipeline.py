@@ -0,0 +1,193 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, request
+from config import app
+
+# Request threads only put records on an in-memory queue; a listener thread
+# per worker formats them as JSON lines and writes them to stdout and a
+# size-rotated file. A slow disk or a stalled stdout pipe therefore costs the
+# request nothing: once LOG_QUEUE_SIZE records are waiting, new ones are
+# dropped and counted instead of blocking. LOG_SAMPLE_RATES keeps a share of
+# the chatty levels (e.g. "INFO=0.1"); warnings and errors are always kept
+# unless listed. Every record carries the id of the request that logged it,
+# taken from an incoming X-Request-ID or generated, and echoed back.
+
+app.config.setdefault('LOG_LEVEL', os.getenv('LOG_LEVEL', 'INFO'))
+# "{pid}" gives each worker its own file: rotation renames files, which is
+# only safe when one process writes them
+app.config.setdefault('LOG_FILE', os.getenv('LOG_FILE', 'backend.log'))
+app.config.setdefault('LOG_MAX_BYTES', int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)))
+app.config.setdefault('LOG_BACKUP_COUNT', int(os.getenv('LOG_BACKUP_COUNT', 5)))
+app.config.setdefault('LOG_QUEUE_SIZE', int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+app.config.setdefault('LOG_SAMPLE_RATES', os.getenv('LOG_SAMPLE_RATES', ''))
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+request_id = ContextVar('request_id', default=None)
+
+
+def new_request_id(incoming=None):
+    """Use the caller's request id when it is sane, else make one; set for this context."""
+    value = incoming if incoming and _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    request_id.set(value)
+    return value
+
+
+def parse_sample_rates(spec):
+    """"INFO=0.1,DEBUG=0" -> {20: 0.1, 10: 0.0}"""
+    rates = {}
+    for part in filter(None, (item.strip() for item in spec.split(','))):
+        name, _, rate = part.partition('=')
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f'Unknown log level in LOG_SAMPLE_RATES: {name}')
+        rates[level] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class RequestQueueHandler(QueueHandler):
+    """Enqueues without blocking, stamping the record with the current request id."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Done on the request thread: the listener thread has neither the
+        # request's context nor safe access to the (mutable) log arguments
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped and not self._put(logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': f'Dropped {dropped} log records: queue full', 'request_id': None
+        })):
+            with self._lock:
+                self.dropped += dropped
+        if not self._put(record):
+            with self._lock:
+                self.dropped += 1
+
+    def _put(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def default_handlers():
+    formatter = JSONFormatter()
+    console = logging.StreamHandler(sys.stdout)
+    handlers = [console]
+    if app.config['LOG_FILE']:
+        path = app.config['LOG_FILE'].format(pid=os.getpid())
+        handlers.append(RotatingFileHandler(path, maxBytes=app.config['LOG_MAX_BYTES'],
+                                            backupCount=app.config['LOG_BACKUP_COUNT'], encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+_listener = None
+
+
+def setup_logging(handlers=None):
+    """Route the root logger through the queue to `handlers` (stdout and LOG_FILE by default)."""
+    global _listener
+    shutdown_logging()
+    log_queue = queue.Queue(app.config['LOG_QUEUE_SIZE'])
+    queue_handler = RequestQueueHandler(log_queue)
+    rates = parse_sample_rates(app.config['LOG_SAMPLE_RATES'])
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+    _listener = DrainingQueueListener(log_queue, *(handlers if handlers is not None else default_handlers()), respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+def shutdown_logging():
+    """Write out whatever is still queued; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+@app.before_request
+def _assign_request_id():
+    g.request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+
+
+@app.after_request
+def _echo_request_id(response):
+    if 'request_id' in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+@app.teardown_request
+def _clear_request_id(exc):
+    request_id.set(None)
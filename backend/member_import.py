@@ -0,0 +1,143 @@
+import codecs
+import csv
+import json
+import click
+from itertools import islice
+from collections import Counter
+from sqlalchemy import func, or_
+from config import app, db
+from models import User
+from dialects import upsert_insert
+from hashing import hash_passwords
+from stats import bump, role_counter, USERS
+
+# Bulk member import from CSV (header row with username,email,password[,role])
+# or NDJSON (one object per line). Rows are read, validated, hashed and
+# inserted one batch at a time, so memory stays flat whatever the file size,
+# and a bad row is reported without stopping the rest of the file.
+
+app.config.setdefault('IMPORT_BATCH_SIZE', 1000)
+IMPORT_ROLES = ('user', 'trainer')
+FORMATS = ('csv', 'ndjson')
+
+
+def iter_records(stream, fmt):
+    """Yield (row_number, dict or error string) from a binary stream."""
+    lines = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(lines), start=1):
+            yield number, record
+    elif fmt == 'ndjson':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield number, 'Malformed JSON'
+                continue
+            yield number, record if isinstance(record, dict) else 'Expected a JSON object'
+    else:
+        raise ValueError(f'Unknown import format {fmt}')
+
+
+def validate(record):
+    if not isinstance(record, dict):
+        return None, record
+    for field in ('username', 'email', 'password', 'role'):
+        # NDJSON can carry numbers, lists or objects; null counts as missing
+        if record.get(field) is not None and not isinstance(record[field], str):
+            return None, f'{field} must be a string'
+    username = (record.get('username') or '').strip()
+    email = (record.get('email') or '').strip().lower()
+    password = record.get('password') or ''
+    role = (record.get('role') or 'user').strip()
+    if not username or len(username) > 50:
+        return None, 'username is required (max 50 characters)'
+    if '@' not in email or len(email) > 120:
+        return None, 'a valid email is required (max 120 characters)'
+    if not password:
+        return None, 'password is required'
+    if role not in IMPORT_ROLES:
+        return None, f"role must be one of {', '.join(IMPORT_ROLES)}"
+    return {'username': username, 'email': email, 'password': password, 'role': role}, None
+
+
+def import_batch(batch):
+    """Insert one batch of (row_number, record); yields per-row error dicts and returns created count."""
+    candidates = []
+    usernames, emails = set(), set()
+    for number, record in batch:
+        member, error = validate(record)
+        if error:
+            yield {'row': number, 'error': error}
+        elif member['username'] in usernames or member['email'] in emails:
+            yield {'row': number, 'error': 'Duplicate username or email earlier in the file'}
+        else:
+            usernames.add(member['username'])
+            emails.add(member['email'])
+            candidates.append((number, member))
+    if not candidates:
+        return 0
+
+    # One query per batch against the unique columns instead of two per row;
+    # imported emails are lowercased, stored ones may not be
+    taken = db.session.query(User.username, User.email).filter(
+        or_(User.username.in_(usernames), func.lower(User.email).in_(emails))
+    ).all()
+    taken_usernames = {username for username, _ in taken}
+    taken_emails = {email.lower() for _, email in taken}
+    fresh = []
+    for number, member in candidates:
+        if member['username'] in taken_usernames or member['email'] in taken_emails:
+            yield {'row': number, 'error': 'Username or email already exists'}
+        else:
+            fresh.append((number, member))
+    if not fresh:
+        return 0
+
+    hashes = hash_passwords([member['password'] for _, member in fresh])
+    rows = [{'username': member['username'], 'email': member['email'], 'password_hash': password_hash,
+             'role': member['role']} for (_, member), password_hash in zip(fresh, hashes)]
+    # ON CONFLICT DO NOTHING covers members registered since the check above
+    statement = upsert_insert(User).values(rows).on_conflict_do_nothing()
+    inserted = {username for username, in db.session.execute(statement.returning(User.username))}
+    for number, member in fresh:
+        if member['username'] not in inserted:
+            yield {'row': number, 'error': 'Username or email already exists'}
+    # Bulk inserts skip the flush hook that maintains the dashboard counters
+    roles = Counter(member['role'] for _, member in fresh if member['username'] in inserted)
+    bump(db.session.connection(), {USERS: len(inserted), **{role_counter(role): n for role, n in roles.items()}})
+    db.session.commit()
+    return len(inserted)
+
+
+def run_import(stream, fmt):
+    """Generator of per-row error dicts, ending with a {'summary': ...} item."""
+    records = iter_records(stream, fmt)
+    summary = {'rows': 0, 'created': 0, 'failed': 0}
+    while True:
+        batch = list(islice(records, app.config['IMPORT_BATCH_SIZE']))
+        if not batch:
+            break
+        summary['rows'] += len(batch)
+        try:
+            created = yield from import_batch(batch)
+        except Exception as e:
+            db.session.rollback()
+            created = 0
+            yield {'rows': [batch[0][0], batch[-1][0]], 'error': f'Batch failed: {str(e)}'}
+        summary['created'] += created
+        summary['failed'] = summary['rows'] - summary['created']
+    yield {'summary': summary}
+
+
+@app.cli.command('import-members')
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Defaults to the file extension.')
+def import_members_command(source, fmt):
+    """Import members from a CSV or NDJSON file, printing row errors as NDJSON."""
+    fmt = fmt or ('ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+    for item in run_import(source, fmt):
+        click.echo(json.dumps(item))
@@ -97,6 +97,11 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Index builds and backfills may outlast the app's DB_STATEMENT_TIMEOUT
+            connection.exec_driver_sql('SET statement_timeout = 0')
+            # Session-level setting; end the autobegun transaction so alembic manages its own
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,55 @@
+"""Add query indexes and unique attendance/RSVP constraints
+
+Revision ID: 5c1d7e9a3b42
+Revises: 289f3599e11b
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d7e9a3b42'
+down_revision = '289f3599e11b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate rows left by the old insert-always endpoints so the
+    # unique indexes can be built; the lowest id of each group is kept.
+    op.execute(
+        'DELETE FROM attendances WHERE id NOT IN '
+        '(SELECT MIN(id) FROM attendances GROUP BY user_id, date)'
+    )
+    op.execute(
+        'DELETE FROM class_rsvps WHERE id NOT IN '
+        '(SELECT MIN(id) FROM class_rsvps GROUP BY user_id, class_id)'
+    )
+    op.execute(
+        'UPDATE workout_classes SET current_capacity = '
+        '(SELECT COUNT(*) FROM class_rsvps WHERE class_rsvps.class_id = workout_classes.id)'
+    )
+
+    op.create_index('uq_attendances_user_id_date', 'attendances', ['user_id', 'date'], unique=True)
+    op.create_index('uq_class_rsvps_user_id_class_id', 'class_rsvps', ['user_id', 'class_id'], unique=True)
+    op.create_index('ix_class_rsvps_class_id', 'class_rsvps', ['class_id'], unique=False)
+    op.create_index('ix_trainer_trainee_trainee_id', 'trainer_trainee', ['trainee_id', 'trainer_id'], unique=False)
+    op.create_index('ix_user_subscriptions_user_id_end_date', 'user_subscriptions', ['user_id', 'end_date'], unique=False)
+    op.create_index('ix_user_subscriptions_user_id_plan_id', 'user_subscriptions', ['user_id', 'plan_id'], unique=False)
+    op.create_index('ix_users_role_id', 'users', ['role', 'id'], unique=False)
+    op.create_index('ix_workout_classes_date_time', 'workout_classes', ['date_time'], unique=False)
+    op.create_index('ix_workout_classes_trainer_id_date_time', 'workout_classes', ['trainer_id', 'date_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_workout_classes_trainer_id_date_time', table_name='workout_classes')
+    op.drop_index('ix_workout_classes_date_time', table_name='workout_classes')
+    op.drop_index('ix_users_role_id', table_name='users')
+    op.drop_index('ix_user_subscriptions_user_id_plan_id', table_name='user_subscriptions')
+    op.drop_index('ix_user_subscriptions_user_id_end_date', table_name='user_subscriptions')
+    op.drop_index('ix_trainer_trainee_trainee_id', table_name='trainer_trainee')
+    op.drop_index('ix_class_rsvps_class_id', table_name='class_rsvps')
+    op.drop_index('uq_class_rsvps_user_id_class_id', table_name='class_rsvps')
+    op.drop_index('uq_attendances_user_id_date', table_name='attendances')
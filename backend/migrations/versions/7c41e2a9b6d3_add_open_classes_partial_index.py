@@ -0,0 +1,26 @@
+"""Add a partial index on classes with a free spot for schedule search
+
+Revision ID: 7c41e2a9b6d3
+Revises: d3b9e0f57a21
+Create Date: 2026-10-18 19:02:17.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e2a9b6d3'
+down_revision = 'd3b9e0f57a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_workout_classes_open_date_time', 'workout_classes', ['date_time', 'id'], unique=False,
+                    postgresql_where=sa.text('current_capacity < max_capacity'),
+                    sqlite_where=sa.text('current_capacity < max_capacity'))
+
+
+def downgrade():
+    op.drop_index('ix_workout_classes_open_date_time', table_name='workout_classes')
@@ -0,0 +1,57 @@
+"""Add the class_day_stats and series_regulars rollups for trainer analytics
+
+Revision ID: a3f7c1e9d254
+Revises: c9d4a7e2b813
+Create Date: 2026-10-18 23:02:16.584930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7c1e9d254'
+down_revision = 'c9d4a7e2b813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask refresh-analytics`; the first run builds every past day
+    op.create_table('class_day_stats',
+    sa.Column('class_id', sa.Integer(), nullable=False),
+    sa.Column('trainer_id', sa.Integer(), nullable=False),
+    sa.Column('series_id', sa.Integer(), nullable=True),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('week', sa.Date(), nullable=False),
+    sa.Column('capacity', sa.Integer(), nullable=False),
+    sa.Column('booked', sa.Integer(), nullable=False),
+    sa.Column('waitlisted', sa.Integer(), nullable=False),
+    sa.Column('attended', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['class_id'], ['workout_classes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('class_id')
+    )
+    with op.batch_alter_table('class_day_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_class_day_stats_day', ['day'], unique=False)
+        batch_op.create_index('ix_class_day_stats_trainer_id_day', ['trainer_id', 'day'], unique=False)
+
+    op.create_table('series_regulars',
+    sa.Column('series_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('attended', sa.Integer(), nullable=False),
+    sa.Column('last_attended', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['series_id'], ['class_series.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('series_id', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('series_regulars')
+    with op.batch_alter_table('class_day_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_class_day_stats_trainer_id_day')
+        batch_op.drop_index('ix_class_day_stats_day')
+
+    op.drop_table('class_day_stats')
+    op.execute("DELETE FROM stat_counters WHERE name = 'rollup:class_day_stats'")
@@ -0,0 +1,41 @@
+"""Add stat_counters table for admin dashboard stats
+
+Revision ID: a8f2c4e61d07
+Revises: 5c1d7e9a3b42
+Create Date: 2026-10-18 11:40:06.918237
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8f2c4e61d07'
+down_revision = '5c1d7e9a3b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stat_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Seed from the current tables; the app keeps the rows in step from here on
+    op.execute("INSERT INTO stat_counters (name, value) SELECT 'users', COUNT(*) FROM users")
+    op.execute("INSERT INTO stat_counters (name, value) SELECT 'subscription_plans', COUNT(*) FROM subscription_plans")
+    for role in ('user', 'trainer', 'admin'):
+        op.execute(
+            f"INSERT INTO stat_counters (name, value) "
+            f"SELECT 'role:{role}', COUNT(*) FROM users WHERE role = '{role}'"
+        )
+    op.execute(
+        "INSERT INTO stat_counters (name, value) "
+        "SELECT 'role:' || role, COUNT(*) FROM users "
+        "WHERE role NOT IN ('user', 'trainer', 'admin') GROUP BY role"
+    )
+
+
+def downgrade():
+    op.drop_table('stat_counters')
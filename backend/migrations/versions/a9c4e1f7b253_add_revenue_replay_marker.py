@@ -0,0 +1,25 @@
+"""Add the stat_counters row revenue backfills and purchases take turns on
+
+Revision ID: a9c4e1f7b253
+Revises: f3d8b2a6c915
+Create Date: 2026-10-19 17:24:08.661092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e1f7b253'
+down_revision = 'f3d8b2a6c915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Present before any backfill starts, so every purchase locks it (revenue.py)
+    op.execute("INSERT INTO stat_counters (name, value) VALUES ('rollup:revenue:replaying', -1)")
+
+
+def downgrade():
+    op.execute("DELETE FROM stat_counters WHERE name = 'rollup:revenue:replaying'")
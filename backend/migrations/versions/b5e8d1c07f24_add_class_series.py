@@ -0,0 +1,57 @@
+"""Add recurring class series, their exception dates and workout_classes.series_id
+
+Revision ID: b5e8d1c07f24
+Revises: 7c41e2a9b6d3
+Create Date: 2026-10-18 19:48:06.215937
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8d1c07f24'
+down_revision = '7c41e2a9b6d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('class_series',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('trainer_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('max_capacity', sa.Integer(), nullable=False),
+    sa.Column('weekdays', sa.String(length=20), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=False),
+    sa.Column('interval_weeks', sa.Integer(), nullable=False),
+    sa.Column('starts_on', sa.Date(), nullable=False),
+    sa.Column('ends_on', sa.Date(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['trainer_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_class_series_trainer_id', 'class_series', ['trainer_id'], unique=False)
+    op.create_index('ix_class_series_starts_on_ends_on', 'class_series', ['starts_on', 'ends_on'], unique=False)
+    op.create_table('class_series_exceptions',
+    sa.Column('series_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['series_id'], ['class_series.id'], ),
+    sa.PrimaryKeyConstraint('series_id', 'date')
+    )
+    with op.batch_alter_table('workout_classes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('series_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_workout_classes_series_id_class_series', 'class_series', ['series_id'], ['id'])
+        batch_op.create_index('uq_workout_classes_series_id_date_time', ['series_id', 'date_time'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('workout_classes', schema=None) as batch_op:
+        batch_op.drop_index('uq_workout_classes_series_id_date_time')
+        batch_op.drop_constraint('fk_workout_classes_series_id_class_series', type_='foreignkey')
+        batch_op.drop_column('series_id')
+    op.drop_table('class_series_exceptions')
+    op.drop_index('ix_class_series_starts_on_ends_on', table_name='class_series')
+    op.drop_index('ix_class_series_trainer_id', table_name='class_series')
+    op.drop_table('class_series')
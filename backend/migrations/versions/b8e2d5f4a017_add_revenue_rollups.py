@@ -0,0 +1,50 @@
+"""Add the revenue_days and revenue_months rollups for revenue analytics
+
+Revision ID: b8e2d5f4a017
+Revises: a3f7c1e9d254
+Create Date: 2026-10-18 20:14:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d5f4a017'
+down_revision = 'a3f7c1e9d254'
+branch_labels = None
+depends_on = None
+
+
+def _rollup_columns():
+    return [
+        sa.Column('plan_id', sa.Integer(), nullable=False),
+        sa.Column('subscriptions', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.Column('new_members', sa.Integer(), nullable=False),
+        sa.Column('activations', sa.Integer(), nullable=False),
+        sa.Column('expirations', sa.Integer(), nullable=False),
+        sa.Column('churned', sa.Integer(), nullable=False),
+        sa.Column('mrr_change', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['plan_id'], ['subscription_plans.id'], ondelete='CASCADE'),
+    ]
+
+
+def upgrade():
+    # Existing subscriptions are added by `flask backfill-revenue`; new ones as they are written
+    op.create_table('revenue_days',
+    sa.Column('day', sa.Date(), nullable=False),
+    *_rollup_columns(),
+    sa.PrimaryKeyConstraint('day', 'plan_id')
+    )
+    op.create_table('revenue_months',
+    sa.Column('month', sa.Date(), nullable=False),
+    *_rollup_columns(),
+    sa.PrimaryKeyConstraint('month', 'plan_id')
+    )
+
+
+def downgrade():
+    op.drop_table('revenue_months')
+    op.drop_table('revenue_days')
+    op.execute("DELETE FROM stat_counters WHERE name = 'rollup:revenue'")
@@ -0,0 +1,27 @@
+"""Add stat_counters.updated_at for the per-table version counters
+
+Revision ID: c9d4a7e2b813
+Revises: f1b6d8a3c590
+Create Date: 2026-10-18 22:05:41.126307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9d4a7e2b813'
+down_revision = 'f1b6d8a3c590'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stat_counters', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # Version rows are harmless without their timestamps; recount leaves them alone
+    with op.batch_alter_table('stat_counters', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
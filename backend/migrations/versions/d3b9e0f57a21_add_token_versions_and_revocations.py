@@ -0,0 +1,36 @@
+"""Add users.token_version and token_revocations for claim-based auth
+
+Revision ID: d3b9e0f57a21
+Revises: a8f2c4e61d07
+Create Date: 2026-10-18 13:05:44.127935
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b9e0f57a21'
+down_revision = 'a8f2c4e61d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+    op.create_table('token_revocations',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_token_revocations_revoked_at', 'token_revocations', ['revoked_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_token_revocations_revoked_at', table_name='token_revocations')
+    op.drop_table('token_revocations')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
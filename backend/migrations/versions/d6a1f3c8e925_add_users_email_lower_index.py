@@ -0,0 +1,26 @@
+"""Add an index on lower(users.email) for case-insensitive duplicate checks
+
+Revision ID: d6a1f3c8e925
+Revises: b8e2d5f4a017
+Create Date: 2026-10-19 09:12:40.527113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a1f3c8e925'
+down_revision = 'b8e2d5f4a017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_email_lower', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_email_lower')
@@ -0,0 +1,48 @@
+"""Add users.current_subscription_id and users.active_until with a partial index
+
+Revision ID: e4a7c2d9f316
+Revises: b5e8d1c07f24
+Create Date: 2026-10-18 20:31:52.804113
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2d9f316'
+down_revision = 'b5e8d1c07f24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('current_subscription_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('active_until', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_users_current_subscription_id', 'user_subscriptions',
+                                    ['current_subscription_id'], ['id'], ondelete='SET NULL')
+
+    # Backfill from the latest-ending subscription still running for each member
+    now = datetime.utcnow()
+    op.execute(sa.text("""
+        UPDATE users SET
+            active_until = (SELECT MAX(s.end_date) FROM user_subscriptions s
+                            WHERE s.user_id = users.id AND s.end_date > :now),
+            current_subscription_id = (SELECT s.id FROM user_subscriptions s
+                                       WHERE s.user_id = users.id AND s.end_date > :now
+                                       ORDER BY s.end_date DESC, s.id DESC LIMIT 1)
+    """).bindparams(now=now))
+
+    op.create_index('ix_users_active_until', 'users', ['active_until'], unique=False,
+                    postgresql_where=sa.text('active_until IS NOT NULL'),
+                    sqlite_where=sa.text('active_until IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_users_active_until', table_name='users')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_users_current_subscription_id', type_='foreignkey')
+        batch_op.drop_column('active_until')
+        batch_op.drop_column('current_subscription_id')
@@ -0,0 +1,28 @@
+"""Add workout_classes.updated_at, which versions the class lists
+
+Revision ID: e7c3a9f1d486
+Revises: d6a1f3c8e925
+Create Date: 2026-10-19 14:37:12.904518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a9f1d486'
+down_revision = 'd6a1f3c8e925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('workout_classes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_workout_classes_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('workout_classes', schema=None) as batch_op:
+        batch_op.drop_index('ix_workout_classes_updated_at')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,34 @@
+"""Add series_attendance, the settled per-member counts behind series_regulars
+
+Revision ID: f3d8b2a6c915
+Revises: e7c3a9f1d486
+Create Date: 2026-10-19 16:02:55.318240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3d8b2a6c915'
+down_revision = 'e7c3a9f1d486'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by the next `flask refresh-analytics`, from the first class up to its lookback
+    op.create_table('series_attendance',
+    sa.Column('series_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('attended', sa.Integer(), nullable=False),
+    sa.Column('last_attended', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['series_id'], ['class_series.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('series_id', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('series_attendance')
+    op.execute("DELETE FROM stat_counters WHERE name = 'rollup:series_attendance'")
@@ -1,14 +1,17 @@
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from config import db
+from hashing import hash_password, verify_password, needs_rehash
 
 # Association tables for many-to-many
 trainer_trainee = db.Table('trainer_trainee',
     db.Column('trainer_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('trainee_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
 )
+# The primary key covers trainer_id lookups; this covers user.trainers
+db.Index('ix_trainer_trainee_trainee_id', trainer_trainee.c.trainee_id, trainer_trainee.c.trainer_id)
 
 class User(db.Model, SerializerMixin):
     __tablename__ = 'users'
@@ -18,7 +21,13 @@ class User(db.Model, SerializerMixin):
     password_hash = db.Column(db.String(256), nullable=False)  
     role = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    subscriptions = db.relationship('UserSubscription', backref='user', lazy=True)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Kept in step by subscriptions.py: the subscription giving access now and when that access ends
+    current_subscription_id = db.Column(db.Integer, db.ForeignKey('user_subscriptions.id', use_alter=True,
+                                                                 name='fk_users_current_subscription_id', ondelete='SET NULL'))
+    active_until = db.Column(db.DateTime)
+    subscriptions = db.relationship('UserSubscription', backref='user', lazy=True,
+                                    foreign_keys='UserSubscription.user_id')
     health_profile = db.relationship('HealthProfile', backref='user', uselist=False, lazy=True)
     attendances = db.relationship('Attendance', backref='user', lazy=True)
     rsvps = db.relationship('ClassRSVP', backref='user', lazy=True)
@@ -27,13 +36,23 @@ class User(db.Model, SerializerMixin):
                                secondaryjoin=(trainer_trainee.c.trainee_id == id),
                                backref=db.backref('trainers', lazy='dynamic'), lazy='dynamic')
 
-    serialize_rules = ('-password_hash', '-trainees.trainers', '-trainers.trainees', '-trainees.health_profile', '-trainees.attendances', '-trainees.rsvps', '-trainees.subscriptions')  # Added to prevent recursion
+    __table_args__ = (
+        db.Index('ix_users_role_id', 'role', 'id'),
+        # Only members with access are indexed; the expiry job walks it oldest first
+        db.Index('ix_users_active_until', 'active_until',
+                 postgresql_where=db.text('active_until IS NOT NULL'), sqlite_where=db.text('active_until IS NOT NULL')),
+    )
+
+    serialize_rules = ('-password_hash', '-token_version', '-trainees.trainers', '-trainers.trainees', '-trainees.health_profile', '-trainees.attendances', '-trainees.rsvps', '-trainees.subscriptions')  # Added to prevent recursion
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
@@ -43,6 +62,9 @@ class User(db.Model, SerializerMixin):
             'role': self.role
         }
 
+# Case-insensitive email matching (member import's duplicate check)
+db.Index('ix_users_email_lower', db.func.lower(User.email))
+
 class SubscriptionPlan(db.Model, SerializerMixin):
     __tablename__ = 'subscription_plans'
     id = db.Column(db.Integer, primary_key=True)
@@ -50,7 +72,8 @@ class SubscriptionPlan(db.Model, SerializerMixin):
     duration_days = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
-    subscriptions = db.relationship('UserSubscription', backref='plan', lazy=True)
+    # Every UserSubscription.to_dict() reads plan.name, so the plan rides along in the same SELECT
+    subscriptions = db.relationship('UserSubscription', backref=db.backref('plan', lazy='joined'), lazy=True)
 
     def to_dict(self):
         return {
@@ -69,6 +92,10 @@ class UserSubscription(db.Model, SerializerMixin):
     start_date = db.Column(db.DateTime, default=datetime.utcnow)
     end_date = db.Column(db.DateTime)
     serialize_rules = ('-user.subscriptions', '-plan.subscriptions')
+    __table_args__ = (
+        db.Index('ix_user_subscriptions_user_id_end_date', 'user_id', 'end_date'),
+        db.Index('ix_user_subscriptions_user_id_plan_id', 'user_id', 'plan_id'),
+    )
 
     def to_dict(self):
         return {
@@ -86,6 +113,9 @@ class Attendance(db.Model, SerializerMixin):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     attended = db.Column(db.Boolean, default=False)
+    __table_args__ = (
+        db.Index('uq_attendances_user_id_date', 'user_id', 'date', unique=True),
+    )
 
     def to_dict(self):
         return {
@@ -123,9 +153,29 @@ class WorkoutClass(db.Model, SerializerMixin):
     trainer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     max_capacity = db.Column(db.Integer, default=10)  
     current_capacity = db.Column(db.Integer, default=0)  
+    # Set on occurrences of a ClassSeries, materialized when their first RSVP arrives
+    series_id = db.Column(db.Integer, db.ForeignKey('class_series.id'), nullable=True)
+    # Set on every insert and update, Core statements included; the class
+    # lists' ETags read the latest (conditional.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     rsvps = db.relationship('ClassRSVP', backref='workout_class', lazy=True)
     trainer = db.relationship('User', backref='classes', lazy=True)
     users = association_proxy('rsvps', 'user')
+    __table_args__ = (
+        db.Index('ix_workout_classes_date_time', 'date_time'),
+        db.Index('ix_workout_classes_trainer_id_date_time', 'trainer_id', 'date_time'),
+        # Schedule searches for classes with a free spot; the predicate is has_free_spot's,
+        # spelled the same way so Postgres and SQLite both match it to the query
+        db.Index('ix_workout_classes_open_date_time', 'date_time', 'id',
+                 postgresql_where=(current_capacity < max_capacity), sqlite_where=(current_capacity < max_capacity)),
+        # At most one row per occurrence, however many first RSVPs race to create it
+        db.Index('uq_workout_classes_series_id_date_time', 'series_id', 'date_time', unique=True),
+        db.Index('ix_workout_classes_updated_at', 'updated_at'),
+    )
+
+    @hybrid_property
+    def has_free_spot(self):
+        return self.current_capacity < self.max_capacity
 
     def to_dict(self):
         return {
@@ -135,9 +185,51 @@ class WorkoutClass(db.Model, SerializerMixin):
             'description': self.description,
             'trainer_id': self.trainer_id,
             'max_capacity': self.max_capacity,
-            'current_capacity': self.current_capacity
+            'current_capacity': self.current_capacity,
+            'series_id': self.series_id
         }
 
+class ClassSeries(db.Model):
+    __tablename__ = 'class_series'
+    id = db.Column(db.Integer, primary_key=True)
+    trainer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    max_capacity = db.Column(db.Integer, nullable=False, default=10)
+    # Weekly rule: every interval_weeks weeks on the weekdays listed (BYDAY
+    # codes, e.g. "MO,WE,FR") at start_time (UTC), from starts_on until ends_on
+    weekdays = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    interval_weeks = db.Column(db.Integer, nullable=False, default=1)
+    starts_on = db.Column(db.Date, nullable=False)
+    ends_on = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    exceptions = db.relationship('ClassSeriesException', backref='series', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_class_series_trainer_id', 'trainer_id'),
+        db.Index('ix_class_series_starts_on_ends_on', 'starts_on', 'ends_on'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'trainer_id': self.trainer_id,
+            'name': self.name,
+            'description': self.description,
+            'max_capacity': self.max_capacity,
+            'weekdays': self.weekdays.split(','),
+            'start_time': self.start_time.strftime('%H:%M'),
+            'interval_weeks': self.interval_weeks,
+            'starts_on': self.starts_on.isoformat(),
+            'ends_on': self.ends_on.isoformat() if self.ends_on else None
+        }
+
+class ClassSeriesException(db.Model):
+    __tablename__ = 'class_series_exceptions'
+    # A date on which the series does not run
+    series_id = db.Column(db.Integer, db.ForeignKey('class_series.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+
 class ClassRSVP(db.Model, SerializerMixin):
     __tablename__ = 'class_rsvps'
     id = db.Column(db.Integer, primary_key=True)
@@ -145,6 +237,10 @@ class ClassRSVP(db.Model, SerializerMixin):
     class_id = db.Column(db.Integer, db.ForeignKey('workout_classes.id'), nullable=False)
     attending = db.Column(db.Boolean, default=False)
     serialize_rules = ('-user.rsvps', '-workout_class.rsvps')
+    __table_args__ = (
+        db.Index('uq_class_rsvps_user_id_class_id', 'user_id', 'class_id', unique=True),
+        db.Index('ix_class_rsvps_class_id', 'class_id'),
+    )
 
     def to_dict(self):
         return {
@@ -152,4 +248,130 @@ class ClassRSVP(db.Model, SerializerMixin):
             'user_id': self.user_id,
             'class_id': self.class_id,
             'attending': self.attending
-        }
\ No newline at end of file
+        }
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    # Set on the per-table version counters (conditional.py), for Last-Modified
+    updated_at = db.Column(db.DateTime)
+
+
+class TokenRevocation(db.Model):
+    __tablename__ = 'token_revocations'
+    # No foreign key: the row must outlive a deleted user's outstanding tokens
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'email_outbox'
+    # Written in the transaction that triggers the email; sent by the outbox worker (outbox.py)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # Set for messages that must go out at most once, e.g. one reminder per class and member
+    dedupe_key = db.Column(db.String(100), unique=True)
+    # pending -> sending (claimed by a worker until next_attempt_at) -> sent, or back to pending, or failed
+    status = db.Column(db.String(20), nullable=False, default='pending', server_default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        # Only undelivered messages are indexed, so the claim query stays small however much has been sent
+        db.Index('ix_email_outbox_due', 'next_attempt_at', 'id',
+                 postgresql_where=db.text("status IN ('pending', 'sending')"),
+                 sqlite_where=db.text("status IN ('pending', 'sending')")),
+    )
+
+    @hybrid_property
+    def undelivered(self):
+        return self.status in ('pending', 'sending')
+
+    @undelivered.expression
+    def undelivered(cls):
+        # Literals rather than bound parameters, so SQLite can match the query to ix_email_outbox_due
+        return cls.status.in_([db.literal_column("'pending'"), db.literal_column("'sending'")])
+
+
+class ClassDayStat(db.Model):
+    __tablename__ = 'class_day_stats'
+    # Daily rollup behind the trainer analytics: one row per past class,
+    # rebuilt a day at a time by analytics.refresh_rollups
+    class_id = db.Column(db.Integer, db.ForeignKey('workout_classes.id', ondelete='CASCADE'), primary_key=True)
+    trainer_id = db.Column(db.Integer, nullable=False)
+    series_id = db.Column(db.Integer)
+    day = db.Column(db.Date, nullable=False)
+    # Monday of day's week, so weekly trends group on a column
+    week = db.Column(db.Date, nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    booked = db.Column(db.Integer, nullable=False)
+    waitlisted = db.Column(db.Integer, nullable=False)
+    # Booked members who checked in on the day of the class
+    attended = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index('ix_class_day_stats_trainer_id_day', 'trainer_id', 'day'),
+        db.Index('ix_class_day_stats_day', 'day'),
+    )
+
+
+class SeriesRegular(db.Model):
+    __tablename__ = 'series_regulars'
+    # The members who attend a class series most, best first; rebuilt with the
+    # series' classes in class_day_stats
+    series_id = db.Column(db.Integer, db.ForeignKey('class_series.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, nullable=False)
+    attended = db.Column(db.Integer, nullable=False)
+    last_attended = db.Column(db.Date, nullable=False)
+
+
+class SeriesAttendance(db.Model):
+    __tablename__ = 'series_attendance'
+    # Classes of a series each member attended, over the days the analytics
+    # refresh no longer redoes; series_regulars ranks these plus the days after
+    series_id = db.Column(db.Integer, db.ForeignKey('class_series.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    attended = db.Column(db.Integer, nullable=False)
+    last_attended = db.Column(db.Date, nullable=False)
+
+
+class RevenueDay(db.Model):
+    __tablename__ = 'revenue_days'
+    # Revenue and membership movements per plan and day, added to by
+    # revenue.py as subscriptions are written. Each column is a change on
+    # that day, so the level on any day (active members, MRR) is the sum of
+    # every row up to it; see revenue.revenue_report
+    day = db.Column(db.Date, primary_key=True)
+    plan_id = db.Column(db.Integer, db.ForeignKey('subscription_plans.id', ondelete='CASCADE'), primary_key=True)
+    subscriptions = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    new_members = db.Column(db.Integer, nullable=False, default=0)
+    # Members gaining access, new or returning
+    activations = db.Column(db.Integer, nullable=False, default=0)
+    expirations = db.Column(db.Integer, nullable=False, default=0)
+    # Members losing access: a subscription ended with nothing running after it
+    churned = db.Column(db.Integer, nullable=False, default=0)
+    mrr_change = db.Column(db.Float, nullable=False, default=0)
+
+
+class RevenueMonth(db.Model):
+    __tablename__ = 'revenue_months'
+    # revenue_days summed by calendar month (month is its first day), so long
+    # ranges and opening balances read a row per month rather than per day
+    month = db.Column(db.Date, primary_key=True)
+    plan_id = db.Column(db.Integer, db.ForeignKey('subscription_plans.id', ondelete='CASCADE'), primary_key=True)
+    subscriptions = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    new_members = db.Column(db.Integer, nullable=False, default=0)
+    activations = db.Column(db.Integer, nullable=False, default=0)
+    expirations = db.Column(db.Integer, nullable=False, default=0)
+    churned = db.Column(db.Integer, nullable=False, default=0)
+    mrr_change = db.Column(db.Float, nullable=False, default=0)
@@ -0,0 +1,211 @@
+import click
+import logging
+import os
+import random
+import smtplib
+import time
+from datetime import datetime, timedelta
+from flask_mail import Message, BadHeaderError
+from sqlalchemy import select, update
+from config import app, db, mail
+from models import User, WorkoutClass, ClassRSVP, OutboxMessage
+from dialects import upsert_insert
+
+# Transactional email. Code that triggers an email adds an OutboxMessage in
+# its own transaction, so the message exists exactly when the change does
+# and the request never waits on SMTP. A separate worker process
+# (`flask --app app send-email`, the Procfile's worker) claims due messages
+# OUTBOX_BATCH_SIZE at a time, sends each batch over one SMTP connection and
+# records the outcome: sent, retried after an exponential backoff, or failed
+# after OUTBOX_MAX_ATTEMPTS. A claim is a lease: if the worker dies mid-batch
+# its messages become due again after OUTBOX_LEASE seconds, so a message can
+# be sent twice but never lost. Locally, point MAIL_SERVER/MAIL_PORT at a
+# debugging server such as `python -m smtpd -n -c DebuggingServer localhost:1025`
+# (or aiosmtpd) with MAIL_USE_TLS unset.
+
+app.config.setdefault('OUTBOX_BATCH_SIZE', int(os.getenv('OUTBOX_BATCH_SIZE', 50)))
+app.config.setdefault('OUTBOX_MAX_ATTEMPTS', int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8)))
+app.config.setdefault('OUTBOX_RETRY_BASE', float(os.getenv('OUTBOX_RETRY_BASE', 30)))
+app.config.setdefault('OUTBOX_RETRY_MAX', float(os.getenv('OUTBOX_RETRY_MAX', 3600)))
+app.config.setdefault('OUTBOX_LEASE', float(os.getenv('OUTBOX_LEASE', 300)))
+app.config.setdefault('OUTBOX_POLL_INTERVAL', float(os.getenv('OUTBOX_POLL_INTERVAL', 5)))
+# How long before a class its attendees are reminded
+app.config.setdefault('CLASS_REMINDER_LEAD', float(os.getenv('CLASS_REMINDER_LEAD', 24 * 3600)))
+
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+# Problems with one message; anything else (a dropped connection, a refused
+# login) fails the rest of the batch, which is retried
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError, BadHeaderError)
+
+
+def enqueue(session, messages):
+    """Add message dicts (kind, user_id, recipient, subject, body, optional
+    dedupe_key) to the outbox in the session's transaction; a dedupe_key
+    already queued is skipped."""
+    if messages:
+        session.execute(upsert_insert(OutboxMessage).on_conflict_do_nothing(index_elements=['dedupe_key']), messages)
+
+
+def _format_time(at):
+    return at.strftime('%A %d %B at %H:%M UTC')
+
+
+def rsvp_message(user, workout_class, attending):
+    if attending:
+        subject = f'You are booked into {workout_class.name}'
+        text = f'Your spot in {workout_class.name} on {_format_time(workout_class.date_time)} is confirmed.'
+    else:
+        subject = f'You are on the waitlist for {workout_class.name}'
+        text = (f'{workout_class.name} on {_format_time(workout_class.date_time)} is full. '
+                f'We will email you if a spot opens up.')
+    return {'kind': 'rsvp', 'user_id': user.id, 'recipient': user.email, 'subject': subject,
+            'body': f'Hi {user.username},\n\n{text}\n'}
+
+
+def promotion_message(user, workout_class):
+    return {'kind': 'waitlist_promotion', 'user_id': user.id, 'recipient': user.email,
+            'subject': f'A spot opened up in {workout_class.name}',
+            'body': f'Hi {user.username},\n\nYou have moved off the waitlist: your spot in {workout_class.name} '
+                    f'on {_format_time(workout_class.date_time)} is confirmed.\n'}
+
+
+def subscription_message(user, plan, subscription):
+    return {'kind': 'subscription', 'user_id': user.id, 'recipient': user.email,
+            'subject': f'Welcome to {plan.name}',
+            'body': f'Hi {user.username},\n\nYour {plan.name} membership is active until '
+                    f'{subscription.end_date:%d %B %Y}.\n'}
+
+
+def expiry_message(user_id, email, username, active_until):
+    return {'kind': 'subscription_expired', 'user_id': user_id, 'recipient': email,
+            'subject': 'Your membership has ended',
+            'body': f'Hi {username},\n\nYour membership ended on {active_until:%d %B %Y}. '
+                    f'Renew any time from your dashboard.\n',
+            'dedupe_key': f'expired:{user_id}:{active_until:%Y%m%d%H%M%S}'}
+
+
+def reminder_message(user_id, email, username, class_id, name, date_time):
+    return {'kind': 'class_reminder', 'user_id': user_id, 'recipient': email,
+            'subject': f'Reminder: {name} {_format_time(date_time)}',
+            'body': f'Hi {username},\n\nSee you at {name} on {_format_time(date_time)}.\n',
+            'dedupe_key': f'reminder:{class_id}:{user_id}'}
+
+
+def queue_class_reminders(start, end):
+    """Queue a reminder for every confirmed RSVP to a class starting in [start, end)."""
+    rows = db.session.execute(
+        select(User.id, User.email, User.username, WorkoutClass.id, WorkoutClass.name, WorkoutClass.date_time)
+        .join(ClassRSVP, ClassRSVP.user_id == User.id)
+        .join(WorkoutClass, WorkoutClass.id == ClassRSVP.class_id)
+        .where(WorkoutClass.date_time >= start, WorkoutClass.date_time < end, ClassRSVP.attending.is_(True))
+    ).all()
+    enqueue(db.session, [reminder_message(*row) for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def claim(now, batch_size):
+    """Lease up to batch_size due messages to this worker; returns them."""
+    due = (OutboxMessage.undelivered, OutboxMessage.next_attempt_at <= now)
+    ids = db.session.execute(
+        select(OutboxMessage.id).where(*due).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+        .limit(batch_size).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.session.rollback()
+        return []
+    # Re-checking due in the UPDATE keeps two workers from leasing the same
+    # message on databases without SKIP LOCKED (SQLite serializes the writes)
+    claimed = db.session.execute(
+        update(OutboxMessage).where(OutboxMessage.id.in_(ids), *due)
+        .values(status=SENDING, attempts=OutboxMessage.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=app.config['OUTBOX_LEASE']))
+        .returning(OutboxMessage.id, OutboxMessage.recipient, OutboxMessage.subject, OutboxMessage.body, OutboxMessage.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return sorted(claimed)
+
+
+def deliver(messages):
+    """Send messages over one SMTP connection; returns {id: error or None}."""
+    results = {}
+    try:
+        with mail.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(Message(message.subject, recipients=[message.recipient], body=message.body))
+                    results[message.id] = None
+                except MESSAGE_ERRORS as e:
+                    results[message.id] = f'{type(e).__name__}: {e}'
+    except (smtplib.SMTPException, OSError) as e:
+        logging.warning(f"Outbox SMTP connection failed: {str(e)}")
+        for message in messages:
+            results.setdefault(message.id, f'{type(e).__name__}: {e}')
+    return results
+
+
+def retry_delay(attempts):
+    # Exponential, capped, and jittered so a backlog does not retry in lockstep
+    delay = min(app.config['OUTBOX_RETRY_BASE'] * 2 ** (attempts - 1), app.config['OUTBOX_RETRY_MAX'])
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def record(messages, results, now):
+    rows = []
+    for message in messages:
+        error = results[message.id]
+        if error is None:
+            rows.append({'id': message.id, 'status': SENT, 'sent_at': now, 'last_error': None})
+        elif message.attempts >= app.config['OUTBOX_MAX_ATTEMPTS']:
+            logging.error(f"Outbox message {message.id} failed after {message.attempts} attempts: {error}")
+            rows.append({'id': message.id, 'status': FAILED, 'last_error': error})
+        else:
+            rows.append({'id': message.id, 'status': PENDING, 'last_error': error,
+                         'next_attempt_at': now + retry_delay(message.attempts)})
+    # Bulk updates by primary key, one statement per distinct set of columns
+    db.session.execute(update(OutboxMessage), rows)
+    db.session.commit()
+
+
+def send_batch(batch_size=None):
+    """Claim, send and record one batch; returns {'sent': n, 'retrying': n, 'failed': n}."""
+    messages = claim(datetime.utcnow(), batch_size or app.config['OUTBOX_BATCH_SIZE'])
+    if not messages:
+        return {'sent': 0, 'retrying': 0, 'failed': 0}
+    # No transaction is open while SMTP is talked to
+    results = deliver(messages)
+    record(messages, results, datetime.utcnow())
+    failed = sum(1 for m in messages if results[m.id] is not None and m.attempts >= app.config['OUTBOX_MAX_ATTEMPTS'])
+    sent = sum(1 for error in results.values() if error is None)
+    return {'sent': sent, 'retrying': len(messages) - sent - failed, 'failed': failed}
+
+
+def run_worker(once=False):
+    """Send until stopped (or, with once, until nothing is due), queueing class reminders as their time comes."""
+    reminded_until = datetime.utcnow()
+    while True:
+        now = datetime.utcnow()
+        lead = timedelta(seconds=app.config['CLASS_REMINDER_LEAD'])
+        if now + lead > reminded_until:
+            # Each class is reminded once; the dedupe key covers restarts
+            queue_class_reminders(max(reminded_until, now), now + lead)
+            reminded_until = now + lead
+        totals = send_batch()
+        if any(totals.values()):
+            logging.info(f"Outbox: {totals['sent']} sent, {totals['retrying']} retrying, {totals['failed']} failed")
+        elif once:
+            return
+        else:
+            time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+
+
+@app.cli.command('send-email')
+@click.option('--once', is_flag=True, help='exit once nothing is due instead of polling')
+def send_email_command(once):
+    """Run the outbox worker: send queued emails and class reminders."""
+    try:
+        run_worker(once=once)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,225 @@
+from datetime import datetime
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import joinedload
+from models import User, SubscriptionPlan, UserSubscription, Attendance, WorkoutClass, ClassRSVP, trainer_trainee
+from pagination import paginate, parse_limit
+from cache import dashboard_cache, SHARED
+from subscriptions import membership, membership_status
+from conditional import (OWN, USERS, PLANS, CLASSES, CLASS_DAY_STATS, SERIES_REGULARS, REVENUE_DAYS,
+                         REVENUE_MONTHS)
+
+# Read-side queries behind the list and dashboard routes. Each takes the
+# session explicitly so the Flask routes (db.session) and the async routes in
+# asgi.py (the sync facade of an AsyncSession, via run_sync) share them.
+
+
+# What the list endpoints serialize, in to_dict() order. They select these
+# columns rather than entities: rows come back as tuples, with no identity
+# map or instance state to build, and the JSON provider writes their dates.
+USER_COLUMNS = (User.id, User.username, User.email, User.role)
+CLASS_COLUMNS = (WorkoutClass.id, WorkoutClass.name, WorkoutClass.date_time, WorkoutClass.description,
+                 WorkoutClass.trainer_id, WorkoutClass.max_capacity, WorkoutClass.current_capacity, WorkoutClass.series_id)
+ATTENDANCE_COLUMNS = (Attendance.id, Attendance.user_id, Attendance.date, Attendance.attended)
+
+
+def row_dicts(rows):
+    if rows and isinstance(rows[0], Row):
+        # Row._asdict() looks the keys up again for every row
+        keys = rows[0]._fields
+        return [dict(zip(keys, row)) for row in rows]
+    return [row.to_dict() for row in rows]
+
+
+def page_payload(rows, next_cursor):
+    return {'items': row_dicts(rows), 'next_cursor': next_cursor}
+
+
+def users_page(session, cursor=None, limit=None, role=None):
+    query = session.query(*USER_COLUMNS)
+    if role:
+        query = query.filter(User.role == role)
+    return paginate(query, [User.id], cursor, limit or parse_limit(None))
+
+
+def classes_page(session, cursor=None, limit=None, trainer_id=None, start=None, end=None):
+    query = session.query(*CLASS_COLUMNS)
+    if trainer_id:
+        query = query.filter(WorkoutClass.trainer_id == trainer_id)
+    if start:
+        query = query.filter(WorkoutClass.date_time >= start)
+    if end:
+        query = query.filter(WorkoutClass.date_time < end)
+    return paginate(query, [WorkoutClass.date_time, WorkoutClass.id], cursor, limit or parse_limit(None))
+
+
+# sort parameter -> (keyset columns, descending); every key ends with the primary key
+SCHEDULE_SORTS = {
+    'date_time': ([WorkoutClass.date_time, WorkoutClass.id], False),
+    '-date_time': ([WorkoutClass.date_time, WorkoutClass.id], True),
+    'name': ([WorkoutClass.name, WorkoutClass.id], False),
+    '-name': ([WorkoutClass.name, WorkoutClass.id], True),
+}
+NAME_PREFIX_MAX = 100
+
+
+def schedule_filters(args):
+    """Keyword arguments for schedule_page from query args; ValueError on bad input.
+
+    The window starts now unless `from` is given, so history never has to be
+    scanned unless a caller asks for it.
+    """
+    start = datetime.fromisoformat(args['from']) if args.get('from') else datetime.utcnow()
+    end = datetime.fromisoformat(args['to']) if args.get('to') else None
+    if end is not None and end <= start:
+        raise ValueError('to must be after from')
+    name = args.get('name') or None
+    if name is not None and len(name) > NAME_PREFIX_MAX:
+        raise ValueError('name prefix too long')
+    has_spots = args.get('has_spots', '').lower()
+    if has_spots not in ('', 'true', 'false', '1', '0'):
+        raise ValueError('has_spots must be true or false')
+    sort = args.get('sort') or 'date_time'
+    if sort not in SCHEDULE_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SCHEDULE_SORTS)}")
+    return {
+        'start': start,
+        'end': end,
+        'trainer_id': int(args['trainer_id']) if args.get('trainer_id') else None,
+        'name_prefix': name,
+        'has_spots': has_spots in ('true', '1'),
+        'sort': sort,
+    }
+
+
+def schedule_query(session, start=None, end=None, trainer_id=None, name_prefix=None, has_spots=False):
+    """Classes in [start, end), narrowed by trainer, free spot and name prefix.
+
+    The time window is a range scan on ix_workout_classes_date_time, on
+    ix_workout_classes_trainer_id_date_time for one trainer, or on the partial
+    ix_workout_classes_open_date_time when only classes with a free spot are
+    wanted; the name prefix is filtered within that range.
+    """
+    query = session.query(WorkoutClass)
+    if start:
+        query = query.filter(WorkoutClass.date_time >= start)
+    if end:
+        query = query.filter(WorkoutClass.date_time < end)
+    if trainer_id:
+        query = query.filter(WorkoutClass.trainer_id == trainer_id)
+    if has_spots:
+        query = query.filter(WorkoutClass.has_free_spot)
+    if name_prefix:
+        escaped = name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(WorkoutClass.name.ilike(f'{escaped}%', escape='\\'))
+    return query
+
+
+def schedule_page(session, cursor=None, limit=None, sort='date_time', **filters):
+    columns, descending = SCHEDULE_SORTS[sort]
+    query = schedule_query(session, **filters).with_entities(*CLASS_COLUMNS)
+    return paginate(query, columns, cursor, limit or parse_limit(None), descending=descending)
+
+
+def attendance_page(session, user_id, cursor=None, limit=None, start=None, end=None):
+    # Newest first so the first page always holds today's check-in
+    query = session.query(*ATTENDANCE_COLUMNS).filter(Attendance.user_id == user_id)
+    if start:
+        query = query.filter(Attendance.date >= start)
+    if end:
+        query = query.filter(Attendance.date <= end)
+    return paginate(query, [Attendance.date, Attendance.id], cursor, limit or parse_limit(None), descending=True)
+
+
+# Tables each part of the dashboards is read from, for their ETags
+# (conditional.py). OWN is the member's own version: their profile,
+# subscriptions, attendance, RSVPs and trainer
+USER_SNAPSHOT_TABLES = (OWN, PLANS)
+SHARED_SNAPSHOT_TABLES = (PLANS, CLASSES)
+USER_DASHBOARD_TABLES = USER_SNAPSHOT_TABLES + (CLASSES,)
+# Trainer assignment marks both users as changed
+TRAINER_DASHBOARD_TABLES = (USERS, CLASSES)
+ADMIN_DASHBOARD_TABLES = (USERS, PLANS)
+CLASS_LIST_TABLES = (CLASSES,)
+PLAN_LIST_TABLES = (PLANS,)
+# The rollups (analytics.py), and users for the regulars' names
+TRAINER_ANALYTICS_TABLES = (CLASS_DAY_STATS, SERIES_REGULARS, USERS)
+# The revenue rollups (revenue.py), and plans for their names
+REVENUE_TABLES = (REVENUE_DAYS, REVENUE_MONTHS, PLANS)
+
+
+def _stamp(versions, tables):
+    return None if versions is None else tuple(versions[table][0] for table in tables)
+
+
+def _cached(key, stamp):
+    # A snapshot built before the versions the caller just read is stale, even
+    # if this worker never saw the write that moved them
+    entry = dashboard_cache.get(key)
+    if entry is None or (stamp is not None and entry[0] != stamp):
+        return None
+    return entry[1]
+
+
+def user_dashboard_snapshot(session, user):
+    user_subscriptions = session.query(UserSubscription).options(joinedload(UserSubscription.plan)).filter_by(user_id=user.id).all()
+    attendance, attendance_next_cursor = attendance_page(session, user.id)
+    trainer = session.query(User).join(trainer_trainee, trainer_trainee.c.trainer_id == User.id).filter(trainer_trainee.c.trainee_id == user.id).first()
+    rsvps = session.query(ClassRSVP).filter_by(user_id=user.id).all()
+    return {
+        'user': user.to_dict(),
+        'membership': membership(user),
+        'user_subscriptions': [us.to_dict() for us in user_subscriptions],
+        'attendance': row_dicts(attendance),
+        'attendance_next_cursor': attendance_next_cursor,
+        'trainer_details': trainer.to_dict() if trainer else None,
+        'rsvps': [r.to_dict() for r in rsvps]
+    }
+
+
+def shared_dashboard_snapshot(session):
+    # Plans and the first page of upcoming classes are the same for every member
+    subscriptions = session.query(SubscriptionPlan).all()
+    classes, classes_next_cursor = classes_page(session, start=datetime.utcnow())
+    return {
+        'subscriptions': [s.to_dict() for s in subscriptions],
+        'classes': row_dicts(classes),
+        'classes_next_cursor': classes_next_cursor
+    }
+
+
+def user_dashboard_data(session, user_id, versions=None):
+    """Member dashboard from the snapshot cache; None when the user is gone.
+
+    versions, from conditional.read_versions, makes cached snapshots older
+    than them count as misses.
+    """
+    stamp = _stamp(versions, USER_SNAPSHOT_TABLES)
+    snapshot = _cached(user_id, stamp)
+    if snapshot is None:
+        user = session.get(User, user_id)
+        if not user:
+            return None
+        snapshot = user_dashboard_snapshot(session, user)
+        dashboard_cache.set(user_id, (stamp, snapshot))
+    shared_stamp = _stamp(versions, SHARED_SNAPSHOT_TABLES)
+    shared = _cached(SHARED, shared_stamp)
+    if shared is None:
+        shared = shared_dashboard_snapshot(session)
+        dashboard_cache.set(SHARED, (shared_stamp, shared))
+    # Days left move on with the clock, not with writes, so they are not cached
+    return {**snapshot, **shared, 'membership': membership_status(snapshot['membership'])}
+
+
+def trainer_dashboard_data(session, user_id):
+    user = session.get(User, user_id)
+    if not user:
+        return None
+    classes = session.query(WorkoutClass).filter_by(trainer_id=user_id).all()
+    trained_users = user.trainees.all()
+    class_stats = [{'name': c.name, 'attendance_count': c.current_capacity} for c in classes]
+    return {
+        'user': user.to_dict(),
+        'classes': row_dicts(classes),
+        'trained_users': [u.to_dict() for u in trained_users],
+        'class_stats': class_stats
+    }
@@ -0,0 +1,362 @@
+import click
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+from config import app, db
+from models import SubscriptionPlan, UserSubscription, RevenueDay, RevenueMonth, StatCounter
+from dialects import upsert_insert
+
+# Revenue and membership analytics for admins. revenue_days holds, per plan
+# and day, what changed that day: subscriptions sold and their revenue,
+# members gaining or losing access, subscriptions ending, the change in MRR.
+# revenue_months holds the same sums per calendar month. The session hook
+# below adds a new subscription's movements in the transaction that writes
+# it: the sale on its start day, and its expiry on its end day, which is
+# known at purchase, so the rollups never wait on the expiry job. A member
+# churns when a subscription ends with nothing running after it; one taken
+# out before the last ends moves the churn to the new end date.
+#
+# Levels on a day (active members, active subscriptions, MRR) are running
+# sums of those changes: the months before it plus the days of its month,
+# so any range costs a row per month of history and a row per period
+# reported, never a scan of user_subscriptions. Figures for future days
+# assume nobody renews.
+#
+# Subscriptions written around the session (bulk loads) and those from
+# before these tables existed are replayed from user_subscriptions with
+# `flask backfill-revenue`, which rebuilds the rollups members at a time.
+# While it runs, the stat_counters row REPLAYING holds the last member it has
+# rebuilt: the session hook books only those members' subscriptions and
+# leaves the rest to the replay. The hook reads the row FOR SHARE and the
+# backfill writes it before reading anything, so a purchase is either
+# committed before the replay reads its member or booked after the replay
+# has moved past it, never both.
+
+app.config.setdefault('REVENUE_BACKFILL_CHUNK', int(os.getenv('REVENUE_BACKFILL_CHUNK', 1000)))
+app.config.setdefault('REVENUE_DEFAULT_MONTHS', int(os.getenv('REVENUE_DEFAULT_MONTHS', 12)))
+REVENUE_MAX_PERIODS = 1000
+INTERVALS = ('day', 'month')
+
+# MRR counts every plan as its price over a 30 day month
+MONTH_DAYS = 30
+FLOWS = ('subscriptions', 'revenue', 'new_members', 'activations', 'expirations', 'churned', 'mrr_change')
+# stat_counters row written when a backfill finishes: subscriptions replayed, and the time it started
+BACKFILLED = 'rollup:revenue'
+# Last member a running backfill has rebuilt, or IDLE; the migration creates it
+REPLAYING = 'rollup:revenue:replaying'
+IDLE = -1
+# Coverage of a subscription without an end date
+FOREVER = datetime.max
+
+
+def monthly_value(price, duration_days):
+    return price * MONTH_DAYS / duration_days if duration_days else price
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+class MemberState:
+    """A member's subscriptions so far, as far as the rollups need them."""
+
+    def __init__(self, subscriptions=0, until=None, plan_id=None):
+        self.subscriptions = subscriptions
+        # When their access ends, and the plan of the subscription ending then
+        self.until = until
+        self.plan_id = plan_id
+
+
+def _add(deltas, day, plan_id, **changes):
+    deltas.setdefault((day, plan_id), Counter()).update(changes)
+
+
+def subscription_events(deltas, member, plan_id, start, end, price, duration_days):
+    """Add one subscription's movements to deltas {(day, plan_id): Counter};
+    member is the MemberState before it, and is moved on past it."""
+    mrr = monthly_value(price, duration_days)
+    _add(deltas, start.date(), plan_id, subscriptions=1, revenue=price, mrr_change=mrr)
+    if end is not None:
+        _add(deltas, end.date(), plan_id, expirations=1, mrr_change=-mrr)
+    covered_until = end or FOREVER
+    if member.until is None or member.until < start:
+        # Back to back counts as covered: no churn, no reactivation
+        _add(deltas, start.date(), plan_id, activations=1, new_members=0 if member.subscriptions else 1)
+        if end is not None:
+            _add(deltas, end.date(), plan_id, churned=1)
+        member.until, member.plan_id = covered_until, plan_id
+    elif covered_until > member.until:
+        # Renewed early: access now ends with this one instead
+        _add(deltas, member.until.date(), member.plan_id, churned=-1)
+        if end is not None:
+            _add(deltas, end.date(), plan_id, churned=1)
+        member.until, member.plan_id = covered_until, plan_id
+    member.subscriptions += 1
+
+
+def _upsert(session, model, key, deltas):
+    table = model.__table__
+    statement = upsert_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key, 'plan_id'],
+        set_={name: table.c[name] + statement.excluded[name] for name in FLOWS}
+    )
+    session.execute(statement, [{key: period, 'plan_id': plan_id, **{name: changes[name] for name in FLOWS}}
+                                for (period, plan_id), changes in deltas.items()])
+
+
+def apply_deltas(session, deltas):
+    """Add deltas to revenue_days and revenue_months (caller commits)."""
+    deltas = {key: changes for key, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return
+    months = {}
+    for (day, plan_id), changes in deltas.items():
+        months.setdefault((month_of(day), plan_id), Counter()).update(changes)
+    _upsert(session, RevenueDay, 'day', deltas)
+    _upsert(session, RevenueMonth, 'month', months)
+
+
+def _member_states(session, user_ids, exclude_ids):
+    members = {user_id: MemberState() for user_id in user_ids}
+    for user_id, plan_id, end_date in session.execute(
+            select(UserSubscription.user_id, UserSubscription.plan_id, UserSubscription.end_date)
+            .where(UserSubscription.user_id.in_(list(user_ids)), UserSubscription.id.notin_(exclude_ids))):
+        member = members[user_id]
+        member.subscriptions += 1
+        if member.until is None or (end_date or FOREVER) > member.until:
+            member.until, member.plan_id = end_date or FOREVER, plan_id
+    return members
+
+
+# First among the after_flush hooks, so conditional.py's sees the rollup
+# writes and bumps their versions with the rest of the flush
+@event.listens_for(Session, 'after_flush', insert=True)
+def _track_subscriptions(session, flush_context):
+    new = sorted((instance for instance in session.new if isinstance(instance, UserSubscription)),
+                 key=lambda subscription: (subscription.start_date, subscription.id))
+    if not new:
+        return
+    replayed = session.execute(
+        select(StatCounter.value).where(StatCounter.name == REPLAYING).with_for_update(read=True)
+    ).scalar()
+    if replayed is not None and replayed != IDLE:
+        # The running backfill books the members it has not reached yet
+        new = [subscription for subscription in new if subscription.user_id <= replayed]
+        if not new:
+            return
+    members = _member_states(session, {subscription.user_id for subscription in new},
+                             [subscription.id for subscription in new])
+    deltas = {}
+    for subscription in new:
+        # The route has the plan loaded already
+        plan = session.get(SubscriptionPlan, subscription.plan_id)
+        subscription_events(deltas, members[subscription.user_id], plan.id, subscription.start_date,
+                            subscription.end_date, plan.price, plan.duration_days)
+    apply_deltas(session, deltas)
+
+
+def backfilled():
+    """(subscriptions replayed, when the last backfill started), or None if none has finished."""
+    row = db.session.execute(
+        select(StatCounter.value, StatCounter.updated_at).where(StatCounter.name == BACKFILLED)
+    ).first()
+    return tuple(row) if row else None
+
+
+def _set_replaying(session, value):
+    statement = upsert_insert(StatCounter).values(name=REPLAYING, value=value)
+    session.execute(statement.on_conflict_do_update(index_elements=['name'], set_={'value': statement.excluded.value}))
+
+
+def _lock_replaying(session):
+    # The first write of each backfill transaction: it waits for purchases
+    # holding the row, and holds off the ones after it until commit
+    session.execute(StatCounter.__table__.update().where(StatCounter.name == REPLAYING)
+                    .values(value=StatCounter.__table__.c.value))
+
+
+def backfill(chunk=None, now=None):
+    """Rebuild the rollups from user_subscriptions, `chunk` members per
+    transaction; returns {'members': n, 'subscriptions': n}.
+
+    Subscriptions written meanwhile are booked by the session hook once
+    their member has been replayed, and by the replay before that. Reports
+    read partial figures until it finishes; one that fails leaves the hook
+    booking only the members it reached, until a backfill finishes.
+    """
+    chunk = chunk or app.config['REVENUE_BACKFILL_CHUNK']
+    started = now or datetime.utcnow()
+    _set_replaying(db.session, 0)
+    db.session.execute(delete(RevenueDay))
+    db.session.execute(delete(RevenueMonth))
+    db.session.execute(delete(StatCounter).where(StatCounter.name == BACKFILLED))
+    db.session.commit()
+    totals = {'members': 0, 'subscriptions': 0}
+    last_id = 0
+    while True:
+        _lock_replaying(db.session)
+        user_ids = db.session.execute(
+            select(UserSubscription.user_id).where(UserSubscription.user_id > last_id)
+            .group_by(UserSubscription.user_id).order_by(UserSubscription.user_id).limit(chunk)
+        ).scalars().all()
+        if not user_ids:
+            break
+        members, deltas = {}, {}
+        for user_id, plan_id, start, end, price, duration_days in db.session.execute(
+                select(UserSubscription.user_id, UserSubscription.plan_id, UserSubscription.start_date,
+                       UserSubscription.end_date, SubscriptionPlan.price, SubscriptionPlan.duration_days)
+                .join(SubscriptionPlan, SubscriptionPlan.id == UserSubscription.plan_id)
+                .where(UserSubscription.user_id.in_(user_ids))
+                .order_by(UserSubscription.user_id, UserSubscription.start_date, UserSubscription.id)):
+            subscription_events(deltas, members.setdefault(user_id, MemberState()), plan_id, start, end,
+                                price, duration_days)
+            totals['subscriptions'] += 1
+        apply_deltas(db.session, deltas)
+        last_id = user_ids[-1]
+        _set_replaying(db.session, last_id)
+        db.session.commit()
+        totals['members'] += len(members)
+    # Still holding the row: no purchase commits between the last chunk and handing back to the hook
+    _set_replaying(db.session, IDLE)
+    db.session.execute(upsert_insert(StatCounter).on_conflict_do_nothing(index_elements=['name']),
+                       [{'name': BACKFILLED, 'value': totals['subscriptions'], 'updated_at': started}])
+    db.session.commit()
+    return totals
+
+
+def period_count(start, end, interval):
+    """How many periods periods() would return, without building them."""
+    if interval == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+def periods(start, end, interval):
+    """First days of the day or month periods covering [start, end]."""
+    if interval == 'month':
+        period, step = month_of(start), next_month
+    else:
+        period, step = start, lambda day: day + timedelta(days=1)
+    result = []
+    while period <= end:
+        result.append(period)
+        period = step(period)
+    return result
+
+
+def _level_sums(model):
+    return (model.plan_id, func.sum(model.subscriptions - model.expirations),
+            func.sum(model.activations - model.churned), func.sum(model.mrr_change))
+
+
+def _opening_levels(session, day):
+    """{plan_id: [active subscriptions, active members, mrr]} at the start of day."""
+    levels = {}
+    statements = [select(*_level_sums(RevenueMonth)).where(RevenueMonth.month < month_of(day))
+                  .group_by(RevenueMonth.plan_id)]
+    if day != month_of(day):
+        statements.append(select(*_level_sums(RevenueDay))
+                          .where(RevenueDay.day >= month_of(day), RevenueDay.day < day)
+                          .group_by(RevenueDay.plan_id))
+    for statement in statements:
+        for plan_id, subscriptions, members, mrr in session.execute(statement):
+            level = levels.setdefault(plan_id, [0, 0, 0.0])
+            level[0] += subscriptions or 0
+            level[1] += members or 0
+            level[2] += mrr or 0
+    return levels
+
+
+def _money(value):
+    # Running float sums: to the cent, and no -0.0
+    return round(value, 2) + 0.0
+
+
+def _levels(levels):
+    subscriptions, members, mrr = (sum(level[i] for level in levels.values()) for i in range(3))
+    return {'active_members': members, 'active_subscriptions': subscriptions, 'mrr': _money(mrr)}
+
+
+def revenue_report(session, start, end, interval):
+    """Sales, MRR, active, new and churned members for each day or month of
+    [start, end], levels at the end of each period, plus the plan mix."""
+    buckets = periods(start, end, interval)
+    if interval == 'month':
+        model, key, stop = RevenueMonth, RevenueMonth.month, next_month(end)
+    else:
+        model, key, stop = RevenueDay, RevenueDay.day, end + timedelta(days=1)
+    levels = _opening_levels(session, buckets[0])
+    flows = {}
+    for row in session.execute(select(key, model.plan_id, *(getattr(model, name) for name in FLOWS))
+                               .where(key >= buckets[0], key < stop)):
+        flows.setdefault(row[0], []).append((row[1], dict(zip(FLOWS, row[2:]))))
+    plans = dict(session.execute(select(SubscriptionPlan.id, SubscriptionPlan.name)).all())
+
+    series = []
+    totals = Counter()
+    sold = {plan_id: Counter() for plan_id in plans}
+    for period in buckets:
+        members_before = sum(level[1] for level in levels.values())
+        point = Counter()
+        for plan_id, changes in flows.get(period, ()):
+            point.update(changes)
+            sold.setdefault(plan_id, Counter()).update(subscriptions=changes['subscriptions'],
+                                                       revenue=changes['revenue'])
+            level = levels.setdefault(plan_id, [0, 0, 0.0])
+            level[0] += changes['subscriptions'] - changes['expirations']
+            level[1] += changes['activations'] - changes['churned']
+            level[2] += changes['mrr_change']
+        totals.update(point)
+        series.append({
+            'period': period.isoformat(),
+            'revenue': _money(point['revenue']),
+            **{name: point[name] for name in ('subscriptions', 'new_members', 'activations', 'expirations', 'churned')},
+            'churn_rate': round(point['churned'] / members_before, 4) if members_before > 0 else None,
+            **_levels(levels),
+        })
+    revenue = totals['revenue']
+    mix = []
+    for plan_id in sorted(sold):
+        active_subscriptions, _, mrr = levels.get(plan_id, (0, 0, 0.0))
+        mix.append({
+            'plan_id': plan_id, 'name': plans.get(plan_id), 'subscriptions': sold[plan_id]['subscriptions'],
+            'revenue': _money(sold[plan_id]['revenue']),
+            'revenue_share': round(sold[plan_id]['revenue'] / revenue, 4) if revenue else None,
+            'active_subscriptions': active_subscriptions, 'mrr': _money(mrr),
+        })
+    done = backfilled()
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'interval': interval,
+        'backfilled_at': done[1].isoformat() if done else None,
+        'totals': {'revenue': _money(revenue),
+                   **{name: totals[name] for name in ('subscriptions', 'new_members', 'activations', 'churned')},
+                   **_levels(levels)},
+        'plans': mix,
+        'series': series,
+    }
+
+
+def default_range(today=None):
+    """The last REVENUE_DEFAULT_MONTHS calendar months, this one included."""
+    end = today or date.today()
+    start = month_of(end)
+    for _ in range(app.config['REVENUE_DEFAULT_MONTHS'] - 1):
+        start = month_of(start - timedelta(days=1))
+    return start, end
+
+
+@app.cli.command('backfill-revenue')
+@click.option('--chunk', type=int, default=None, help='members per transaction (REVENUE_BACKFILL_CHUNK)')
+def backfill_revenue_command(chunk):
+    """Rebuild the revenue rollups from every subscription on record."""
+    for name, value in backfill(chunk).items():
+        print(f'{name}: {value}')
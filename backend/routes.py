@@ -1,10 +1,42 @@
-from flask import request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import g, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy import exists
 from config import app, db
-from models import User, SubscriptionPlan, UserSubscription, Attendance, HealthProfile, WorkoutClass, ClassRSVP
-from datetime import datetime, timedelta
+from models import User, SubscriptionPlan, UserSubscription, HealthProfile, WorkoutClass, ClassSeries, ClassSeriesException, trainer_trainee
+from pagination import paginate, parse_limit
+from conditional import conditional
+from queries import (USER_DASHBOARD_TABLES, TRAINER_DASHBOARD_TABLES, ADMIN_DASHBOARD_TABLES, CLASS_LIST_TABLES, PLAN_LIST_TABLES,
+                     TRAINER_ANALYTICS_TABLES, REVENUE_TABLES,
+                     page_payload, row_dicts, users_page, classes_page, schedule_filters, schedule_page, attendance_page, user_dashboard_data, trainer_dashboard_data)
+from stats import get_counters, role_counter, USERS, PLANS
+from rsvp import reserve, cancel, waitlist_position, RSVPError
+from subscriptions import is_active, activate
+from analytics import trainer_analytics, ANALYTICS_MAX_WEEKS
+from revenue import revenue_report, default_range, period_count, INTERVALS as REVENUE_INTERVALS, REVENUE_MAX_PERIODS
+from outbox import enqueue, subscription_message
+from class_series import parse_series, timetable, materialize, add_exception, SeriesError
+from auth import issue_token, role_required, current_username
+from hashing import HashingBusy
+from checkin import parse_timestamp, upsert_checkins, record_checkins, CREATED, DUPLICATE, INVALID
+from attendance_calendar import build_calendar, MAX_DAYS as CALENDAR_MAX_DAYS
+from member_import import run_import, FORMATS as IMPORT_FORMATS
+from db_pool import pool_settings, worker_snapshots
+from instrumentation import render_metrics
+from exports import export_query, stream_export, DATASETS as EXPORT_DATASETS, FORMATS as EXPORT_FORMATS
+from datetime import datetime, date, timedelta
+import hmac
+import json
 import logging
 
+def _page_args():
+    return request.args.get('cursor'), parse_limit(request.args.get('limit'))
+
+def _parse_arg(name, parse):
+    value = request.args.get(name)
+    return parse(value) if value else None
+
 @app.route('/')
 def home():
     return jsonify({"message": "Gym Management System Backend - API is running"}), 200
@@ -19,9 +51,12 @@ def register():
         user.set_password(data['password'])
         db.session.add(user)
         db.session.commit()
-        access_token = create_access_token(identity=user.id)
+        access_token = issue_token(user)
         logging.info(f"User {data['username']} registered with role {user.role}")
         return jsonify({'access_token': access_token, 'role': user.role}), 201
+    except HashingBusy:
+        logging.warning("Registration rejected: password hashing queue full")
+        return jsonify({'error': 'Server busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logging.error(f"Registration error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -31,7 +66,8 @@ def login():
     try:
         data = request.json
         if not data or 'username' not in data or 'password' not in data:
-            logging.info(f"Login failed: Missing username or password in payload {data}")
+            # Never log the payload itself: it holds the password
+            logging.info("Login failed: Missing username or password")
             return jsonify({'error': 'Missing username or password'}), 400
         user = User.query.filter_by(username=data['username']).first()
         if not user:
@@ -40,61 +76,55 @@ def login():
         if not user.check_password(data['password']):
             logging.info(f"Login failed: Invalid password for user {data['username']}")
             return jsonify({'error': 'Invalid credentials'}), 401
-        access_token = create_access_token(identity=user.id)
+        if user.password_needs_rehash():
+            # KDF parameters changed since this hash was made; upgrade it while we have the password
+            user.set_password(data['password'])
+            db.session.commit()
+        access_token = issue_token(user)
         logging.info(f"User {data['username']} logged in successfully")
         return jsonify({'access_token': access_token, 'role': user.role}), 200
+    except HashingBusy:
+        logging.warning("Login rejected: password hashing queue full")
+        return jsonify({'error': 'Server busy, please try again'}), 503, {'Retry-After': '1'}
     except Exception as e:
         logging.error(f"Login error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/dashboard', methods=['GET'])
-@jwt_required()
+@role_required('user')
+@conditional(*USER_DASHBOARD_TABLES, per_user=True, clock=True)
 def user_dashboard():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user or user.role != 'user':
-            logging.info(f"Unauthorized dashboard access by user_id {user_id} with role {user.role if user else 'None'}")
-            return jsonify({'error': 'Access denied'}), 403
-        subscriptions = SubscriptionPlan.query.all()
-        user_subscriptions = UserSubscription.query.filter_by(user_id=user_id).all()
-        attendance = Attendance.query.filter_by(user_id=user_id).all()
-        trainer = user.trainers.first()
-        trainer_details = trainer.to_dict() if trainer else None
-        classes = WorkoutClass.query.all()
-        rsvps = ClassRSVP.query.filter_by(user_id=user_id).all()
-        return jsonify({
-            'user': user.to_dict(),
-            'subscriptions': [s.to_dict() for s in subscriptions],
-            'user_subscriptions': [us.to_dict() for us in user_subscriptions],
-            'attendance': [a.to_dict() for a in attendance],
-            'trainer_details': trainer_details,
-            'classes': [c.to_dict() for c in classes],
-            'rsvps': [r.to_dict() for r in rsvps]
-        }), 200
+        dashboard = user_dashboard_data(db.session, get_jwt_identity(), g.versions)
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(dashboard), 200
     except Exception as e:
         logging.error(f"Dashboard error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/admin-dashboard', methods=['GET'])
-@jwt_required()
+@role_required('admin')
+@conditional(*ADMIN_DASHBOARD_TABLES, per_user=True)
 def admin_dashboard():
     try:
         user_id = get_jwt_identity()
         user = User.query.get(user_id)
-        if not user or user.role != 'admin':
-            logging.info(f"Unauthorized admin dashboard access by user_id {user_id} with role {user.role if user else 'None'}")
-            return jsonify({'error': 'Access denied'}), 403
-        users = User.query.all()
-        trainers = User.query.filter_by(role='trainer').all()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        users, users_next_cursor = users_page(db.session)
+        trainers, trainers_next_cursor = users_page(db.session, role='trainer')
         subscriptions = SubscriptionPlan.query.all()
-        user_count = len(users)
-        trainer_count = len(trainers)
-        subscription_count = len(subscriptions)
+        counters = get_counters()
+        user_count = counters[USERS]
+        trainer_count = counters[role_counter('trainer')]
+        subscription_count = counters[PLANS]
         return jsonify({
             'user': user.to_dict(),
-            'users': [u.to_dict() for u in users],
-            'trainers': [t.to_dict() for t in trainers],
+            'users': row_dicts(users),
+            'users_next_cursor': users_next_cursor,
+            'trainers': row_dicts(trainers),
+            'trainers_next_cursor': trainers_next_cursor,
             'subscriptions': [s.to_dict() for s in subscriptions],
             'stats': {'user_count': user_count, 'trainer_count': trainer_count, 'subscription_count': subscription_count}
         }), 200
@@ -102,108 +132,329 @@ def admin_dashboard():
         logging.error(f"Admin dashboard error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/admin/db-pool', methods=['GET'])
+@role_required('admin')
+def db_pool_diagnostics():
+    try:
+        # One entry per worker on this instance; the serving worker's is live, the rest at most a second old
+        return jsonify({'settings': pool_settings(), 'workers': worker_snapshots()}), 200
+    except Exception as e:
+        logging.error(f"Pool diagnostics error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _is_admin_token():
+    try:
+        verify_jwt_in_request()
+    except (JWTExtendedException, PyJWTError):
+        return False
+    return get_jwt().get('role') == 'admin'
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    try:
+        # Scraped by Prometheus with METRICS_TOKEN, or read by an admin
+        if not app.config['METRICS_PUBLIC']:
+            authorization = request.headers.get('Authorization', '')
+            token = app.config['METRICS_TOKEN']
+            if not authorization:
+                return jsonify({'error': 'Authorization required'}), 401
+            if not (token and hmac.compare_digest(authorization, f'Bearer {token}')) and not _is_admin_token():
+                return jsonify({'error': 'Access denied'}), 403
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4'), 200
+    except Exception as e:
+        logging.error(f"Metrics error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/admin/revenue', methods=['GET'])
+@role_required('admin')
+@conditional(*REVENUE_TABLES, per_user=True, clock=True)
+def revenue_analytics():
+    try:
+        interval = request.args.get('interval', 'month')
+        if interval not in REVENUE_INTERVALS:
+            return jsonify({'error': f"interval must be one of {', '.join(REVENUE_INTERVALS)}"}), 400
+        start, end = default_range()
+        start = _parse_arg('from', date.fromisoformat) or start
+        end = _parse_arg('to', date.fromisoformat) or end
+        if start > end:
+            return jsonify({'error': 'from must not be after to'}), 400
+        if period_count(start, end, interval) > REVENUE_MAX_PERIODS:
+            return jsonify({'error': f'At most {REVENUE_MAX_PERIODS} periods per request'}), 400
+        return jsonify(revenue_report(db.session, start, end, interval)), 200
+    except ValueError as ve:
+        logging.info(f"Revenue analytics rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Revenue analytics error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/trainer-dashboard', methods=['GET'])
-@jwt_required()
+@role_required('trainer')
+@conditional(*TRAINER_DASHBOARD_TABLES, per_user=True)
 def trainer_dashboard():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if not user or user.role != 'trainer':
-            logging.info(f"Unauthorized trainer dashboard access by user_id {user_id} with role {user.role if user else 'None'}")
-            return jsonify({'error': 'Access denied'}), 403
-        classes = WorkoutClass.query.filter_by(trainer_id=user_id).all()
-        trained_users = user.trainees.all()
-        class_stats = [{'name': c.name, 'attendance_count': c.current_capacity} for c in classes]
-        return jsonify({
-            'user': user.to_dict(),
-            'classes': [c.to_dict() for c in classes],
-            'trained_users': [u.to_dict() for u in trained_users],
-            'class_stats': class_stats
-        }), 200
+        dashboard = trainer_dashboard_data(db.session, get_jwt_identity())
+        if dashboard is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify(dashboard), 200
     except Exception as e:
         logging.error(f"Trainer dashboard error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/trainer-analytics', methods=['GET'])
+@role_required('trainer')
+@conditional(*TRAINER_ANALYTICS_TABLES, per_user=True)
+def trainer_class_analytics():
+    try:
+        weeks = _parse_arg('weeks', int)
+        if weeks is None:
+            weeks = app.config['ANALYTICS_DEFAULT_WEEKS']
+        if not 1 <= weeks <= ANALYTICS_MAX_WEEKS:
+            return jsonify({'error': f'weeks must be between 1 and {ANALYTICS_MAX_WEEKS}'}), 400
+        return jsonify(trainer_analytics(db.session, get_jwt_identity(), weeks)), 200
+    except ValueError as ve:
+        logging.info(f"Trainer analytics rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Trainer analytics error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/attendance', methods=['GET', 'POST'])
-@jwt_required()
+@role_required('user')
 def attendance():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'user':
-            return jsonify({'error': 'Access denied'}), 403
         if request.method == 'GET':
-            attendances = Attendance.query.filter_by(user_id=user_id).all()
-            return jsonify([a.to_dict() for a in attendances]), 200
+            cursor, limit = _page_args()
+            attendances, next_cursor = attendance_page(
+                db.session, user_id, cursor, limit,
+                start=_parse_arg('from', date.fromisoformat),
+                end=_parse_arg('to', date.fromisoformat)
+            )
+            return jsonify(page_payload(attendances, next_cursor)), 200
         elif request.method == 'POST':
-            attendance = Attendance(user_id=user_id, date=datetime.utcnow().date(), attended=True)
-            db.session.add(attendance)
+            inserted = upsert_checkins([(user_id, datetime.utcnow().date())])
             db.session.commit()
+            if not inserted:
+                return jsonify({'message': 'Attendance already marked'}), 200
             logging.info(f"Attendance marked for user_id {user_id}")
             return jsonify({'message': 'Attendance marked'}), 200
+    except ValueError as ve:
+        logging.info(f"Attendance query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
     except Exception as e:
         logging.error(f"Attendance error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/rsvp', methods=['POST'])
-@jwt_required()
+@app.route('/api/attendance/calendar', methods=['GET'])
+@role_required('user')
+def attendance_calendar():
+    try:
+        user_id = get_jwt_identity()
+        if request.args.get('from') or request.args.get('to'):
+            start = date.fromisoformat(request.args['from'])
+            end = date.fromisoformat(request.args['to'])
+        else:
+            year = int(request.args.get('year', date.today().year))
+            start, end = date(year, 1, 1), date(year, 12, 31)
+        if end < start or (end - start).days >= CALENDAR_MAX_DAYS:
+            return jsonify({'error': f'Range must be 1 to {CALENDAR_MAX_DAYS} days'}), 400
+        return jsonify(build_calendar(user_id, start, end)), 200
+    except (KeyError, ValueError) as ve:
+        logging.info(f"Attendance calendar query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Attendance calendar error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/attendance/batch', methods=['POST'])
+@role_required('admin', 'device')
+def attendance_batch():
+    try:
+        data = request.json or {}
+        events = data.get('events')
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'events must be a non-empty list'}), 400
+        if len(events) > app.config['CHECKIN_BATCH_LIMIT']:
+            return jsonify({'error': f"At most {app.config['CHECKIN_BATCH_LIMIT']} events per batch"}), 413
+        results = record_checkins(events)
+        summary = {status: sum(1 for r in results if r['status'] == status) for status in (CREATED, DUPLICATE, INVALID)}
+        logging.info(f"Batch check-in from {current_username()}: {summary}")
+        return jsonify({'results': results, 'summary': summary}), 200
+    except Exception as e:
+        logging.error(f"Batch check-in error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/rsvp', methods=['POST', 'DELETE'])
+@role_required('user')
 def rsvp_class():
     try:
         data = request.json
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'user':
-            return jsonify({'error': 'Access denied'}), 403
-        class_instance = WorkoutClass.query.get(data['class_id'])
-        if not class_instance or class_instance.current_capacity >= class_instance.max_capacity:
-            return jsonify({'error': 'Class full or not found'}), 400
-        rsvp = ClassRSVP(user_id=user_id, class_id=data['class_id'], attending=True)
-        class_instance.current_capacity += 1
-        db.session.add(rsvp)
-        db.session.commit()
-        logging.info(f"User {user_id} RSVP'd for class {data['class_id']}")
-        return jsonify({'message': 'RSVP successful'}), 200
+        if request.method == 'POST':
+            if 'class_id' not in data and 'series_id' in data:
+                # An occurrence of a recurring class: the first RSVP gives it a class row. Occurrences
+                # are naive UTC, so an offset is converted rather than compared with them
+                data['class_id'] = materialize(int(data['series_id']), parse_timestamp(data['date_time']))
+            rsvp = reserve(user_id, data['class_id'])
+            if rsvp.attending:
+                logging.info(f"User {user_id} RSVP'd for class {data['class_id']}")
+                return jsonify({'message': 'RSVP successful', 'status': 'confirmed', 'class_id': rsvp.class_id}), 200
+            position = waitlist_position(rsvp)
+            logging.info(f"User {user_id} waitlisted for class {data['class_id']} at position {position}")
+            return jsonify({'message': f'Class full, you are #{position} on the waitlist', 'status': 'waitlisted', 'position': position,
+                            'class_id': rsvp.class_id}), 200
+        elif request.method == 'DELETE':
+            promoted = cancel(user_id, data['class_id'])
+            logging.info(f"User {user_id} cancelled RSVP for class {data['class_id']}")
+            if promoted:
+                logging.info(f"User {promoted.user_id} promoted from waitlist for class {data['class_id']}")
+            return jsonify({'message': 'RSVP cancelled'}), 200
+    except (RSVPError, SeriesError) as re:
+        return jsonify({'error': str(re)}), re.status
+    except (KeyError, ValueError) as ve:
+        logging.info(f"RSVP rejected: {str(ve)}")
+        return jsonify({'error': 'class_id, or series_id and date_time, required'}), 400
     except Exception as e:
         logging.error(f"RSVP error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/classes', methods=['GET', 'POST'])
 @jwt_required()
+@conditional(*CLASS_LIST_TABLES)
 def classes():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         if request.method == 'GET':
-            classes = WorkoutClass.query.all()
-            return jsonify([c.to_dict() for c in classes]), 200
+            cursor, limit = _page_args()
+            classes, next_cursor = classes_page(
+                db.session, cursor, limit,
+                trainer_id=_parse_arg('trainer_id', int),
+                start=_parse_arg('from', datetime.fromisoformat),
+                end=_parse_arg('to', datetime.fromisoformat)
+            )
+            return jsonify(page_payload(classes, next_cursor)), 200
         elif request.method == 'POST':
-            if user.role != 'trainer':
+            if get_jwt().get('role') != 'trainer':
                 return jsonify({'error': 'Access denied'}), 403
             data = request.json
             class_instance = WorkoutClass(
                 trainer_id=user_id,
                 name=data['name'],
-                date_time=data['date_time'],
+                date_time=datetime.fromisoformat(data['date_time']),
                 max_capacity=data.get('max_capacity', 10)
             )
             db.session.add(class_instance)
             db.session.commit()
-            logging.info(f"Class {data['name']} created by trainer {user.username}")
+            logging.info(f"Class {data['name']} created by trainer {current_username()}")
             return jsonify(class_instance.to_dict()), 201
+    except ValueError as ve:
+        logging.info(f"Class query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
     except Exception as e:
         logging.error(f"Class error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/subscriptions', methods=['POST'])
+@app.route('/api/classes/search', methods=['GET'])
 @jwt_required()
+def search_classes():
+    try:
+        cursor, limit = _page_args()
+        classes, next_cursor = schedule_page(db.session, cursor, limit, **schedule_filters(request.args))
+        return jsonify(page_payload(classes, next_cursor)), 200
+    except ValueError as ve:
+        logging.info(f"Class search rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Class search error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/class-series', methods=['GET', 'POST'])
+@jwt_required()
+def class_series():
+    try:
+        user_id = get_jwt_identity()
+        if request.method == 'GET':
+            cursor, limit = _page_args()
+            query = ClassSeries.query
+            trainer_id = _parse_arg('trainer_id', int)
+            if trainer_id:
+                query = query.filter(ClassSeries.trainer_id == trainer_id)
+            series, next_cursor = paginate(query, [ClassSeries.id], cursor, limit)
+            return jsonify(page_payload(series, next_cursor)), 200
+        elif request.method == 'POST':
+            if get_jwt().get('role') != 'trainer':
+                return jsonify({'error': 'Access denied'}), 403
+            data = request.json
+            series = ClassSeries(trainer_id=user_id, **parse_series(data))
+            for day in {date.fromisoformat(day) for day in data.get('exceptions', [])}:
+                series.exceptions.append(ClassSeriesException(date=day))
+            db.session.add(series)
+            db.session.commit()
+            logging.info(f"Class series {series.name} created by trainer {current_username()}")
+            return jsonify(series.to_dict()), 201
+    except (KeyError, TypeError, ValueError) as ve:
+        logging.info(f"Class series request rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid class series'}), 400
+    except Exception as e:
+        logging.error(f"Class series error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/class-series/<int:series_id>/exceptions', methods=['POST'])
+@role_required('trainer', 'admin')
+def class_series_exception(series_id):
+    try:
+        series = ClassSeries.query.get(series_id)
+        if not series:
+            return jsonify({'error': 'Class series not found'}), 404
+        claims = get_jwt()
+        if claims.get('role') == 'trainer' and series.trainer_id != get_jwt_identity():
+            return jsonify({'error': 'Access denied'}), 403
+        day = date.fromisoformat(request.json['date'])
+        add_exception(series, day)
+        logging.info(f"Class series {series_id} cancelled on {day} by {current_username()}")
+        return jsonify({'message': 'Occurrence cancelled'}), 200
+    except SeriesError as se:
+        return jsonify({'error': str(se)}), se.status
+    except (KeyError, TypeError, ValueError) as ve:
+        logging.info(f"Class series exception rejected: {str(ve)}")
+        return jsonify({'error': 'date must be an ISO date'}), 400
+    except Exception as e:
+        logging.error(f"Class series exception error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/timetable', methods=['GET'])
+@jwt_required()
+def class_timetable():
+    try:
+        start = _parse_arg('from', datetime.fromisoformat) or datetime.utcnow()
+        end = _parse_arg('to', datetime.fromisoformat) or start + timedelta(days=7)
+        items = timetable(db.session, start, end, trainer_id=_parse_arg('trainer_id', int))
+        return jsonify({'items': items}), 200
+    except ValueError as ve:
+        logging.info(f"Timetable query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Timetable error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/subscriptions', methods=['GET'])
+@jwt_required()
+@conditional(*PLAN_LIST_TABLES)
+def subscription_plans():
+    try:
+        plans = SubscriptionPlan.query.order_by(SubscriptionPlan.id).all()
+        return jsonify([plan.to_dict() for plan in plans]), 200
+    except Exception as e:
+        logging.error(f"Subscription plans error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/subscriptions', methods=['POST'])
+@role_required('admin')
 def create_subscription():
     try:
         data = request.json
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'admin':
-            logging.info(f"Unauthorized subscription creation attempt by user_id {user_id}")
-            return jsonify({'error': 'Access denied'}), 403
         
         duration_months = int(data.get('duration_months', 0))
         if duration_months < 1 or duration_months > 60:
@@ -228,7 +479,7 @@ def create_subscription():
         )
         db.session.add(subscription)
         db.session.commit()
-        logging.info(f"Subscription {data['plan_name']} created by admin {user.username}")
+        logging.info(f"Subscription {data['plan_name']} created by admin {current_username()}")
         return jsonify(subscription.to_dict()), 201
     except ValueError as ve:
         logging.error(f"Subscription creation error: Invalid input {str(ve)}")
@@ -238,30 +489,27 @@ def create_subscription():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/users', methods=['GET', 'POST', 'PUT', 'DELETE'])
-@jwt_required()
+@role_required('admin')
 def manage_users():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'admin':
-            logging.info(f"Unauthorized user management attempt by user_id {user_id} with role {user.role}")
-            return jsonify({'error': 'Access denied'}), 403
+        admin_username = current_username()
         if request.method == 'GET':
-            users = User.query.all()
-            return jsonify([u.to_dict() for u in users]), 200
+            cursor, limit = _page_args()
+            users, next_cursor = users_page(db.session, cursor, limit, role=request.args.get('role'))
+            return jsonify(page_payload(users, next_cursor)), 200
         elif request.method == 'POST':
             data = request.json
             new_user = User(username=data['username'], email=data['email'], role=data.get('role', 'user'))
             new_user.set_password(data['password'])
             db.session.add(new_user)
             db.session.commit()
-            logging.info(f"Admin {user.username} created user {data['username']}")
+            logging.info(f"Admin {admin_username} created user {data['username']}")
             return jsonify(new_user.to_dict()), 201
         elif request.method == 'PUT':
             data = request.json
             user_to_update = User.query.get(data['id'])
             if not user_to_update:
-                logging.info(f"User {data['id']} not found for update by admin {user.username}")
+                logging.info(f"User {data['id']} not found for update by admin {admin_username}")
                 return jsonify({'error': 'User not found'}), 404
             user_to_update.username = data.get('username', user_to_update.username)
             user_to_update.email = data.get('email', user_to_update.email)
@@ -269,7 +517,7 @@ def manage_users():
             if data.get('password'):
                 user_to_update.set_password(data['password'])
             db.session.commit()
-            logging.info(f"Admin {user.username} updated user {user_to_update.username}")
+            logging.info(f"Admin {admin_username} updated user {user_to_update.username}")
             return jsonify(user_to_update.to_dict()), 200
         elif request.method == 'DELETE':
             data = request.json
@@ -277,45 +525,82 @@ def manage_users():
             if user_to_delete:
                 db.session.delete(user_to_delete)
                 db.session.commit()
-                logging.info(f"Admin {user.username} deleted user {data['id']}")
+                logging.info(f"Admin {admin_username} deleted user {data['id']}")
                 return jsonify({'message': 'User deleted'}), 200
             return jsonify({'error': 'User not found'}), 404
+    except ValueError as ve:
+        logging.info(f"User management query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
     except Exception as e:
         logging.error(f"User management error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/users/import', methods=['POST'])
+@role_required('admin')
+def import_users():
+    try:
+        fmt = request.args.get('format') or ('ndjson' if 'ndjson' in (request.mimetype or '') else 'csv')
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+        logging.info(f"Admin {current_username()} started a {fmt} member import")
+        # Rows are read from the request body as the import progresses and
+        # results are streamed back as NDJSON, ending with a summary line
+        lines = (json.dumps(item) + '\n' for item in run_import(request.stream, fmt))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+    except Exception as e:
+        logging.error(f"Member import error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/exports/<dataset>', methods=['GET'])
+@role_required('admin')
+def export_data(dataset):
+    try:
+        if dataset not in EXPORT_DATASETS:
+            return jsonify({'error': f"dataset must be one of {', '.join(EXPORT_DATASETS)}"}), 404
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        statement = export_query(dataset, request.args.get('from'), request.args.get('to'), request.args.get('role'))
+        logging.info(f"Admin {current_username()} exported {dataset} as {fmt}")
+        return Response(stream_with_context(stream_export(statement, fmt)), mimetype=EXPORT_FORMATS[fmt], headers={
+            'Content-Disposition': f'attachment; filename={dataset}.{fmt}'
+        }), 200
+    except ValueError as ve:
+        logging.info(f"Export query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    except Exception as e:
+        logging.error(f"Export error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/trainers', methods=['GET', 'POST', 'PUT', 'DELETE'])
-@jwt_required()
+@role_required('admin')
 def manage_trainers():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'admin':
-            logging.info(f"Unauthorized trainer management attempt by user_id {user_id} with role {user.role}")
-            return jsonify({'error': 'Access denied'}), 403
+        admin_username = current_username()
         if request.method == 'GET':
-            trainers = User.query.filter_by(role='trainer').all()
-            return jsonify([t.to_dict() for t in trainers]), 200
+            cursor, limit = _page_args()
+            trainers, next_cursor = users_page(db.session, cursor, limit, role='trainer')
+            return jsonify(page_payload(trainers, next_cursor)), 200
         elif request.method == 'POST':
             data = request.json
             new_trainer = User(username=data['username'], email=data['email'], role='trainer')
             new_trainer.set_password(data['password'])
             db.session.add(new_trainer)
             db.session.commit()
-            logging.info(f"Admin {user.username} created trainer {data['username']}")
+            logging.info(f"Admin {admin_username} created trainer {data['username']}")
             return jsonify(new_trainer.to_dict()), 201
         elif request.method == 'PUT':
             data = request.json
             trainer_to_update = User.query.get(data['id'])
             if not trainer_to_update:
-                logging.info(f"Trainer {data['id']} not found for update by admin {user.username}")
+                logging.info(f"Trainer {data['id']} not found for update by admin {admin_username}")
                 return jsonify({'error': 'Trainer not found'}), 404
             trainer_to_update.username = data.get('username', trainer_to_update.username)
             trainer_to_update.email = data.get('email', trainer_to_update.email)
             if data.get('password'):
                 trainer_to_update.set_password(data['password'])
             db.session.commit()
-            logging.info(f"Admin {user.username} updated trainer {trainer_to_update.username}")
+            logging.info(f"Admin {admin_username} updated trainer {trainer_to_update.username}")
             return jsonify(trainer_to_update.to_dict()), 200
         elif request.method == 'DELETE':
             data = request.json
@@ -323,9 +608,12 @@ def manage_trainers():
             if trainer_to_delete:
                 db.session.delete(trainer_to_delete)
                 db.session.commit()
-                logging.info(f"Admin {user.username} deleted trainer {data['id']}")
+                logging.info(f"Admin {admin_username} deleted trainer {data['id']}")
                 return jsonify({'message': 'Trainer deleted'}), 200
             return jsonify({'error': 'Trainer not found'}), 404
+    except ValueError as ve:
+        logging.info(f"Trainer management query rejected: {str(ve)}")
+        return jsonify({'error': 'Invalid query parameters'}), 400
     except Exception as e:
         logging.error(f"Trainer management error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -358,14 +646,9 @@ def health_profile():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/assign-trainer', methods=['POST'])
-@jwt_required()
+@role_required('admin')
 def assign_trainer():
     try:
-        user_id = get_jwt_identity()
-        admin = User.query.get(user_id)
-        if admin.role != 'admin':
-            logging.info(f"Unauthorized trainer assignment attempt by user_id {user_id}")
-            return jsonify({'error': 'Access denied'}), 403
         data = request.json
         user = User.query.get(data['user_id'])
         trainer = User.query.get(data['trainer_id'])
@@ -375,38 +658,41 @@ def assign_trainer():
         if trainer.role != 'trainer':
             logging.info(f"Invalid trainer role for trainer_id {data['trainer_id']}")
             return jsonify({'error': 'Selected user is not a trainer'}), 400
-        if trainer in user.trainers:
+        # One EXISTS on the association table rather than loading every trainer the user already has
+        assigned = db.session.query(exists().where(
+            trainer_trainee.c.trainer_id == trainer.id,
+            trainer_trainee.c.trainee_id == user.id
+        )).scalar()
+        if assigned:
             logging.info(f"Trainer {trainer.username} already assigned to user {user.username}")
             return jsonify({'error': 'Trainer already assigned to this user'}), 400
         user.trainers.append(trainer)
         db.session.commit()
-        logging.info(f"Admin {admin.username} assigned trainer {trainer.username} to user {user.username}")
+        logging.info(f"Admin {current_username()} assigned trainer {trainer.username} to user {user.username}")
         return jsonify({'message': 'Trainer assigned successfully'}), 200
     except Exception as e:
         logging.error(f"Trainer assignment error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/user-subscriptions', methods=['POST'])
-@jwt_required()
+@role_required('user')
 def register_subscription():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        if user.role != 'user':
-            logging.info(f"Unauthorized subscription registration attempt by user_id {user_id}")
-            return jsonify({'error': 'Access denied'}), 403
         data = request.json
         plan = SubscriptionPlan.query.get(data['plan_id'])
         if not plan:
             logging.info(f"Subscription plan {data['plan_id']} not found")
             return jsonify({'error': 'Subscription plan not found'}), 404
-        # Check for active subscription
-        active_sub = UserSubscription.query.filter_by(user_id=user_id).filter(UserSubscription.end_date > datetime.utcnow()).first()
-        if active_sub:
+        # Row lock: two requests from one member cannot both pass the check below
+        user = User.query.filter_by(id=user_id).with_for_update().first()
+        if is_active(user.active_until):
             logging.info(f"User {user_id} has an active subscription")
             return jsonify({'error': 'You have an active subscription. Cannot register for a new one until the current one expires'}), 400
         # Check if already subscribed to this plan
-        existing_subscription = UserSubscription.query.filter_by(user_id=user_id, plan_id=data['plan_id']).first()
+        existing_subscription = db.session.query(exists().where(
+            UserSubscription.user_id == user_id, UserSubscription.plan_id == plan.id
+        )).scalar()
         if existing_subscription:
             logging.info(f"User {user_id} already subscribed to plan {data['plan_id']}")
             return jsonify({'error': 'Already subscribed to this plan'}), 400
@@ -420,8 +706,11 @@ def register_subscription():
             end_date=end_date
         )
         db.session.add(subscription)
+        db.session.flush()
+        activate(user, subscription)
+        enqueue(db.session, [subscription_message(user, plan, subscription)])
         db.session.commit()
-        logging.info(f"User {user.username} subscribed to plan {plan.name}")
+        logging.info(f"User {current_username()} subscribed to plan {plan.name}")
         return jsonify(subscription.to_dict()), 201
     except Exception as e:
         logging.error(f"Subscription registration error: {str(e)}")
@@ -0,0 +1,121 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import User, WorkoutClass, ClassRSVP
+from cache import invalidate_on_commit, SHARED
+from outbox import enqueue, rsvp_message, promotion_message
+
+# A ClassRSVP with attending=True holds one of the class's spots; one with
+# attending=False is on the waitlist, which is served in id order.
+
+
+class RSVPError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# What the emails need of the class, returned by the UPDATE that locks its row
+CLASS_DETAILS = (WorkoutClass.name, WorkoutClass.date_time)
+
+
+def _claim_spot(class_id):
+    # Check and increment in one conditional UPDATE so concurrent workers can
+    # never push current_capacity past max_capacity. Returns the class's
+    # CLASS_DETAILS, or None when it had no spot left
+    return db.session.execute(
+        update(WorkoutClass)
+        .where(WorkoutClass.id == class_id, WorkoutClass.current_capacity < WorkoutClass.max_capacity)
+        .values(current_capacity=WorkoutClass.current_capacity + 1)
+        .returning(*CLASS_DETAILS)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
+def _lock_class(class_id):
+    # A no-op UPDATE rather than SELECT ... FOR UPDATE: it takes the row lock
+    # on Postgres and also opens the write transaction on SQLite, which
+    # ignores FOR UPDATE. Returns the class's CLASS_DETAILS, or None when it
+    # does not exist. The stamp is kept too, so the class lists' tags stay
+    # put (conditional.py)
+    return db.session.execute(
+        update(WorkoutClass)
+        .where(WorkoutClass.id == class_id)
+        .values(current_capacity=WorkoutClass.current_capacity, updated_at=WorkoutClass.updated_at)
+        .returning(*CLASS_DETAILS)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
+def reserve(user_id, class_id):
+    """Give user_id a spot in class_id, or a place on its waitlist when full.
+
+    The unique (user_id, class_id) index rejects duplicates; the failed insert
+    rolls back the spot claimed in the same transaction.
+    """
+    # For the email, read before the class row is locked so the lock covers the writes only
+    member = db.session.execute(select(User.id, User.email, User.username).where(User.id == user_id)).first()
+    if member is None:
+        raise RSVPError('User not found', 404)
+    workout_class = _claim_spot(class_id)
+    claimed = workout_class is not None
+    if not claimed:
+        # Full on the fast path: take the class row lock so a concurrent
+        # cancel cannot free a spot between this check and joining the waitlist
+        workout_class = _lock_class(class_id)
+        if workout_class is None:
+            db.session.rollback()
+            raise RSVPError('Class not found', 404)
+        claimed = _claim_spot(class_id) is not None
+    rsvp = ClassRSVP(user_id=user_id, class_id=class_id, attending=claimed)
+    db.session.add(rsvp)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise RSVPError('Already RSVP\'d for this class')
+    enqueue(db.session, [rsvp_message(member, workout_class, claimed)])
+    invalidate_on_commit(db.session, SHARED)
+    db.session.commit()
+    return rsvp
+
+
+def cancel(user_id, class_id):
+    """Drop user_id's RSVP and hand a freed spot to the head of the waitlist.
+
+    Returns the promoted ClassRSVP, or None when nobody was waiting.
+    """
+    workout_class = _lock_class(class_id)
+    if workout_class is None:
+        db.session.rollback()
+        raise RSVPError('Class not found', 404)
+    rsvp = ClassRSVP.query.filter_by(user_id=user_id, class_id=class_id).first()
+    if not rsvp:
+        db.session.rollback()
+        raise RSVPError('RSVP not found', 404)
+    promoted = None
+    if rsvp.attending:
+        promoted = (ClassRSVP.query.filter_by(class_id=class_id, attending=False)
+                    .order_by(ClassRSVP.id).first())
+        if promoted:
+            promoted.attending = True
+            enqueue(db.session, [promotion_message(promoted.user, workout_class)])
+        else:
+            db.session.execute(
+                update(WorkoutClass)
+                .where(WorkoutClass.id == class_id, WorkoutClass.current_capacity > 0)
+                .values(current_capacity=WorkoutClass.current_capacity - 1)
+                .execution_options(synchronize_session=False)
+            )
+    db.session.delete(rsvp)
+    invalidate_on_commit(db.session, SHARED)
+    db.session.commit()
+    return promoted
+
+
+def waitlist_position(rsvp):
+    return db.session.query(func.count(ClassRSVP.id)).filter(
+        ClassRSVP.class_id == rsvp.class_id,
+        ClassRSVP.attending.is_(False),
+        ClassRSVP.id <= rsvp.id
+    ).scalar()
@@ -1,3 +1,13 @@
 #!/bin/bash
 # Start the server
-exec gunicorn app:app --bind 0.0.0.0:$PORT --workers 3
\ No newline at end of file
+# Threaded workers keep serving other requests while a login waits on the
+# password hashing pool (hashing.py), which is sized from WEB_CONCURRENCY.
+# SERVER_MODE=async serves asgi.py instead: the dashboard, classes and
+# attendance reads run on an async engine, everything else on Flask as before.
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-3}
+# One rotated log file per worker (log_pipeline.py); stdout carries the same JSON lines
+export LOG_FILE="${LOG_FILE:-backend-{pid\}.log}"
+if [ "${SERVER_MODE:-sync}" = "async" ]; then
+  exec uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers $WEB_CONCURRENCY
+fi
+exec gunicorn app:app --bind 0.0.0.0:$PORT --workers $WEB_CONCURRENCY --threads ${GUNICORN_THREADS:-4}
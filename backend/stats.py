@@ -0,0 +1,91 @@
+from collections import Counter
+from sqlalchemy import event, func, inspect, insert
+from sqlalchemy.orm import Session
+from config import app, db
+from models import User, SubscriptionPlan, StatCounter
+from dialects import upsert_insert
+
+# Admin dashboard stats are read from the stat_counters table, which the
+# session hook below keeps in step with every flush that creates, deletes or
+# re-roles a user or creates/deletes a plan, inside the same transaction.
+
+USERS = 'users'
+PLANS = 'subscription_plans'
+ROLES = ('user', 'trainer', 'admin')
+
+counters_table = StatCounter.__table__
+
+
+def role_counter(role):
+    return f'role:{role}'
+
+
+REQUIRED = (USERS, PLANS) + tuple(role_counter(role) for role in ROLES)
+
+
+def count_rows():
+    """Exact counts from COUNT / GROUP BY role aggregates."""
+    counts = {USERS: 0, PLANS: db.session.query(func.count(SubscriptionPlan.id)).scalar()}
+    counts.update({role_counter(role): 0 for role in ROLES})
+    for role, count in db.session.query(User.role, func.count(User.id)).group_by(User.role):
+        counts[role_counter(role)] = count
+        counts[USERS] += count
+    return counts
+
+
+def recount():
+    counts = count_rows()
+    # Only the counts: the table also holds conditional.py's version counters
+    db.session.execute(counters_table.delete().where(counters_table.c.name.in_(list(counts))))
+    db.session.execute(insert(counters_table), [{'name': name, 'value': value} for name, value in counts.items()])
+    db.session.commit()
+    return counts
+
+
+def get_counters():
+    counters = dict(db.session.query(StatCounter.name, StatCounter.value))
+    if any(name not in counters for name in REQUIRED):
+        # Table not seeded yet (fresh create_all database): fall back to the aggregates once
+        counters = recount()
+    return counters
+
+
+def bump(connection, deltas):
+    # Upserted: a role first seen after the counters were seeded (e.g.
+    # 'device') starts its row from the delta. Name order, so concurrent
+    # flushes lock the rows in the same order
+    rows = [{'name': name, 'value': delta} for name, delta in sorted(deltas.items()) if delta]
+    if rows:
+        statement = upsert_insert(StatCounter)
+        connection.execute(
+            statement.on_conflict_do_update(index_elements=['name'],
+                                            set_={'value': counters_table.c.value + statement.excluded.value}),
+            rows
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_counters(session, flush_context):
+    deltas = Counter()
+    for sign, instances in ((1, session.new), (-1, session.deleted)):
+        for instance in instances:
+            if isinstance(instance, User):
+                deltas[USERS] += sign
+                deltas[role_counter(instance.role)] += sign
+            elif isinstance(instance, SubscriptionPlan):
+                deltas[PLANS] += sign
+    for instance in session.dirty:
+        if isinstance(instance, User):
+            history = inspect(instance).attrs.role.history
+            if history.added and history.deleted:
+                deltas[role_counter(history.deleted[0])] -= 1
+                deltas[role_counter(history.added[0])] += 1
+    if deltas:
+        bump(session.connection(), deltas)
+
+
+@app.cli.command('recount-stats')
+def recount_stats_command():
+    """Rebuild the admin dashboard counters from the users and plans tables."""
+    for name, value in sorted(recount().items()):
+        print(f'{name}: {value}')
@@ -0,0 +1,175 @@
+import atexit
+import click
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from config import app, db
+from models import User, UserSubscription
+from cache import invalidate_on_commit
+from outbox import enqueue, expiry_message
+
+# Whether a member has access is read from users.active_until, which is set
+# when they subscribe and moved on by the expiry job below once it passes.
+# Access checks compare it with the clock, so a job that runs late never
+# grants extra days; it only keeps the partial index ix_users_active_until
+# down to members with access and points current_subscription_id at
+# whatever subscription (if any) is running next.
+
+app.config.setdefault('SUBSCRIPTION_EXPIRY_BATCH', int(os.getenv('SUBSCRIPTION_EXPIRY_BATCH', 1000)))
+# Seconds between runs of the in-process job; 0 leaves expiry to the CLI command (cron)
+app.config.setdefault('SUBSCRIPTION_EXPIRY_INTERVAL', float(os.getenv('SUBSCRIPTION_EXPIRY_INTERVAL', 0)))
+
+
+def is_active(active_until, now=None):
+    return active_until is not None and active_until > (now or datetime.utcnow())
+
+
+def days_left(active_until, now=None):
+    """Whole days of access left, rounded up; 0 once expired."""
+    if not is_active(active_until, now):
+        return 0
+    return math.ceil((active_until - (now or datetime.utcnow())) / timedelta(days=1))
+
+
+def membership(user):
+    # Cached in the member's dashboard snapshot; see membership_status
+    return {
+        'subscription_id': user.current_subscription_id,
+        'active_until': user.active_until.isoformat() if user.active_until else None,
+    }
+
+
+def membership_status(cached, now=None):
+    """A membership() dict with active and days_left as of now."""
+    active_until = datetime.fromisoformat(cached['active_until']) if cached['active_until'] else None
+    return {**cached, 'active': is_active(active_until, now), 'days_left': days_left(active_until, now)}
+
+
+def activate(user, subscription):
+    """Record a new subscription as the member's current one (caller commits)."""
+    user.current_subscription_id = subscription.id
+    user.active_until = subscription.end_date
+
+
+def _running(user_ids, now):
+    """{user_id: (subscription id, end_date)} of the latest-ending subscription still running."""
+    latest = {}
+    rows = db.session.execute(
+        select(UserSubscription.user_id, UserSubscription.id, UserSubscription.end_date)
+        .where(UserSubscription.user_id.in_(user_ids), UserSubscription.end_date > now)
+    )
+    for user_id, subscription_id, end_date in rows:
+        if user_id not in latest or end_date > latest[user_id][1]:
+            latest[user_id] = (subscription_id, end_date)
+    return latest
+
+
+def _transition(user_ids, now, lapsed=()):
+    """Point user_ids at their running subscription, or none; lapsed members
+    (id, email, username, active_until) left without one are emailed."""
+    running = _running(user_ids, now)
+    enqueue(db.session, [expiry_message(*member) for member in lapsed if member[0] not in running])
+    rows = []
+    for user_id in user_ids:
+        subscription_id, end_date = running.get(user_id, (None, None))
+        rows.append({'id': user_id, 'current_subscription_id': subscription_id, 'active_until': end_date})
+    db.session.execute(update(User), rows)
+    # Bulk update by primary key: the session's flush hook never sees it
+    invalidate_on_commit(db.session, *user_ids)
+    db.session.commit()
+    return len(running)
+
+
+def expire_subscriptions(now=None, batch_size=None):
+    """Move every member whose access has ended on to their next running
+    subscription, or clear it and queue an email saying so; batch_size
+    members per transaction.
+
+    Returns {'expired': members left without access, 'renewed': members moved on}.
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or app.config['SUBSCRIPTION_EXPIRY_BATCH']
+    totals = {'expired': 0, 'renewed': 0}
+    while True:
+        # SKIP LOCKED lets several workers (or a worker and cron) share the
+        # backlog; every batch leaves the range, so the loop ends
+        lapsed = db.session.execute(
+            select(User.id, User.email, User.username, User.active_until).where(User.active_until <= now)
+            .order_by(User.active_until).limit(batch_size).with_for_update(skip_locked=True)
+        ).all()
+        if not lapsed:
+            return totals
+        user_ids = [member.id for member in lapsed]
+        renewed = _transition(user_ids, now, lapsed)
+        totals['renewed'] += renewed
+        totals['expired'] += len(user_ids) - renewed
+
+
+def rebuild_memberships(now=None, batch_size=None):
+    """Recompute the membership columns of every user from user_subscriptions.
+
+    For rows written around the ORM (bulk imports, benchmark data) or to
+    repair drift; returns the number of members with access.
+    """
+    now = now or datetime.utcnow()
+    batch_size = batch_size or app.config['SUBSCRIPTION_EXPIRY_BATCH']
+    active, last_id = 0, 0
+    while True:
+        user_ids = db.session.execute(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).scalars().all()
+        if not user_ids:
+            return active
+        active += _transition(user_ids, now)
+        last_id = user_ids[-1]
+
+
+class ExpiryScheduler:
+    """Runs expire_subscriptions every `interval` seconds on a daemon thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='subscription-expiry', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    totals = expire_subscriptions()
+                    if totals['expired'] or totals['renewed']:
+                        logging.info(f"Subscription expiry: {totals['expired']} expired, {totals['renewed']} renewed")
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Subscription expiry error: {str(e)}")
+
+
+def start_expiry_scheduler():
+    """Start the in-process job when SUBSCRIPTION_EXPIRY_INTERVAL is set; each worker runs one."""
+    interval = app.config['SUBSCRIPTION_EXPIRY_INTERVAL']
+    if interval <= 0:
+        return None
+    scheduler = ExpiryScheduler(interval)
+    scheduler.start()
+    return scheduler
+
+
+@app.cli.command('expire-subscriptions')
+@click.option('--rebuild', is_flag=True, help='recompute every member from user_subscriptions instead')
+def expire_subscriptions_command(rebuild):
+    """End access for members whose subscription has run out."""
+    if rebuild:
+        print(f'active members: {rebuild_memberships()}')
+        return
+    for name, value in expire_subscriptions().items():
+        print(f'{name}: {value}')
@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+# Tests drop and create every table, so they must never fall through to the
+# DATABASE_URL in .env, which points at the deployed instance. A scratch
+# SQLite file rather than memory, so the async engine (asgi.py) reaches it too
+os.environ['DATABASE_URL'] = (os.getenv('TEST_DATABASE_URL')
+                              or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='gym-tests-'), 'test.db')}")
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret')
+# Logs to stdout only, for the tests that load app.py
+os.environ['LOG_FILE'] = ''
+# Server-Timing carries each response's statement count
+os.environ['INSTRUMENTATION_ENABLED'] = 'True'
+# Class list tags settle at once, so a test can revalidate right after a write
+os.environ['ETAG_SETTLE_SECONDS'] = '0'
+
+import pytest  # noqa: E402
+from config import app, db  # noqa: E402
+from auth import denylist, issue_token  # noqa: E402
+from cache import dashboard_cache  # noqa: E402
+import routes  # noqa: E402,F401
+
+
+@pytest.fixture
+def database():
+    """Empty tables, inside an app context, for one test."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        denylist.refresh()
+        dashboard_cache.clear()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(database):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers():
+    """Authorization headers for a user, with the claims login would issue."""
+    def headers(user):
+        return {'Authorization': f'Bearer {issue_token(user)}'}
+    return headers
@@ -0,0 +1,158 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytest
+import analytics
+from config import app, db
+from models import User, WorkoutClass, ClassRSVP, Attendance, ClassSeries, ClassDayStat, SeriesRegular
+from analytics import refresh_rollups, trainer_analytics
+
+TODAY = date.today()
+
+
+def seed_history(rng, days=60):
+    trainers = [User(username=f'trainer{i}', email=f'trainer{i}@example.com', password_hash='x', role='trainer')
+                for i in range(2)]
+    members = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x', role='user')
+               for i in range(12)]
+    db.session.add_all(trainers + members)
+    db.session.flush()
+    series = [ClassSeries(name=f'Series {i}', trainer_id=trainers[i % 2].id, max_capacity=6, weekdays='MO,WE,FR',
+                          start_time=time(9 + i), interval_weeks=1, starts_on=TODAY - timedelta(days=days))
+              for i in range(3)]
+    db.session.add_all(series)
+    db.session.flush()
+    add_classes(rng, trainers, members, series, TODAY - timedelta(days=days), TODAY + timedelta(days=3))
+    db.session.commit()
+    return trainers, members, series
+
+
+def add_classes(rng, trainers, members, series, start, end):
+    day = start
+    while day < end:
+        for _ in range(rng.randint(0, 3)):
+            s = rng.choice(series + [None])
+            workout_class = WorkoutClass(
+                name=s.name if s else 'Drop-in', trainer_id=s.trainer_id if s else rng.choice(trainers).id,
+                series_id=s.id if s else None, max_capacity=6, current_capacity=0,
+                date_time=datetime.combine(day, time(rng.randint(6, 20), rng.choice((0, 30))))
+            )
+            db.session.add(workout_class)
+            db.session.flush()
+            for member in rng.sample(members, rng.randint(0, 9)):
+                attending = workout_class.current_capacity < workout_class.max_capacity
+                workout_class.current_capacity += attending
+                db.session.add(ClassRSVP(user_id=member.id, class_id=workout_class.id, attending=attending))
+                if rng.random() < 0.6:
+                    check_in(member, day)
+        day += timedelta(days=1)
+
+
+def check_in(member, day):
+    # Once per member and day, as the check-in endpoints store them
+    if not Attendance.query.filter_by(user_id=member.id, date=day).first():
+        db.session.add(Attendance(user_id=member.id, date=day, attended=True))
+        db.session.flush()
+
+
+def recount(end=TODAY):
+    """class_day_stats and series_regulars rows worked out one RSVP at a time."""
+    checked_in = {(a.user_id, a.date) for a in Attendance.query.filter_by(attended=True)}
+    days, attendance = {}, {}
+    for c in WorkoutClass.query.filter(WorkoutClass.date_time < datetime.combine(end, time())):
+        day = c.date_time.date()
+        booked = [r for r in c.rsvps if r.attending]
+        attended = [r for r in booked if (r.user_id, day) in checked_in]
+        days[c.id] = (c.trainer_id, c.series_id, day, c.max_capacity, len(booked), len(c.rsvps) - len(booked),
+                      len(attended))
+        for r in attended if c.series_id else ():
+            count, last = attendance.get((c.series_id, r.user_id), (0, date.min))
+            attendance[(c.series_id, r.user_id)] = (count + 1, max(last, day))
+    by_series = {}
+    for (series_id, user_id), (count, last) in attendance.items():
+        by_series.setdefault(series_id, []).append((-count, -last.toordinal(), user_id, count, last))
+    regulars = {}
+    for series_id, ranked in by_series.items():
+        for rank, (_, _, user_id, count, last) in enumerate(sorted(ranked)[:app.config['ANALYTICS_REGULARS']], 1):
+            regulars[(series_id, user_id)] = (rank, count, last)
+    return days, regulars
+
+
+def rollups():
+    days = {s.class_id: (s.trainer_id, s.series_id, s.day, s.capacity, s.booked, s.waitlisted, s.attended)
+            for s in ClassDayStat.query}
+    regulars = {(r.series_id, r.user_id): (r.rank, r.attended, r.last_attended) for r in SeriesRegular.query}
+    return days, regulars
+
+
+@pytest.fixture
+def history(database, monkeypatch):
+    # Small chunks, so a refresh spans several transactions
+    monkeypatch.setitem(app.config, 'ANALYTICS_REFRESH_CHUNK_DAYS', 7)
+    monkeypatch.setitem(app.config, 'ANALYTICS_REGULARS', 3)
+    return seed_history(random.Random(24))
+
+
+@pytest.mark.parametrize('window_functions', [True, False])
+def test_rollups_match_a_recount(history, monkeypatch, window_functions):
+    monkeypatch.setattr(analytics, 'supports_window_functions', lambda: window_functions)
+
+    refresh_rollups()
+
+    days, regulars = recount()
+    assert rollups() == (days, regulars)
+    assert days and regulars
+    assert analytics.refreshed_through() == TODAY - timedelta(days=1)
+
+
+def test_incremental_refresh_picks_up_late_check_ins_and_new_days(history):
+    refresh_rollups(end=TODAY - timedelta(days=5))
+    # Check-ins that arrive late for days already rolled up, inside the lookback
+    for c in WorkoutClass.query.filter(WorkoutClass.date_time >= datetime.combine(TODAY - timedelta(days=8), time()),
+                                       WorkoutClass.date_time < datetime.combine(TODAY, time())):
+        for r in c.rsvps:
+            check_in(r.user, c.date_time.date())
+    db.session.commit()
+
+    refresh_rollups()
+
+    assert rollups() == recount()
+
+
+def test_daily_refresh_reads_only_the_days_it_redoes(history):
+    refresh_rollups()
+    counted = rollups()
+    # Were a refresh to count the days before its lookback again, these would drop out
+    settled = TODAY - timedelta(days=app.config['ANALYTICS_LOOKBACK_DAYS'])
+    Attendance.query.filter(Attendance.date < settled).delete()
+    db.session.commit()
+
+    refresh_rollups()
+
+    assert rollups()[1] == counted[1]
+
+
+def test_rebuild_counts_the_settled_days_again(history):
+    refresh_rollups()
+    first = db.session.query(db.func.min(WorkoutClass.date_time)).scalar().date()
+    Attendance.query.filter(Attendance.date < first + timedelta(days=10)).delete()
+    db.session.commit()
+
+    refresh_rollups(start=first)
+
+    assert rollups() == recount()
+
+
+def test_trainer_analytics_totals_match_the_recount(history):
+    trainers, _, _ = history
+    refresh_rollups()
+    days, _ = recount()
+
+    report = trainer_analytics(db.session, trainers[0].id, weeks=52)
+
+    mine = [d for d in days.values() if d[0] == trainers[0].id]
+    assert report['totals']['classes'] == len(mine)
+    assert report['totals']['booked'] == sum(d[4] for d in mine)
+    assert report['totals']['attended'] == sum(d[6] for d in mine)
+    assert report['totals']['capacity'] == sum(d[3] for d in mine)
+    assert sum(s['classes'] for s in report['series']) == sum(1 for d in mine if d[1] is not None)
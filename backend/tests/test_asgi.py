@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import pytest
+from config import db
+from models import User, WorkoutClass, Attendance
+
+asgi = pytest.importorskip('asgi')
+
+# Differ per request whichever mode serves it
+VOLATILE = ('date', 'server-timing', 'x-request-id', 'content-length')
+
+
+def asgi_get(*requests):
+    """[(status, headers, body)] for (url, headers) pairs sent to the ASGI app in turn."""
+    async def run():
+        responses = []
+        for url, headers in requests:
+            parts = urlsplit(url)
+            scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': parts.path,
+                     'root_path': '', 'query_string': parts.query.encode(), 'server': ('localhost', 80),
+                     'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await asgi.app(scope, receive, send)
+            responses.append((messages[0]['status'],
+                              {name.decode(): value.decode() for name, value in messages[0]['headers']},
+                              messages[1]['body']))
+        # Pooled aiosqlite connections belong to this event loop
+        await asgi.engine.dispose()
+        return responses
+    return asyncio.run(run())
+
+
+def compared(status, headers, body):
+    return status, {name.lower(): value for name, value in headers.items() if name.lower() not in VOLATILE}, body
+
+
+@pytest.fixture
+def users(database):
+    member = User(username='member', email='member@example.com', password_hash='x', role='user')
+    trainer = User(username='trainer', email='trainer@example.com', password_hash='x', role='trainer')
+    db.session.add_all([member, trainer])
+    db.session.flush()
+    member.trainers.append(trainer)
+    start = datetime.utcnow().replace(microsecond=0)
+    db.session.add_all([WorkoutClass(name=f'Class {i}', trainer_id=trainer.id, date_time=start + timedelta(days=i),
+                                     max_capacity=10, current_capacity=0, description='x' * 200) for i in range(1, 20)])
+    db.session.add(Attendance(user_id=member.id, date=start.date(), attended=True))
+    db.session.commit()
+    return member, trainer
+
+
+def urls():
+    window = (f"from={(datetime.utcnow() + timedelta(hours=1)).replace(microsecond=0).isoformat()}"
+              f"&to={(datetime.utcnow() + timedelta(days=10)).replace(microsecond=0).isoformat()}")
+    return [('user', '/api/dashboard'), ('trainer', '/api/trainer-dashboard'), ('user', '/api/attendance'),
+            ('user', '/api/classes?limit=5'), ('user', '/api/classes/search?name=class'),
+            ('user', f'/api/timetable?{window}')]
+
+
+def test_every_async_route_answers_as_the_flask_route_does(client, auth_headers, users):
+    member, trainer = users
+    tokens = {'user': auth_headers(member), 'trainer': auth_headers(trainer)}
+    requests = [(url, {**tokens[role], 'Accept-Encoding': 'gzip', 'Origin': 'http://localhost:3000'})
+                for role, url in urls()]
+    assert {urlsplit(url).path for url, _ in requests} == set(asgi.ROUTES)
+
+    flask = [client.get(url, headers=headers) for url, headers in requests]
+    served = asgi_get(*requests)
+
+    for (url, _), expected, (status, headers, body) in zip(requests, flask, served):
+        assert status == 200, url
+        assert compared(status, headers, body) == compared(expected.status_code, expected.headers, expected.data), url
+        assert 'server-timing' in headers and 'x-request-id' in headers
+
+
+def test_async_routes_revalidate_with_the_flask_etags(client, auth_headers, users):
+    member, _ = users
+    headers = auth_headers(member)
+    etags = {url: client.get(url, headers=headers).headers['ETag'] for url in ('/api/dashboard', '/api/classes')}
+
+    served = asgi_get(*[(url, {**headers, 'If-None-Match': etag}) for url, etag in etags.items()])
+
+    assert [(status, body) for status, _, body in served] == [(304, b''), (304, b'')]
+    assert [headers['etag'] for _, headers, _ in served] == list(etags.values())
+
+
+def test_async_routes_reject_as_the_flask_routes_do(client, auth_headers, users):
+    member, trainer = users
+    requests = [('/api/dashboard', {}), ('/api/dashboard', auth_headers(trainer)),
+                ('/api/classes', {'Authorization': 'Bearer not-a-token'})]
+
+    flask = [client.get(url, headers=headers) for url, headers in requests]
+    served = asgi_get(*requests)
+
+    assert [(status, body) for status, _, body in served] == [(r.status_code, r.data) for r in flask]
+    assert [status for status, _, _ in served] == [401, 403, 422]
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from config import app, db
+from models import User, Attendance
+
+
+@pytest.fixture
+def users(database):
+    admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin')
+    members = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x', role='user')
+               for i in range(2)]
+    trainer = User(username='trainer', email='trainer@example.com', password_hash='x', role='trainer')
+    db.session.add_all([admin, trainer, *members])
+    db.session.commit()
+    return admin, members, trainer
+
+
+def post_batch(client, auth_headers, admin, events):
+    return client.post('/api/attendance/batch', json={'events': events}, headers=auth_headers(admin))
+
+
+def stamp(days_ago=0):
+    return (datetime.utcnow() - timedelta(days=days_ago)).isoformat() + 'Z'
+
+
+def test_replayed_batch_creates_nothing_new(client, auth_headers, users):
+    admin, members, _ = users
+    events = [{'user_id': member.id, 'timestamp': stamp(days)} for member in members for days in (0, 1)]
+
+    first = post_batch(client, auth_headers, admin, events).get_json()
+    replay = post_batch(client, auth_headers, admin, events).get_json()
+
+    assert first['summary'] == {'created': 4, 'duplicate': 0, 'invalid': 0}
+    assert replay['summary'] == {'created': 0, 'duplicate': 4, 'invalid': 0}
+    assert Attendance.query.count() == 4
+
+
+def test_repeat_within_a_batch_counts_once(client, auth_headers, users):
+    admin, members, _ = users
+    events = [{'user_id': members[0].id, 'timestamp': stamp()}, {'user_id': members[0].id, 'timestamp': stamp()}]
+
+    results = post_batch(client, auth_headers, admin, events).get_json()['results']
+
+    assert [r['status'] for r in results] == ['created', 'duplicate']
+    assert Attendance.query.count() == 1
+
+
+def test_invalid_events_do_not_fail_the_batch(client, auth_headers, users):
+    admin, members, trainer = users
+    events = [
+        {'user_id': members[0].id, 'timestamp': stamp()},
+        {'user_id': members[1].id},
+        {'user_id': members[1].id, 'timestamp': (datetime.utcnow() + timedelta(hours=1)).isoformat()},
+        {'user_id': trainer.id, 'timestamp': stamp()},
+        {'user_id': 999, 'timestamp': stamp()},
+        {'user_id': 'x', 'timestamp': stamp()},
+    ]
+
+    results = post_batch(client, auth_headers, admin, events).get_json()['results']
+
+    assert [r['status'] for r in results] == ['created'] + ['invalid'] * 5
+    assert [(a.user_id, a.attended) for a in Attendance.query] == [(members[0].id, True)]
+
+
+def test_batch_limit(client, auth_headers, users, monkeypatch):
+    admin, members, _ = users
+    monkeypatch.setitem(app.config, 'CHECKIN_BATCH_LIMIT', 1)
+    events = [{'user_id': member.id, 'timestamp': stamp()} for member in members]
+
+    assert post_batch(client, auth_headers, admin, events).status_code == 413
+    assert Attendance.query.count() == 0
+
+
+def test_member_check_in_is_idempotent(client, auth_headers, users):
+    _, members, _ = users
+    headers = auth_headers(members[0])
+
+    assert client.post('/api/attendance', headers=headers).get_json() == {'message': 'Attendance marked'}
+    assert client.post('/api/attendance', headers=headers).get_json() == {'message': 'Attendance already marked'}
+    assert Attendance.query.count() == 1
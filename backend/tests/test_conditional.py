@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+from config import app, db
+from conditional import version_counter, CLASSES
+from models import User, SubscriptionPlan, WorkoutClass, StatCounter
+
+from tests.test_query_budget import statements
+
+
+@pytest.fixture
+def users(database):
+    admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin')
+    trainer = User(username='trainer', email='trainer@example.com', password_hash='x', role='trainer')
+    members = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x', role='user')
+               for i in range(2)]
+    db.session.add_all([admin, trainer, *members])
+    members[0].trainers.append(trainer)
+    db.session.commit()
+    return admin, trainer, members
+
+
+def revalidate(client, headers, etag):
+    response = client.get('/api/dashboard', headers={**headers, 'If-None-Match': etag})
+    return response.status_code, statements(response)
+
+
+def test_another_members_check_in_keeps_the_dashboard_current(client, auth_headers, users):
+    _, _, (member, other) = users
+    headers = auth_headers(member)
+    etag = client.get('/api/dashboard', headers=headers).headers['ETag']
+
+    assert client.post('/api/attendance', headers=auth_headers(other)).status_code == 200
+
+    assert revalidate(client, headers, etag) == (304, 1)
+
+
+def test_own_check_in_changes_the_dashboard(client, auth_headers, users):
+    _, _, (member, _) = users
+    headers = auth_headers(member)
+    etag = client.get('/api/dashboard', headers=headers).headers['ETag']
+
+    client.post('/api/attendance', headers=headers)
+
+    response = client.get('/api/dashboard', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['attendance']) == 1
+
+
+def test_trainer_edit_changes_their_trainees_dashboards(client, auth_headers, users):
+    admin, trainer, (member, other) = users
+    member_headers, other_headers = auth_headers(member), auth_headers(other)
+    member_etag = client.get('/api/dashboard', headers=member_headers).headers['ETag']
+    other_etag = client.get('/api/dashboard', headers=other_headers).headers['ETag']
+
+    client.put('/api/trainers', json={'id': trainer.id, 'username': 'coach'}, headers=auth_headers(admin))
+
+    response = client.get('/api/dashboard', headers={**member_headers, 'If-None-Match': member_etag})
+    assert response.get_json()['trainer_details']['username'] == 'coach'
+    assert revalidate(client, other_headers, other_etag)[0] == 304
+
+
+def test_shared_changes_reach_every_member(client, auth_headers, users):
+    _, _, members = users
+    etags = {m.id: client.get('/api/dashboard', headers=auth_headers(m)).headers['ETag'] for m in members}
+
+    db.session.add(SubscriptionPlan(name='Monthly', duration_days=30, price=30.0))
+    db.session.commit()
+
+    for m in members:
+        response = client.get('/api/dashboard', headers={**auth_headers(m), 'If-None-Match': etags[m.id]})
+        assert [plan['name'] for plan in response.get_json()['subscriptions']] == ['Monthly']
+
+
+@pytest.fixture
+def classes(users):
+    _, trainer, _ = users
+    classes = [WorkoutClass(name=f'Class {i}', trainer_id=trainer.id, max_capacity=1, current_capacity=0,
+                            date_time=datetime.utcnow() + timedelta(days=1, hours=i)) for i in range(2)]
+    db.session.add_all(classes)
+    db.session.commit()
+    return classes
+
+
+def class_list_tag(client, headers, etag=None):
+    response = client.get('/api/classes', headers={**headers, **({'If-None-Match': etag} if etag else {})})
+    return response.status_code, response.headers['ETag']
+
+
+def test_rsvps_move_the_class_list_without_a_shared_counter(client, auth_headers, users, classes):
+    _, _, (member, other) = users
+    headers = auth_headers(member)
+    _, etag = class_list_tag(client, headers)
+
+    client.post('/api/rsvp', json={'class_id': classes[0].id}, headers=headers)
+    status, etag = class_list_tag(client, headers, etag)
+    assert status == 200
+    # The class is full now: joining its waitlist changes nothing the list shows
+    client.post('/api/rsvp', json={'class_id': classes[0].id}, headers=auth_headers(other))
+    assert class_list_tag(client, headers, etag)[0] == 304
+    assert db.session.get(StatCounter, version_counter(CLASSES)) is None
+
+
+def test_deleting_a_class_moves_the_class_list(client, auth_headers, users, classes):
+    admin, _, _ = users
+    headers = auth_headers(admin)
+    _, etag = class_list_tag(client, headers)
+
+    db.session.delete(classes[1])
+    db.session.commit()
+
+    assert class_list_tag(client, headers, etag)[0] == 200
+
+
+def test_class_list_tags_settle_before_they_are_reused(client, auth_headers, users, classes, monkeypatch):
+    monkeypatch.setitem(app.config, 'ETAG_SETTLE_SECONDS', 60)
+    headers = auth_headers(users[0])
+    _, etag = class_list_tag(client, headers)
+
+    # A write committing now with an earlier stamp would leave the latest stamp as it is
+    assert class_list_tag(client, headers, etag)[0] == 200
+
+
+def test_rehash_at_login_keeps_the_user_lists(client, auth_headers, users):
+    admin, _, (member, _) = users
+    member.password_hash = generate_password_hash('secret', 'pbkdf2:sha256:1000')
+    db.session.commit()
+    headers = auth_headers(admin)
+    etag = client.get('/api/admin-dashboard', headers=headers).headers['ETag']
+
+    assert client.post('/api/login', json={'username': member.username, 'password': 'secret'}).status_code == 200
+
+    assert member.password_hash.startswith('scrypt')
+    response = client.get('/api/admin-dashboard', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
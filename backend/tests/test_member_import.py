@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+import pytest
+from config import app, db
+from models import User, StatCounter
+from hashing import hash_passwords
+from stats import count_rows, get_counters, recount, role_counter, USERS
+
+
+@pytest.fixture
+def admin(database):
+    admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin')
+    db.session.add(admin)
+    db.session.commit()
+    recount()
+    return admin
+
+
+def run_import(client, auth_headers, admin, rows, fmt='ndjson'):
+    if fmt == 'ndjson':
+        body = ''.join(json.dumps(row) + '\n' for row in rows)
+    else:
+        body = 'username,email,password,role\n' + ''.join(','.join(row) + '\n' for row in rows)
+    response = client.post(f'/api/users/import?format={fmt}', data=body, headers=auth_headers(admin))
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return lines[:-1], lines[-1]['summary']
+
+
+def member(i, **fields):
+    return {'username': f'member{i}', 'email': f'member{i}@example.com', 'password': 'secret', **fields}
+
+
+def test_reimporting_a_file_creates_nothing_new(client, auth_headers, admin, monkeypatch):
+    # Several batches, so later ones see the rows the earlier ones inserted
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 2)
+    # Counters seeded before there were any trainers
+    StatCounter.query.filter_by(name=role_counter('trainer')).delete()
+    db.session.commit()
+    rows = [member(i) for i in range(3)] + [member(3, role='trainer')]
+
+    errors, summary = run_import(client, auth_headers, admin, rows)
+    assert (errors, summary) == ([], {'rows': 4, 'created': 4, 'failed': 0})
+
+    errors, summary = run_import(client, auth_headers, admin, rows)
+    assert summary == {'rows': 4, 'created': 0, 'failed': 4}
+    assert {e['error'] for e in errors} == {'Username or email already exists'}
+    assert User.query.count() == 5
+    # The bulk insert keeps the dashboard counters, including a role first seen in the import
+    counters = get_counters()
+    assert {name: counters[name] for name in count_rows()} == count_rows()
+    assert counters[USERS] == 5
+
+
+def test_existing_emails_match_case_insensitively(client, auth_headers, admin):
+    db.session.add(User(username='alice', email='Alice@Example.com', password_hash='x', role='user'))
+    db.session.commit()
+
+    errors, summary = run_import(client, auth_headers, admin, [
+        {'username': 'alice2', 'email': 'ALICE@example.com', 'password': 'secret'}, member(1)
+    ])
+
+    assert errors == [{'row': 1, 'error': 'Username or email already exists'}]
+    assert summary['created'] == 1
+
+
+def test_bad_rows_are_reported_without_failing_the_batch(client, auth_headers, admin):
+    errors, summary = run_import(client, auth_headers, admin, [
+        member(1),
+        member(2, email=42),
+        member(3, role='admin'),
+        member(1),
+        member(4, password=None),
+    ])
+
+    assert errors == [
+        {'row': 2, 'error': 'email must be a string'},
+        {'row': 3, 'error': 'role must be one of user, trainer'},
+        {'row': 4, 'error': 'Duplicate username or email earlier in the file'},
+        {'row': 5, 'error': 'password is required'},
+    ]
+    assert summary == {'rows': 5, 'created': 1, 'failed': 4}
+
+
+def test_csv_import(client, auth_headers, admin):
+    errors, summary = run_import(client, auth_headers, admin, [
+        ('carol', 'Carol@Example.com', 'secret', 'trainer'),
+        ('dave', 'not-an-email', 'secret', 'user'),
+    ], fmt='csv')
+
+    assert errors == [{'row': 2, 'error': 'a valid email is required (max 120 characters)'}]
+    assert summary['created'] == 1
+    carol = User.query.filter_by(username='carol').one()
+    assert (carol.email, carol.role) == ('carol@example.com', 'trainer')
+
+
+def test_login_succeeds_while_an_import_batch_is_hashing(client, admin, monkeypatch):
+    member = User(username='member', email='member@example.com', role='user')
+    member.set_password('secret')
+    db.session.add(member)
+    db.session.commit()
+    # Far less than the batch takes to hash, far more than one hash
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_TIMEOUT', 1.0)
+    hashes = []
+    batch = threading.Thread(target=lambda: hashes.extend(hash_passwords([f'secret{i}' for i in range(30)])))
+    batch.start()
+    time.sleep(0.3)
+
+    response = client.post('/api/login', json={'username': 'member', 'password': 'secret'})
+    batch.join()
+
+    assert response.status_code == 200
+    assert len(hashes) == 30
@@ -0,0 +1,181 @@
+"""Every endpoint issues a fixed number of SQL statements whatever the data size.
+
+Seeds the test database at each scale (rows per member: subscriptions,
+check-ins, RSVPs, assigned trainers, trainees per trainer), calls each
+endpoint through the Flask test client and reads the statement count from its
+Server-Timing header. Fails when a count grows with the data (an N+1 load) or
+exceeds its budget.
+"""
+import math
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+from config import app, db
+from models import (User, SubscriptionPlan, UserSubscription, Attendance, WorkoutClass, ClassRSVP, HealthProfile,
+                    ClassSeries, ClassSeriesException, trainer_trainee)
+from auth import denylist
+from cache import dashboard_cache
+from stats import recount
+from analytics import refresh_rollups
+from revenue import backfill
+
+SCALES = (1, 10, 100)
+ADMIN, MEMBER, TRAINER, NEW_TRAINER = 1, 2, 3, 4
+REVALIDATE_BUDGET = 1
+FIRST_EXTRA = 10
+
+# (name, role, method, path, json body, statement budget). The member dashboard
+# is checked with a cold cache; role_required's denylist refresh is excluded by
+# loading it up front. Every response with an ETag is also revalidated, which
+# must answer 304 from the version counters alone.
+ENDPOINTS = [
+    ('dashboard', 'user', 'GET', '/api/dashboard', None, 8),
+    ('trainer-dashboard', 'trainer', 'GET', '/api/trainer-dashboard', None, 4),
+    ('trainer-analytics', 'trainer', 'GET', '/api/trainer-analytics', None, 5),
+    ('admin-dashboard', 'admin', 'GET', '/api/admin-dashboard', None, 6),
+    # From mid-month, so the opening balances read month and day rollups
+    ('revenue', 'admin', 'GET', f'/api/admin/revenue?interval=day&from={date.today() - timedelta(days=45):%Y-%m-15}', None, 6),
+    ('revenue-monthly', 'admin', 'GET', '/api/admin/revenue', None, 5),
+    ('users', 'admin', 'GET', '/api/users', None, 1),
+    ('trainers', 'admin', 'GET', '/api/trainers', None, 1),
+    ('classes', 'user', 'GET', '/api/classes', None, 2),
+    ('classes-search', 'user', 'GET', '/api/classes/search?has_spots=true&name=class', None, 1),
+    ('plans', 'user', 'GET', '/api/subscriptions', None, 2),
+    ('class-series', 'user', 'GET', '/api/class-series', None, 1),
+    ('timetable', 'user', 'GET', '/api/timetable', None, 3),
+    ('attendance', 'user', 'GET', '/api/attendance', None, 1),
+    ('attendance-calendar', 'user', 'GET', '/api/attendance/calendar', None, 2),
+    ('health-profile', 'user', 'GET', '/api/health-profile', None, 1),
+    ('assign-trainer', 'admin', 'POST', '/api/assign-trainer', {'user_id': MEMBER, 'trainer_id': NEW_TRAINER}, 8),
+    ('user-subscriptions', 'user', 'POST', '/api/user-subscriptions', {'plan_id': 1}, 13),
+]
+BUDGETS = {name: budget for name, _, _, _, _, budget in ENDPOINTS}
+
+
+def seed(scale):
+    now = datetime.utcnow()
+    extra = list(range(FIRST_EXTRA, FIRST_EXTRA + scale))
+    db.session.execute(insert(User), [
+        {'id': ADMIN, 'username': 'admin', 'email': 'admin@example.com', 'password_hash': 'x', 'role': 'admin'},
+        {'id': MEMBER, 'username': 'member', 'email': 'member@example.com', 'password_hash': 'x', 'role': 'user'},
+        {'id': TRAINER, 'username': 'trainer', 'email': 'trainer@example.com', 'password_hash': 'x', 'role': 'trainer'},
+        {'id': NEW_TRAINER, 'username': 'new-trainer', 'email': 'new-trainer@example.com', 'password_hash': 'x', 'role': 'trainer'},
+    ] + [
+        # Half of them trainers assigned to the member, half members trained by TRAINER
+        {'id': i, 'username': f'extra{i}', 'email': f'extra{i}@example.com', 'password_hash': 'x',
+         'role': 'trainer' if i % 2 else 'user'}
+        for i in extra
+    ])
+    db.session.execute(insert(trainer_trainee), [
+        {'trainer_id': i, 'trainee_id': MEMBER} if i % 2 else {'trainer_id': TRAINER, 'trainee_id': i}
+        for i in extra
+    ])
+    # Plan 1 is left for the subscription request; the member's other plans have all expired
+    db.session.execute(insert(SubscriptionPlan), [
+        {'id': i, 'name': f'Plan {i}', 'duration_days': 30, 'price': 10.0} for i in range(1, scale + 2)
+    ])
+    db.session.execute(insert(UserSubscription), [
+        {'user_id': MEMBER, 'plan_id': i, 'start_date': now - timedelta(days=60 + i), 'end_date': now - timedelta(days=30 + i)}
+        for i in range(2, scale + 2)
+    ])
+    db.session.execute(insert(WorkoutClass), [
+        {'id': i, 'name': f'Class {i}', 'date_time': now + timedelta(hours=i), 'trainer_id': TRAINER,
+         'max_capacity': 20, 'current_capacity': 1}
+        for i in range(1, scale + 1)
+    ])
+    db.session.execute(insert(ClassRSVP), [
+        {'user_id': MEMBER, 'class_id': i, 'attending': True} for i in range(1, scale + 1)
+    ])
+    db.session.execute(insert(ClassSeries), [
+        {'id': i, 'name': f'Series {i}', 'trainer_id': TRAINER, 'max_capacity': 20, 'weekdays': 'MO,WE,FR',
+         'start_time': (now + timedelta(hours=i)).time(), 'interval_weeks': 1, 'starts_on': date.today()}
+        for i in range(1, scale + 1)
+    ])
+    db.session.execute(insert(ClassSeriesException), [
+        {'series_id': i, 'date': date.today() + timedelta(days=i % 7)} for i in range(1, scale + 1)
+    ])
+    # One past class per series, each attended, for the analytics rollups
+    past = range(scale + 1, 2 * scale + 1)
+    db.session.execute(insert(WorkoutClass), [
+        {'id': i, 'name': f'Class {i}', 'date_time': now - timedelta(days=i - scale), 'trainer_id': TRAINER,
+         'max_capacity': 20, 'current_capacity': 1, 'series_id': i - scale}
+        for i in past
+    ])
+    db.session.execute(insert(ClassRSVP), [{'user_id': MEMBER, 'class_id': i, 'attending': True} for i in past])
+    db.session.execute(insert(Attendance), [
+        {'user_id': MEMBER, 'date': date.today() - timedelta(days=d), 'attended': True} for d in range(scale + 1)
+    ])
+    db.session.execute(insert(HealthProfile), [{'user_id': MEMBER, 'weight_kg': 70.0, 'height_cm': 175.0, 'bmi': 22.9}])
+    db.session.commit()
+    recount()
+    refresh_rollups()
+    backfill()
+
+
+def tokens():
+    users = {'admin': ADMIN, 'user': MEMBER, 'trainer': TRAINER}
+    return {role: create_access_token(identity=user_id, additional_claims={'role': role, 'username': role, 'ver': 0})
+            for role, user_id in users.items()}
+
+
+def statement_counts(scale):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(scale)
+        access = tokens()
+        denylist.refresh()
+    dashboard_cache.clear()
+    client = app.test_client()
+    counts = {}
+    refresh_interval, denylist.refresh_interval = denylist.refresh_interval, math.inf
+    try:
+        for name, role, method, path, body, _ in ENDPOINTS:
+            response = client.open(path, method=method, json=body, headers={'Authorization': f'Bearer {access[role]}'})
+            assert response.status_code < 400, f'{name} returned {response.status_code}: {response.get_data(as_text=True)}'
+            counts[name] = statements(response)
+            if method == 'GET' and 'ETag' in response.headers:
+                response = client.get(path, headers={'Authorization': f'Bearer {access[role]}',
+                                                     'If-None-Match': response.headers['ETag']})
+                assert response.status_code == 304, f'{name} revalidation returned {response.status_code}'
+                counts[f'{name} (304)'] = statements(response)
+    finally:
+        denylist.refresh_interval = refresh_interval
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    return counts
+
+
+def statements(response):
+    # db;dur=0.4;desc="3 queries", app;dur=1.2
+    timing = response.headers['Server-Timing']
+    return int(timing.split('desc="', 1)[1].split(' ', 1)[0])
+
+
+@pytest.fixture(scope='module')
+def counts():
+    """{scale: {endpoint: statements}}, with revalidations as '<endpoint> (304)'."""
+    return {scale: statement_counts(scale) for scale in SCALES}
+
+
+def checked(counts, name):
+    # The request itself, and its revalidation when it returned an ETag
+    return [(key, budget) for key, budget in ((name, BUDGETS[name]), (f'{name} (304)', REVALIDATE_BUDGET))
+            if key in counts[SCALES[0]]]
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('name', list(BUDGETS))
+def test_within_budget(counts, name, scale):
+    for key, budget in checked(counts, name):
+        assert counts[scale][key] <= budget, f'{key} issued {counts[scale][key]} statements, budget {budget}'
+
+
+@pytest.mark.parametrize('name', list(BUDGETS))
+def test_constant_across_scales(counts, name):
+    for key, _ in checked(counts, name):
+        by_scale = {scale: counts[scale][key] for scale in SCALES}
+        assert len(set(by_scale.values())) == 1, f'{key} grows with the data: {by_scale}'
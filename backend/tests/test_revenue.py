@@ -0,0 +1,130 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+import revenue
+from config import db
+from models import User, SubscriptionPlan, UserSubscription, RevenueDay, RevenueMonth
+from revenue import backfill, monthly_value, revenue_report
+
+START, END = date(2025, 1, 1), date(2026, 6, 30)
+# After every subscription ends, so the backfill covers them all
+NOW = datetime(2030, 1, 1)
+
+
+@pytest.fixture
+def subscriptions(database):
+    """Subscription histories with back-to-back, early and lapsed renewals,
+    written in start order through the ORM as purchases are."""
+    rng = random.Random(25)
+    plans = [SubscriptionPlan(name=f'{days} days', duration_days=days, price=price)
+             for days, price in ((30, 29.99), (90, 79.5), (365, 299.0))]
+    members = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x', role='user')
+               for i in range(40)]
+    db.session.add_all(plans + members)
+    db.session.commit()
+    purchases = []
+    for member in members:
+        at = datetime.combine(START, datetime.min.time()) + timedelta(days=rng.randint(0, 200), hours=rng.randint(6, 20))
+        for _ in range(rng.randint(1, 4)):
+            plan = rng.choice(plans)
+            purchases.append((at, member.id, plan))
+            ends = at + timedelta(days=plan.duration_days)
+            renewal = rng.random()
+            if renewal < 0.3:
+                at = ends
+            elif renewal < 0.5:
+                at = ends - timedelta(days=rng.randint(1, 20))
+            else:
+                at = ends + timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 5))
+    for at, user_id, plan in sorted(purchases, key=lambda purchase: purchase[0]):
+        db.session.add(UserSubscription(user_id=user_id, plan_id=plan.id, start_date=at,
+                                        end_date=at + timedelta(days=plan.duration_days)))
+        db.session.commit()
+    return UserSubscription.query.all()
+
+
+def rollup_rows():
+    return {model.__tablename__: sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                                        for row in db.session.execute(db.select(*model.__table__.c)))
+            for model in (RevenueDay, RevenueMonth)}
+
+
+def without_backfill_time(report):
+    return {key: value for key, value in report.items() if key != 'backfilled_at'}
+
+
+def test_backfill_rebuilds_the_live_rollups(subscriptions):
+    live = rollup_rows()
+    day_report = revenue_report(db.session, START, END, 'day')
+
+    backfill(chunk=7, now=NOW)
+
+    assert rollup_rows() == live
+    assert without_backfill_time(revenue_report(db.session, START, END, 'day')) == without_backfill_time(day_report)
+
+
+def test_purchases_during_a_backfill_are_counted_once(subscriptions, monkeypatch):
+    plan = SubscriptionPlan.query.first()
+    newcomer = User(username='newcomer', email='newcomer@example.com', password_hash='x', role='user')
+    db.session.add(newcomer)
+    db.session.commit()
+    members = sorted({s.user_id for s in subscriptions})
+    # Before each chunk of the replay, a member it has rebuilt, one it has not reached, and a first purchase
+    buyers = iter([members[0], members[-1], newcomer.id, members[1], members[-2]])
+    lock = revenue._lock_replaying
+
+    def purchase_then_lock(session):
+        user_id = next(buyers, None)
+        if user_id is not None:
+            # After everything on record, and before the backfill's cutoff
+            start = datetime(2027, 1, 1) + timedelta(days=user_id)
+            with Session(db.engine) as other:
+                other.add(UserSubscription(user_id=user_id, plan_id=plan.id, start_date=start,
+                                           end_date=start + timedelta(days=plan.duration_days)))
+                other.commit()
+        lock(session)
+
+    monkeypatch.setattr(revenue, '_lock_replaying', purchase_then_lock)
+    backfill(chunk=7, now=NOW)
+    during = rollup_rows()
+    monkeypatch.undo()
+
+    backfill(chunk=7, now=NOW)
+
+    assert during == rollup_rows()
+
+
+def test_daily_report_matches_a_recount(subscriptions):
+    report = revenue_report(db.session, START, END, 'day')
+
+    for point in report['series']:
+        day = date.fromisoformat(point['period'])
+        active = [s for s in subscriptions if s.start_date.date() <= day < s.end_date.date()]
+        assert (point['active_subscriptions'], point['active_members'], point['mrr'], point['revenue']) == (
+            len(active),
+            len({s.user_id for s in active}),
+            round(sum(monthly_value(s.plan.price, s.plan.duration_days) for s in active), 2),
+            round(sum(s.plan.price for s in subscriptions if s.start_date.date() == day), 2),
+        ), day
+
+
+def test_monthly_report_agrees_with_the_days(subscriptions):
+    days = revenue_report(db.session, START, END, 'day')['series']
+    months = revenue_report(db.session, START, END, 'month')['series']
+
+    for month in months:
+        in_month = [d for d in days if d['period'][:7] == month['period'][:7]]
+        assert month['revenue'] == round(sum(d['revenue'] for d in in_month), 2)
+        assert month['churned'] == sum(d['churned'] for d in in_month)
+        # Levels are as of the period's last day
+        assert (month['mrr'], month['active_members']) == (in_month[-1]['mrr'], in_month[-1]['active_members'])
+
+
+def test_report_from_mid_month_opens_with_the_running_levels(subscriptions):
+    full = {point['period']: point for point in revenue_report(db.session, START, END, 'day')['series']}
+
+    partial = revenue_report(db.session, date(2025, 6, 17), date(2025, 7, 3), 'day')['series']
+
+    assert partial and all(point == full[point['period']] for point in partial)
@@ -0,0 +1,132 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import event
+from config import db
+from models import User, WorkoutClass, ClassRSVP, ClassSeries, OutboxMessage
+
+
+@pytest.fixture
+def members(database):
+    users = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x', role='user')
+             for i in range(5)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+@pytest.fixture
+def workout_class(database):
+    workout_class = WorkoutClass(name='Spin', date_time=datetime.utcnow() + timedelta(days=1), max_capacity=2,
+                                 current_capacity=0)
+    db.session.add(workout_class)
+    db.session.commit()
+    return workout_class
+
+
+def rsvp(client, auth_headers, user, class_id, method='POST'):
+    return client.open('/api/rsvp', method=method, json={'class_id': class_id}, headers=auth_headers(user))
+
+
+def attending(class_id):
+    return {r.user_id: r.attending for r in ClassRSVP.query.filter_by(class_id=class_id)}
+
+
+def test_fills_to_capacity_then_waitlists_in_order(client, auth_headers, members, workout_class):
+    statuses = [rsvp(client, auth_headers, member, workout_class.id).get_json() for member in members[:4]]
+
+    assert [s['status'] for s in statuses] == ['confirmed', 'confirmed', 'waitlisted', 'waitlisted']
+    assert [s.get('position') for s in statuses[2:]] == [1, 2]
+    assert db.session.get(WorkoutClass, workout_class.id).current_capacity == 2
+
+
+def test_duplicate_rsvp_is_rejected_without_taking_a_spot(client, auth_headers, members, workout_class):
+    assert rsvp(client, auth_headers, members[0], workout_class.id).status_code == 200
+    assert rsvp(client, auth_headers, members[0], workout_class.id).status_code == 400
+
+    assert db.session.get(WorkoutClass, workout_class.id).current_capacity == 1
+    assert ClassRSVP.query.count() == 1
+
+
+def test_unknown_class_is_404(client, auth_headers, members):
+    assert rsvp(client, auth_headers, members[0], 999).status_code == 404
+
+
+def test_cancel_promotes_the_head_of_the_waitlist(client, auth_headers, members, workout_class):
+    for member in members[:4]:
+        rsvp(client, auth_headers, member, workout_class.id)
+
+    assert rsvp(client, auth_headers, members[0], workout_class.id, 'DELETE').status_code == 200
+
+    db.session.expire_all()
+    assert attending(workout_class.id) == {members[1].id: True, members[2].id: True, members[3].id: False}
+    assert db.session.get(WorkoutClass, workout_class.id).current_capacity == 2
+    promotion = OutboxMessage.query.filter_by(kind='waitlist_promotion').one()
+    assert promotion.user_id == members[2].id
+    # The member behind moves up
+    response = rsvp(client, auth_headers, members[4], workout_class.id).get_json()
+    assert response['position'] == 2
+
+
+def test_cancel_without_a_waitlist_frees_the_spot(client, auth_headers, members, workout_class):
+    rsvp(client, auth_headers, members[0], workout_class.id)
+    rsvp(client, auth_headers, members[0], workout_class.id, 'DELETE')
+
+    db.session.expire_all()
+    assert db.session.get(WorkoutClass, workout_class.id).current_capacity == 0
+    assert rsvp(client, auth_headers, members[1], workout_class.id).get_json()['status'] == 'confirmed'
+
+
+def test_cancelling_a_waitlisted_rsvp_keeps_the_class_full(client, auth_headers, members, workout_class):
+    for member in members[:3]:
+        rsvp(client, auth_headers, member, workout_class.id)
+
+    rsvp(client, auth_headers, members[2], workout_class.id, 'DELETE')
+
+    db.session.expire_all()
+    assert attending(workout_class.id) == {members[0].id: True, members[1].id: True}
+    assert db.session.get(WorkoutClass, workout_class.id).current_capacity == 2
+    assert OutboxMessage.query.filter_by(kind='waitlist_promotion').count() == 0
+
+
+def test_confirmation_is_written_without_reading_under_the_class_lock(client, auth_headers, members, workout_class):
+    body, headers = {'class_id': workout_class.id}, auth_headers(members[0])
+    # As in a request of its own: nothing already loaded
+    db.session.expunge_all()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    def commit(conn):
+        statements.append('COMMIT')
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    event.listen(db.engine, 'commit', commit)
+    try:
+        assert client.post('/api/rsvp', json=body, headers=headers).status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+        event.remove(db.engine, 'commit', commit)
+
+    locked = statements.index('UPDATE')
+    assert 'SELECT' not in statements[locked:statements.index('COMMIT', locked)]
+    message = OutboxMessage.query.filter_by(kind='rsvp').one()
+    assert (message.recipient, message.subject) == ('member0@example.com', 'You are booked into Spin')
+
+
+def test_series_rsvp_accepts_an_offset(client, auth_headers, members):
+    trainer = User(username='trainer', email='trainer@example.com', password_hash='x', role='trainer')
+    db.session.add(trainer)
+    db.session.flush()
+    series = ClassSeries(name='Yoga', trainer_id=trainer.id, max_capacity=5, weekdays='MO,TU,WE,TH,FR,SA,SU', start_time=time(9),
+                         interval_weeks=1, starts_on=date.today())
+    db.session.add(series)
+    db.session.commit()
+    tomorrow = date.today() + timedelta(days=1)
+
+    response = client.post('/api/rsvp', json={'series_id': series.id, 'date_time': f'{tomorrow}T11:00:00+02:00'},
+                           headers=auth_headers(members[0]))
+
+    assert response.get_json()['status'] == 'confirmed'
+    assert db.session.get(WorkoutClass, response.get_json()['class_id']).date_time == datetime.combine(tomorrow, time(9))
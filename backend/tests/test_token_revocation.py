@@ -0,0 +1,59 @@
+import pytest
+from config import db
+from models import User
+from auth import Denylist
+
+
+@pytest.fixture
+def users(database):
+    admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin')
+    member = User(username='member', email='member@example.com', password_hash='x', role='user')
+    db.session.add_all([admin, member])
+    db.session.commit()
+    return admin, member
+
+
+def update_user(client, auth_headers, admin, **changes):
+    return client.put('/api/users', json=changes, headers=auth_headers(admin))
+
+
+def test_role_change_revokes_tokens_issued_before_it(client, auth_headers, users):
+    admin, member = users
+    old_headers = auth_headers(member)
+    assert client.get('/api/dashboard', headers=old_headers).status_code == 200
+
+    assert update_user(client, auth_headers, admin, id=member.id, role='trainer').status_code == 200
+
+    assert client.get('/api/dashboard', headers=old_headers).status_code == 401
+    member = db.session.get(User, member.id)
+    assert member.token_version == 1
+    assert client.get('/api/trainer-dashboard', headers=auth_headers(member)).status_code == 200
+
+
+def test_other_workers_load_the_revocation(client, auth_headers, users):
+    admin, member = users
+    update_user(client, auth_headers, admin, id=member.id, role='trainer')
+
+    # A worker that did not make the change learns it from token_revocations
+    other_worker = Denylist(refresh_interval=0)
+    assert other_worker.min_version(member.id) == 1
+    assert other_worker.min_version(admin.id) == 0
+
+
+def test_profile_edit_keeps_tokens_valid(client, auth_headers, users):
+    admin, member = users
+    headers = auth_headers(member)
+
+    assert update_user(client, auth_headers, admin, id=member.id, username='renamed').status_code == 200
+
+    assert client.get('/api/dashboard', headers=headers).status_code == 200
+    assert db.session.get(User, member.id).token_version in (None, 0)
+
+
+def test_deleting_a_user_revokes_their_tokens(client, auth_headers, users):
+    admin, member = users
+    headers = auth_headers(member)
+
+    assert client.delete('/api/users', json={'id': member.id}, headers=auth_headers(admin)).status_code == 200
+
+    assert client.get('/api/dashboard', headers=headers).status_code == 401
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# Per-worker statistics shared across the gunicorn/uvicorn workers of one
+# instance. Each worker writes a JSON snapshot to WORKER_STATS_DIR at most
+# once a PUBLISH_INTERVAL; whichever worker serves a diagnostics request
+# reads its siblings' files and drops those left by workers that have exited.
+
+STATS_DIR = os.getenv('WORKER_STATS_DIR', os.path.join(tempfile.gettempdir(), 'gym-worker-stats'))
+PUBLISH_INTERVAL = 1.0
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Publisher:
+    def __init__(self, name, snapshot, interval=PUBLISH_INTERVAL):
+        self.name = name
+        self.snapshot = snapshot
+        self.interval = interval
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, pid):
+        return os.path.join(STATS_DIR, f'{self.name}-{pid}.json')
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._published_at < self.interval:
+                return
+            self._published_at = now
+        try:
+            os.makedirs(STATS_DIR, exist_ok=True)
+            path = self._path(os.getpid())
+            with open(f'{path}.tmp', 'w') as handle:
+                json.dump(self.snapshot(), handle)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logging.warning(f"Could not publish {self.name} stats: {str(e)}")
+
+    def collect(self):
+        """Snapshots of every live worker on this host, this one first and current."""
+        self.publish(force=True)
+        snapshots = [self.snapshot()]
+        prefix = f'{self.name}-'
+        try:
+            names = os.listdir(STATS_DIR)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.startswith(prefix) or not name.endswith('.json') or name == f'{prefix}{os.getpid()}.json':
+                continue
+            path = os.path.join(STATS_DIR, name)
+            try:
+                if not _alive(int(name[len(prefix):-5])):
+                    os.remove(path)
+                    continue
+                with open(path) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+        return snapshots
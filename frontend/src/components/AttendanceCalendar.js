@@ -1,11 +1,25 @@
 import { useState, useEffect } from 'react';
 import { Toaster, toast } from 'react-hot-toast';
 
+const pad = (n) => String(n).padStart(2, '0');
+
+// Bit i of the base64 bitmap is set when the member attended on start + i days
+function decodeBitmap(bitmap) {
+  const bytes = atob(bitmap);
+  return (offset) => (bytes.charCodeAt(offset >> 3) >> (offset & 7)) & 1;
+}
+
 function AttendanceCalendar() {
-  const [attendance, setAttendance] = useState([]);
+  const [calendar, setCalendar] = useState(null);
+  const today = new Date();
+  const year = today.getFullYear();
+  const month = today.getMonth();
+  const daysInMonth = new Date(year, month + 1, 0).getDate();
 
   useEffect(() => {
-    fetch('https://gym-management-system-xvbr.onrender.com/attendance', {
+    const from = `${year}-${pad(month + 1)}-01`;
+    const to = `${year}-${pad(month + 1)}-${pad(daysInMonth)}`;
+    fetch(`https://gym-management-system-xvbr.onrender.com/api/attendance/calendar?from=${from}&to=${to}`, {
       headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
     })
       .then((res) => res.json())
@@ -13,22 +27,26 @@ function AttendanceCalendar() {
         if (data.error) {
           toast.error(data.error);
         } else {
-          setAttendance(data);
+          setCalendar({ ...data, attended: decodeBitmap(data.bitmap) });
         }
       })
       .catch(() => toast.error('Failed to fetch attendance!'));
-  }, []);
+  }, [year, month, daysInMonth]);
 
   return (
     <div className="p-6">
       <h2 className="text-2xl font-bold text-gymBlue mb-4">Attendance Calendar</h2>
+      {calendar && (
+        <p className="mb-4 text-gray-600">
+          Current streak: {calendar.current_streak} days · Longest this month: {calendar.longest_streak} days · Visits: {calendar.total}
+        </p>
+      )}
       <div className="grid grid-cols-7 gap-2">
         {['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'].map((day) => (
           <div key={day} className="text-center font-bold text-gray-600">{day}</div>
         ))}
-        {Array(30).fill().map((_, i) => {
-          const date = new Date(2025, 8, i + 1).toISOString().split('T')[0];
-          const attended = attendance.find((a) => a.date === date);
+        {Array(daysInMonth).fill().map((_, i) => {
+          const attended = calendar && calendar.attended(i);
           return (
             <div
               key={i}
@@ -46,4 +64,4 @@ function AttendanceCalendar() {
   );
 }
 
-export default AttendanceCalendar;
\ No newline at end of file
+export default AttendanceCalendar;
@@ -4,6 +4,7 @@ import { useNavigate } from 'react-router-dom';
 
 function AdminDashboard() {
   const [dashboardData, setDashboardData] = useState(null);
+  const [revenue, setRevenue] = useState(null);
   const [loading, setLoading] = useState(true);
   const [newSubscription, setNewSubscription] = useState({ plan_name: '', price: '', duration_months: '', description: '' });
   const [newUser, setNewUser] = useState({ username: '', email: '', password: '', role: 'user' });
@@ -47,6 +48,45 @@ function AdminDashboard() {
     fetchDashboard();
   }, [fetchDashboard]);
 
+  // The dashboard embeds the first page of users and trainers; later pages come from the list endpoints
+  const loadMore = async (list) => {
+    const token = localStorage.getItem('token');
+    const cursorKey = `${list}_next_cursor`;
+    try {
+      const response = await fetch(
+        `https://gym-management-system-xvbr.onrender.com/api/${list}?cursor=${encodeURIComponent(dashboardData[cursorKey])}`,
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+      const data = await response.json();
+      if (response.ok) {
+        setDashboardData((current) => ({
+          ...current,
+          [list]: [...current[list], ...data.items],
+          [cursorKey]: data.next_cursor,
+        }));
+      } else {
+        toast.error(data.error || `Failed to load more ${list}`);
+      }
+    } catch (error) {
+      toast.error('Network error!');
+      console.error('Fetch error:', error);
+    }
+  };
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return;
+    // Monthly revenue for the last year; the dashboard is complete without it
+    fetch('https://gym-management-system-xvbr.onrender.com/api/admin/revenue', {
+      headers: { Authorization: `Bearer ${token}` },
+    })
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => data && setRevenue(data))
+      .catch((error) => console.error('Revenue fetch error:', error));
+  }, []);
+
+  const money = (amount) => amount.toFixed(2);
+
   const handleSubscriptionSubmit = async (e) => {
     e.preventDefault();
     const durationMonths = parseInt(newSubscription.duration_months, 10);
@@ -434,6 +474,11 @@ function AdminDashboard() {
             </div>
           ))}
         </div>
+        {dashboardData.users_next_cursor && (
+          <button onClick={() => loadMore('users')} className="mt-2 text-blue-500 hover:underline">
+            Load more users
+          </button>
+        )}
         {editingUser && (
           <div className="mt-4 p-4 border rounded">
             <h3 className="text-lg font-semibold mb-2">Edit User</h3>
@@ -493,6 +538,11 @@ function AdminDashboard() {
             </div>
           ))}
         </div>
+        {dashboardData.trainers_next_cursor && (
+          <button onClick={() => loadMore('trainers')} className="mt-2 text-blue-500 hover:underline">
+            Load more trainers
+          </button>
+        )}
         {editingTrainer && (
           <div className="mt-4 p-4 border rounded">
             <h3 className="text-lg font-semibold mb-2">Edit Trainer</h3>
@@ -535,6 +585,34 @@ function AdminDashboard() {
         <p>User Count: {dashboardData.stats.user_count}</p>
         <p>Trainer Count: {dashboardData.stats.trainer_count}</p>
         <p>Subscription Count: {dashboardData.stats.subscription_count}</p>
+        {revenue && (
+          <>
+            <h2 className="text-xl font-semibold mt-6 mb-4">
+              Revenue ({revenue.from} to {revenue.to})
+            </h2>
+            <div className="p-2 border rounded mb-4">
+              {money(revenue.totals.revenue)} from {revenue.totals.subscriptions} subscriptions; MRR{' '}
+              {money(revenue.totals.mrr)}, {revenue.totals.active_members} active members,{' '}
+              {revenue.totals.new_members} new, {revenue.totals.churned} churned
+            </div>
+            <div className="space-y-2">
+              {revenue.series.map((month) => (
+                <div key={month.period} className="p-2 border rounded">
+                  {month.period.slice(0, 7)}: {money(month.revenue)} revenue, MRR {money(month.mrr)},{' '}
+                  {month.active_members} active, {month.new_members} new, {month.churned} churned
+                </div>
+              ))}
+            </div>
+            <div className="p-2 border rounded mt-4">
+              {revenue.plans.map((plan) => (
+                <p key={plan.plan_id}>
+                  {plan.name}: {money(plan.revenue)} ({plan.revenue_share === null ? '-' : `${Math.round(plan.revenue_share * 100)}%`}),{' '}
+                  {plan.active_subscriptions} active
+                </p>
+              ))}
+            </div>
+          </>
+        )}
       </div>
       <Toaster position="top-right" />
     </div>
@@ -10,13 +10,14 @@ function ClassRSVP() {
   useEffect(() => {
     const fetchClasses = async () => {
       try {
-        const response = await fetch('https://gym-management-system-xvbr.onrender.com/api/classes', {
+        // The coming week, one-off classes and occurrences of recurring series alike
+        const response = await fetch('https://gym-management-system-xvbr.onrender.com/api/timetable', {
           headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
         });
         const data = await response.json();
         if (response.ok) {
           // Initialize RSVP status for each class based on backend data
-          setClasses(data.map(cls => ({ ...cls, rsvped: false })));
+          setClasses(data.items.map(cls => ({ ...cls, rsvped: false })));
         } else {
           toast.error(data.error || 'Failed to fetch classes');
           if (response.status === 401) {
@@ -36,7 +37,10 @@ function ClassRSVP() {
     fetchClasses();
   }, [navigate]);
 
-  const handleRSVP = async (classId) => {
+  // Occurrences of a series have no class id until their first RSVP
+  const classKey = (cls) => cls.id || `${cls.series_id}-${cls.date_time}`;
+
+  const handleRSVP = async (target) => {
     try {
       const response = await fetch('http://localhost:5000/api/rsvp', {
         method: 'POST',
@@ -44,13 +48,13 @@ function ClassRSVP() {
           'Content-Type': 'application/json',
           Authorization: `Bearer ${localStorage.getItem('token')}`,
         },
-        body: JSON.stringify({ class_id: classId }),
+        body: JSON.stringify(target.id ? { class_id: target.id } : { series_id: target.series_id, date_time: target.date_time }),
       });
       const data = await response.json();
       if (response.ok) {
         toast.success('RSVP successful!');
         setClasses(classes.map(cls =>
-          cls.id === classId ? { ...cls, rsvped: true, current_capacity: cls.current_capacity + 1 } : cls
+          classKey(cls) === classKey(target) ? { ...cls, id: data.class_id, rsvped: true, current_capacity: cls.current_capacity + 1 } : cls
         ));
       } else {
         toast.error(data.error || 'Failed to RSVP');
@@ -80,7 +84,7 @@ function ClassRSVP() {
           <ul className="space-y-4">
             {classes.map((cls) => (
               <li
-                key={cls.id}
+                key={classKey(cls)}
                 className="border-b pb-4 flex justify-between items-center"
               >
                 <div>
@@ -92,7 +96,7 @@ function ClassRSVP() {
                   </p>
                 </div>
                 <button
-                  onClick={() => handleRSVP(cls.id)}
+                  onClick={() => handleRSVP(cls)}
                   disabled={cls.rsvped || cls.current_capacity >= cls.max_capacity}
                   className={`px-4 py-2 rounded transition font-semibold
                     ${cls.rsvped || cls.current_capacity >= cls.max_capacity
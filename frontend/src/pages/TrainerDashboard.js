@@ -4,6 +4,7 @@ import { useNavigate } from 'react-router-dom';
 
 function TrainerDashboard() {
   const [dashboardData, setDashboardData] = useState(null);
+  const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
   const [newClass, setNewClass] = useState({ name: '', date_time: '', max_capacity: 10 });
   const navigate = useNavigate();
@@ -42,6 +43,20 @@ function TrainerDashboard() {
     fetchDashboard();
   }, [fetchDashboard]);
 
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return;
+    // Rollups refreshed daily; the dashboard is complete without them
+    fetch('https://gym-management-system-xvbr.onrender.com/api/trainer-analytics', {
+      headers: { Authorization: `Bearer ${token}` },
+    })
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => data && setAnalytics(data))
+      .catch((error) => console.error('Analytics fetch error:', error));
+  }, []);
+
+  const percent = (rate) => (rate === null ? '-' : `${Math.round(rate * 100)}%`);
+
   const handleClassSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -139,6 +154,36 @@ function TrainerDashboard() {
             <p>No classes created.</p>
           )}
         </div>
+        {analytics && analytics.totals.classes > 0 && (
+          <>
+            <h2 className="text-xl font-semibold mt-6 mb-4">
+              Class Analytics (since {analytics.since}, updated to {analytics.refreshed_through})
+            </h2>
+            <div className="p-2 border rounded mb-4">
+              {analytics.totals.classes} classes: {percent(analytics.totals.fill_rate)} full,{' '}
+              {percent(analytics.totals.attendance_rate)} of bookings attended,{' '}
+              {percent(analytics.totals.no_show_rate)} no-shows
+            </div>
+            <div className="space-y-2">
+              {analytics.weekly.map((week) => (
+                <div key={week.week} className="p-2 border rounded">
+                  Week of {week.week}: {week.classes} classes, {percent(week.fill_rate)} full,{' '}
+                  {week.no_shows} no-shows ({percent(week.no_show_rate)})
+                </div>
+              ))}
+            </div>
+            {analytics.series.map((series) => (
+              <div key={series.series_id} className="p-2 border rounded mt-4">
+                <p className="font-semibold">
+                  {series.name}: {percent(series.fill_rate)} full, {percent(series.attendance_rate)} attended
+                </p>
+                {series.regulars.length > 0 && (
+                  <p>Regulars: {series.regulars.map((r) => `${r.username} (${r.attended})`).join(', ')}</p>
+                )}
+              </div>
+            ))}
+          </>
+        )}
       </div>
       <Toaster position="top-right" />
     </div>
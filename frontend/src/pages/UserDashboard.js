@@ -115,7 +115,7 @@ function UserDashboard() {
   };
 
   const hasActiveSubscription = () => {
-    return dashboardData?.user_subscriptions.some(sub => new Date(sub.end_date) > new Date());
+    return Boolean(dashboardData?.membership?.active);
   };
 
   const getAvailableSubscriptions = () => {